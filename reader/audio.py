@@ -0,0 +1,125 @@
+"""
+Audio decoding and silence-based splitting for transcription
+"""
+
+import os
+import subprocess
+import wave
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Whisper works on 16 kHz mono audio
+SAMPLE_RATE = 16000
+# target length of a transcription chunk and how far from it a cut may move to find silence
+ASR_CHUNK_SECONDS = float(os.environ.get("DEEPREADER_ASR_CHUNK_SECONDS", 60))
+ASR_SPLIT_SEARCH_SECONDS = 10.0
+# energy is measured in frames of this length, a cut lands in the quietest stretch of this length
+FRAME_SECONDS = 0.02
+MIN_SILENCE_SECONDS = 0.3
+# opus bitrate of the archive copy of fetched audio, plenty for speech
+ARCHIVE_BITRATE = os.environ.get("DEEPREADER_AUDIO_ARCHIVE_BITRATE", "32k")
+
+
+def decode_command(source: str, wav_path: str, archive_path: Optional[str] = None,
+                   headers: Optional[Dict[str, str]] = None) -> List[str]:
+    """
+    One ffmpeg run that turns the audio of source into a 16 kHz mono PCM wav
+
+    With archive_path the same run also encodes a compact opus copy, so the
+    source is decoded once however many outputs are written.
+    """
+    # "pipe:0" is read from stdin, which -nostdin would close
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y"] + ([] if source == "pipe:0" else ["-nostdin"])
+    if headers:
+        cmd += ["-headers", "".join(f"{key}: {value}\r\n" for key, value in headers.items())]
+    cmd += ["-i", source,
+            "-map", "0:a:0", "-ac", "1", "-ar", str(SAMPLE_RATE), "-c:a", "pcm_s16le", wav_path]
+    if archive_path:
+        cmd += ["-map", "0:a:0", "-ac", "1", "-c:a", "libopus", "-b:a", ARCHIVE_BITRATE,
+                "-application", "voip", archive_path]
+    return cmd
+
+
+def decode_stream(chunks: Iterable[bytes], wav_path: str, archive_path: Optional[str] = None):
+    """Pipe the bytes of a media stream through decode_command as they arrive"""
+    cmd = decode_command("pipe:0", wav_path, archive_path)
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        for chunk in chunks:
+            process.stdin.write(chunk)
+    except BrokenPipeError:
+        # ffmpeg gave up, its exit code and message tell why
+        pass
+    finally:
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        stderr = process.stderr.read()
+        returncode = process.wait()
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr)
+
+
+def read_wav(path: str, sample_rate: int = SAMPLE_RATE) -> Optional[np.ndarray]:
+    """Samples of a 16-bit mono wav at sample_rate, None for any other file"""
+    try:
+        with wave.open(path, "rb") as f:
+            if (f.getnchannels(), f.getsampwidth(), f.getframerate()) != (1, 2, sample_rate):
+                return None
+            data = f.readframes(f.getnframes())
+    except (wave.Error, EOFError):
+        return None
+    return np.frombuffer(data, np.int16).astype(np.float32) / 32768.0
+
+
+def load_audio(path: str, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Decode any audio or video file to mono float32 samples in [-1, 1] with ffmpeg"""
+    if path.endswith(".wav"):
+        # the output of decode_command needs no second decode
+        samples = read_wav(path, sample_rate)
+        if samples is not None:
+            return samples
+    cmd = ["ffmpeg", "-nostdin", "-threads", "0", "-i", path,
+           "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(sample_rate), "-"]
+    result = subprocess.run(cmd, capture_output=True, check=True)
+    return np.frombuffer(result.stdout, np.int16).astype(np.float32) / 32768.0
+
+
+def frame_energy(samples: np.ndarray, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """RMS energy of consecutive FRAME_SECONDS frames"""
+    hop = max(int(sample_rate * FRAME_SECONDS), 1)
+    count = len(samples) // hop
+    frames = samples[:count * hop].reshape(count, hop)
+    return np.sqrt(np.mean(frames ** 2, axis=1))
+
+
+def split_at_silence(samples: np.ndarray, sample_rate: int = SAMPLE_RATE,
+                     chunk_seconds: float = ASR_CHUNK_SECONDS,
+                     search_seconds: float = ASR_SPLIT_SEARCH_SECONDS) -> List[Tuple[int, int]]:
+    """
+    (start, end) sample ranges of about chunk_seconds that cover samples
+
+    Every cut is placed in the quietest MIN_SILENCE_SECONDS stretch within
+    search_seconds of the target length, so words are not cut in half.
+    """
+    total = len(samples)
+    chunk = int(chunk_seconds * sample_rate)
+    if total <= chunk + int(search_seconds * sample_rate):
+        return [(0, total)]
+
+    hop = max(int(sample_rate * FRAME_SECONDS), 1)
+    window = max(int(MIN_SILENCE_SECONDS / FRAME_SECONDS), 1)
+    # mean energy of the window starting at each frame
+    energy = np.convolve(frame_energy(samples, sample_rate), np.ones(window) / window, mode="valid")
+    search = int(search_seconds * sample_rate) // hop
+
+    bounds = [0]
+    while total - bounds[-1] > chunk + search * hop:
+        target = (bounds[-1] + chunk) // hop
+        lo, hi = max(target - search, bounds[-1] // hop + 1), min(target + search, len(energy))
+        quietest = lo + int(np.argmin(energy[lo:hi]))
+        bounds.append((quietest + window // 2) * hop)
+    bounds.append(total)
+    return list(zip(bounds[:-1], bounds[1:]))
@@ -12,6 +12,11 @@ from datetime import datetime
 import yt_dlp
 from typing import List, Dict, Optional
 
+from http_cache import get_http_cache
+import progress
+import subtitles
+from video_crawler import VideoCrawler
+
 class BilibiliAutoCrawler:
     """Bilibili 自动爬虫类"""
     
@@ -76,12 +81,15 @@ class BilibiliAutoCrawler:
             'page_size': 20
         }
         
+        cache = get_http_cache()
         try:
-            response = self.session.get(search_url, params=params, timeout=10)
+            response = cache.get(search_url, session=self.session, params=params, timeout=10)
             response.raise_for_status()
             
             data = response.json()
             if data.get('code') != 0:
+                # 错误结果（如风控）不缓存
+                cache.invalidate(search_url, params)
                 print(f"API返回错误: {data.get('message', 'Unknown error')}")
                 return []
             
@@ -183,7 +191,8 @@ class BilibiliAutoCrawler:
         
         return unique_videos
     
-    def download_videos(self, videos: List[Dict], book_name: str, max_videos: int = 3) -> List[str]:
+    def download_videos(self, videos: List[Dict], book_name: str, max_videos: int = 3,
+                        subtitles_only: Optional[bool] = None) -> List[str]:
         """
         下载视频和字幕
         
@@ -191,6 +200,7 @@ class BilibiliAutoCrawler:
             videos: 视频信息列表
             book_name: 书籍名称
             max_videos: 最大下载数量
+            subtitles_only: 只读取字幕，没有字幕的视频只下载音频并转录，默认见 subtitles.SUBTITLES_FIRST
             
         Returns:
             下载成功的视频文件路径列表
@@ -205,6 +215,20 @@ class BilibiliAutoCrawler:
         
         downloaded_files = []
         
+        if subtitles.SUBTITLES_FIRST if subtitles_only is None else subtitles_only:
+            # 不下载视频文件：有字幕直接用字幕，没有字幕才下载音频转录
+            video_crawler = VideoCrawler(book_name, subtitles_first=True)
+            print(f"开始读取前 {min(max_videos, len(videos))} 个视频的字幕...")
+            for i, video in enumerate(videos[:max_videos]):
+                print(f"正在处理第 {i+1} 个视频: {video['title']}")
+                video_crawler.process_video_url(video['url'])
+                info_file = f"{download_dir}/video_{i+1}_info.json"
+                with open(info_file, 'w', encoding='utf-8') as f:
+                    json.dump(video, f, ensure_ascii=False, indent=2)
+                downloaded_files.append(info_file)
+            print(subtitles.stats.summary())
+            return downloaded_files
+        
         # 配置 yt-dlp
         ydl_opts = {
             'outtmpl': f'{download_dir}/%(title)s.%(ext)s',
@@ -213,6 +237,7 @@ class BilibiliAutoCrawler:
             'writeautomaticsub': True,  # 下载自动生成的字幕
             'subtitleslangs': ['zh-CN', 'zh-Hans', 'zh'],  # 中文字幕
             'ignoreerrors': True,  # 忽略错误继续下载
+            'progress_hooks': [progress.download_hook(progress.task_name(book_name, "video download"))],
         }
         
         print(f"开始下载前 {min(max_videos, len(videos))} 个视频...")
@@ -287,50 +312,7 @@ class BilibiliAutoCrawler:
         """从字幕文件提取纯文本"""
         with open(subtitle_file, 'r', encoding='utf-8') as f:
             content = f.read()
-        
-        # 处理不同的字幕格式
-        if subtitle_file.endswith('.vtt'):
-            return self._extract_from_vtt(content)
-        elif subtitle_file.endswith('.srt'):
-            return self._extract_from_srt(content)
-        else:
-            # 简单的文本提取
-            lines = content.split('\n')
-            text_lines = []
-            for line in lines:
-                line = line.strip()
-                if line and not line.startswith(('WEBVTT', 'NOTE', '{')):
-                    # 移除时间戳
-                    if '-->' not in line and not line.isdigit():
-                        text_lines.append(line)
-            return '\n'.join(text_lines)
-    
-    def _extract_from_vtt(self, content: str) -> str:
-        """从VTT格式提取文本"""
-        lines = content.split('\n')
-        text_lines = []
-        
-        for line in lines:
-            line = line.strip()
-            if line and not line.startswith('WEBVTT') and '-->' not in line and not line.startswith('NOTE'):
-                # 移除HTML标签
-                line = re.sub(r'<[^>]+>', '', line)
-                if line:
-                    text_lines.append(line)
-        
-        return '\n'.join(text_lines)
-    
-    def _extract_from_srt(self, content: str) -> str:
-        """从SRT格式提取文本"""
-        lines = content.split('\n')
-        text_lines = []
-        
-        for line in lines:
-            line = line.strip()
-            if line and not line.isdigit() and '-->' not in line:
-                text_lines.append(line)
-        
-        return '\n'.join(text_lines)
+        return subtitles.subtitle_text(content, subtitle_file.rsplit('.', 1)[-1])
     
     def create_video_links_file(self, videos: List[Dict], book_name: str) -> str:
         """
@@ -404,10 +386,14 @@ def auto_process_book_videos(book_name: str, download_videos: bool = True, max_v
             result['downloaded_count'] = len(downloaded_files)
             
             # 4. 提取字幕
-            print("📄 提取字幕文本...")
-            subtitle_text = crawler.extract_subtitles_text(book_name)
-            result['subtitle_text'] = subtitle_text
-            result['has_subtitles'] = bool(subtitle_text)
+            if subtitles.SUBTITLES_FIRST:
+                # 字幕已经保存为每个视频的 .txt 文稿，再合并一次会让同一内容被清理和解析两次
+                result['has_subtitles'] = subtitles.stats.captioned_videos > 0
+            else:
+                print("📄 提取字幕文本...")
+                subtitle_text = crawler.extract_subtitles_text(book_name)
+                result['subtitle_text'] = subtitle_text
+                result['has_subtitles'] = bool(subtitle_text)
         
         print(f"✅ 视频处理完成！找到 {len(videos)} 个视频")
         return result
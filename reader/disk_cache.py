@@ -0,0 +1,123 @@
+"""
+Size-bounded LRU key/value store on disk
+Shared by the HTTP response cache and the other caches of the reader stages
+"""
+
+import json
+import os
+import threading
+from typing import Optional, Tuple
+
+CACHE_DIR = os.environ.get("DEEPREADER_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "deepreader"))
+
+
+class DiskCache:
+    """
+    Entries live in directory/<key[:2]>/<key>.bin with a <key>.json metadata sidecar
+
+    The mtime of the body file is the last access time, so a cache hit only
+    costs one utime call. Once the bodies exceed max_bytes the least recently
+    used entries are removed until the cache is back under 90% of the limit.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.total_bytes = sum(size for _, _, size in self._entries())
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        base = os.path.join(self.directory, key[:2], key)
+        return base + ".bin", base + ".json"
+
+    def _entries(self):
+        """(key, last access, size) of every entry"""
+        for shard in os.listdir(self.directory):
+            shard_dir = os.path.join(self.directory, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for file_name in os.listdir(shard_dir):
+                if not file_name.endswith(".bin"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(shard_dir, file_name))
+                except FileNotFoundError:
+                    continue
+                yield file_name[:-4], stat.st_mtime, stat.st_size
+
+    def get(self, key: str) -> Optional[Tuple[bytes, dict]]:
+        """Return (body, metadata) or None, and mark the entry as recently used"""
+        body_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                body = f.read()
+            os.utime(body_path)
+        except (OSError, ValueError):
+            return None
+        return body, meta
+
+    def get_meta(self, key: str) -> Optional[dict]:
+        _, meta_path = self._paths(key)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, body: bytes, meta: dict):
+        body_path, meta_path = self._paths(key)
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+        try:
+            old_size = os.path.getsize(body_path)
+        except OSError:
+            old_size = 0
+        # write to temporary files first so a concurrent reader never sees half an entry
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(body_path + suffix, "wb") as f:
+            f.write(body)
+        with open(meta_path + suffix, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(meta_path + suffix, meta_path)
+        os.replace(body_path + suffix, body_path)
+        with self.lock:
+            self.total_bytes += len(body) - old_size
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def put_meta(self, key: str, meta: dict):
+        """Replace the metadata of an existing entry, e.g. after a revalidation"""
+        _, meta_path = self._paths(key)
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(meta_path + suffix, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(meta_path + suffix, meta_path)
+
+    def delete(self, key: str):
+        body_path, meta_path = self._paths(key)
+        for path in (body_path, meta_path):
+            try:
+                size = os.path.getsize(path) if path == body_path else 0
+                os.remove(path)
+            except OSError:
+                continue
+            with self.lock:
+                self.total_bytes -= size
+
+    def evict(self):
+        """Drop least recently used entries until the cache is under 90% of max_bytes"""
+        with self.lock:
+            entries = sorted(self._entries(), key=lambda entry: entry[1])
+            self.total_bytes = sum(size for _, _, size in entries)
+            target = self.max_bytes * 0.9
+        for key, _, _ in entries:
+            if self.total_bytes <= target:
+                break
+            self.delete(key)
+
+    def clear(self):
+        for key, _, _ in list(self._entries()):
+            self.delete(key)
+
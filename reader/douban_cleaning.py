@@ -1,6 +1,8 @@
 import nerif
 import os
 
+from manifest import Manifest, file_hash
+
 clean_model_name = "ollama/qwen2.5:32b"
 
 def clean_douban(file_name):
@@ -13,7 +15,7 @@ def clean_douban(file_name):
     if not "下载豆瓣客户端" in text:
         with open(new_file_name, "w") as f:
             f.write(text)
-        return
+        return new_file_name
         
         
     if "有关键情节透露" in text:
@@ -27,12 +29,20 @@ def clean_douban(file_name):
 
     with open(new_file_name, "w") as f:
         f.write(text)
+    return new_file_name
 
 def clean_all_douban_files(dir_name):
+    # files whose content has not changed since the last run are skipped
+    manifest = Manifest.for_book(os.path.dirname(os.path.normpath(dir_name)))
     for file_name in os.listdir(dir_name):
-        if "cleaned" in file_name:
+        if "cleaned" in file_name or file_name.endswith(".tmp"):
+            continue
+        file_path = os.path.join(dir_name, file_name)
+        inputs = {"file": file_hash(file_path)}
+        if manifest.is_done("douban_clean", file_name, inputs):
             continue
-        clean_douban(os.path.join(dir_name, file_name))
+        new_file_name = clean_douban(file_path)
+        manifest.record("douban_clean", file_name, inputs, [new_file_name])
 
 if __name__ == "__main__":
     clean_all_douban_files("example_book/website")
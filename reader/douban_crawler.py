@@ -1,12 +1,16 @@
-import requests
+import asyncio
+import aiohttp
 import os
 from bs4 import BeautifulSoup
-import time
 import json
-import random
 from urllib.parse import urlparse, parse_qs
 import re
 
+import progress
+import throttle
+from manifest import Manifest, write_atomic
+from http_cache import get_http_cache, is_block_page
+
 JINA_READER_URL = os.environ.get('JINA_READER_URL', '')
 
 def extract_subject_id(url):
@@ -30,6 +34,11 @@ def extract_subject_id(url):
     
     return None
 
+def extract_review_id(review_url):
+    # https://book.douban.com/review/5414380/ -> 5414380, also behind the Jina reader prefix
+    review_id = review_url.split('/')[-2]
+    return review_id.split('?')[0]
+
 class DoubanBookSpider:
     def __init__(self):
         # set headers
@@ -38,11 +47,22 @@ class DoubanBookSpider:
         }
         # douban search url
         self.search_url = 'https://www.douban.com/search?q={}&cat=1001'
+
+    def validate_book_name(self, book_name):
+        """check a book name before crawling, return the stripped name"""
+        if not book_name or not book_name.strip():
+            raise ValueError("book name must not be empty")
+        return book_name.strip()
+
+    def _get(self, url, revalidate=False):
+        """GET url through the response cache, network requests wait for the host's crawl budget"""
+        return get_http_cache().get(url, headers=self.headers, revalidate=revalidate,
+                                    before_request=throttle.bucket_for(url).acquire)
         
     def search_book(self, book_name):
         """search book, get book detail page url"""
         try:
-            response = requests.get(self.search_url.format(book_name), headers=self.headers)
+            response = self._get(self.search_url.format(book_name))
             soup = BeautifulSoup(response.text, 'html.parser')
 
             # find all h3 from soup, get the url from the href
@@ -67,7 +87,7 @@ class DoubanBookSpider:
     def get_book_info(self, book_url):
         """get book basic info"""
         try:
-            response = requests.get(book_url, headers=self.headers)
+            response = self._get(book_url)
             soup = BeautifulSoup(response.text, 'html.parser')
             
             # get title
@@ -91,75 +111,158 @@ class DoubanBookSpider:
             print(f"get book info error: {e}")
             return None
         
-    def get_review_urls(self, book_url, range=5):
-        """get long reviews"""
+    def get_review_urls(self, book_url, range=5, watermark=None):
+        """
+        get long reviews
+
+        With a watermark (the highest review id seen by an earlier crawl) the
+        list is read newest first, bypassing the response cache, and stops at
+        the first review at or below it. Douban review ids only grow, so the
+        reviews above the watermark are exactly the ones written since.
+        """
         offset = 0
         reviews = []
         while offset < range:
             try:
                 reviews_url = book_url + 'reviews/'
-                if offset > 0:
+                if watermark is not None:
+                    reviews_url += f'?sort=time&start={offset * 20}'
+                elif offset > 0:
                     reviews_url += f'?sort=hotest&start={offset * 20}'
                 
                 reader_url = JINA_READER_URL + reviews_url
-                response = requests.get(reader_url, headers=self.headers)
+                response = self._get(reader_url, revalidate=watermark is not None)
                 text = response.text
                 # find all https://book.douban.com/review/5414380/ pattern
                 pattern = r'https://book\.douban\.com/review/\d+/'
-                matches = re.findall(pattern, text)
-                reviews.extend(matches)
+                matches = list(dict.fromkeys(re.findall(pattern, text)))
+                if watermark is not None:
+                    new = [url for url in matches if int(extract_review_id(url)) > watermark]
+                    reviews.extend(new)
+                    if len(new) < len(matches) or not matches:
+                        break
+                else:
+                    reviews.extend(matches)
             except Exception as e:
                 print(f"get long reviews error: {e}")
                 return reviews
             offset += 1
         return reviews
 
-    def get_reviews(self, review_urls):
+    def get_reviews(self, review_urls, on_review=None):
         """get long reviews content"""
-        reviews = []
-        for review_url in review_urls:
+        return asyncio.run(self.get_reviews_async(review_urls, on_review))
+
+    async def get_reviews_async(self, review_urls, on_review=None):
+        """
+        fetch review pages concurrently
+
+        Every request waits for its host's token bucket (book.douban.com and the
+        Jina reader are paced separately) and at most throttle.crawl_concurrency_limit
+        requests are in flight. on_review(review_url, text) is called as soon as
+        a page arrives, the result keeps the order of review_urls.
+        """
+        semaphore = asyncio.Semaphore(throttle.crawl_concurrency_limit)
+        timeout = aiohttp.ClientTimeout(total=60)
+        cache = get_http_cache()
+
+        async def fetch(session, review_url):
             review_url = JINA_READER_URL + review_url
-            response = requests.get(review_url, headers=self.headers)
-            text = response.text
-            reviews.append([review_url, text])
-            # sleep 10-15 random seconds
-            time.sleep(random.uniform(10, 15))
-            
-        return reviews
+            cached = cache.lookup(review_url)
+            if cached:
+                text = cached.text
+            else:
+                async with semaphore:
+                    await throttle.bucket_for(review_url).acquire_async()
+                    try:
+                        headers = cache.revalidation_headers(review_url)
+                        async with session.get(review_url, headers=headers) as response:
+                            body = await response.read()
+                            reply = cache.update(review_url, response.status, body, response.headers,
+                                                 response.charset or "utf-8", final_url=str(response.url))
+                        # an error or captcha page saved as a review would count as crawled and never be fetched again
+                        if reply.status_code != 200 or is_block_page(review_url, str(response.url), body):
+                            print(f"get review {review_url} error: status {response.status} from {response.url}")
+                            return None
+                        text = reply.text
+                    except Exception as e:
+                        print(f"get review {review_url} error: {e}")
+                        return None
+            if on_review:
+                on_review(review_url, text)
+            return [review_url, text]
+
+        async with aiohttp.ClientSession(headers=self.headers, timeout=timeout) as session:
+            reviews = await asyncio.gather(*(fetch(session, url) for url in review_urls))
+        return [review for review in reviews if review]
     
     def crawl_book(self, book_name, limit=2):
-        """main crawler function"""
+        """
+        main crawler function, returns the ids of the reviews saved by this run
+
+        The first crawl of a book fetches the hottest reviews. Later crawls only
+        look for reviews newer than the ones already saved and fetch just those,
+        cleaning and parsing then only pick up the new files.
+        """
+        save_dir = f"{book_name}/website"
+        os.makedirs(save_dir, exist_ok=True)
+        manifest = Manifest.for_book(book_name)
+
+        def review_file_of(review_url):
+            review_id = extract_review_id(review_url)
+            return review_id, f"{save_dir}/douban_{review_id}.txt"
+
+        # reviews already on disk are not fetched again
+        known_ids = set()
+        for review_id in manifest.keys("douban_crawl"):
+            if os.path.exists(f"{save_dir}/douban_{review_id}.txt"):
+                known_ids.add(review_id)
+
         # search book
-        if not os.path.exists(f"{book_name}/website"):
-            os.makedirs(f"{book_name}/website")
-        else:
-            return
-            
         book_urls = self.search_book(book_name)
         if not book_urls:
             print(f"Book {book_name} not found")
             return
         
-        # get book reviews urls
+        # get book reviews urls, only the ones above the watermark once a full
+        # crawl of the edition has completed, an interrupted first crawl is resumed instead
         reviews_urls = []
+        watermarks = {}
         for book_url in book_urls[:limit]:
-            reviews_urls.extend(self.get_review_urls(book_url))
-        
-        # get reviews
-        reviews = self.get_reviews(reviews_urls)
-        
-        # Create directory structure: {book}/website/
-        if not os.path.exists(f"{book_name}/website"):
-            os.makedirs(f"{book_name}/website")
-
-        for review in reviews:
-            review_url = review[0]
-            review_text = review[1]
-            review_id = review_url.split('/')[-2]
-            review_id = review_id.split('?')[0]
+            entry = manifest.get("douban_watermark", book_url)
+            watermark = None
+            if entry is not None:
+                # records written before the highest id was stored fall back to the reviews on disk
+                watermark = entry.get("max_review_id", max((int(i) for i in known_ids), default=0))
+            urls = self.get_review_urls(book_url, watermark=watermark)
+            watermarks[book_url] = max([int(extract_review_id(url)) for url in urls] + [watermark or 0])
+            reviews_urls.extend(urls)
+        reviews_urls = list(dict.fromkeys(reviews_urls))
+
+        def save_review(review_url, review_text):
             # Save review to {book_name}/website/douban_{review_id}.txt
-            with open(f"{book_name}/website/douban_{review_id}.txt", "w") as f:
-                f.write(review_text)
+            review_id, review_file = review_file_of(review_url)
+            write_atomic(review_file, review_text)
+            manifest.record("douban_crawl", review_id, {"url": review_url}, [review_file])
+            progress.bus.advance(task, unit="reviews")
+
+        pending_urls = [url for url in reviews_urls if extract_review_id(url) not in known_ids]
+        task = progress.task_name(book_name, "douban")
+        progress.bus.start(task, len(pending_urls), unit="reviews")
+        if known_ids:
+            print(f"{book_name}: {len(known_ids)} reviews known, {len(pending_urls)} new")
+
+        # get reviews, each one is saved as soon as it arrives so a crash
+        # only loses the reviews in flight
+        reviews = self.get_reviews(pending_urls, on_review=save_review)
+        new_ids = [extract_review_id(review_url) for review_url, _ in reviews]
+        progress.bus.finish(task)
+
+        if len(reviews) == len(pending_urls):
+            for book_url in book_urls[:limit]:
+                manifest.record("douban_watermark", book_url, {}, known_reviews=len(known_ids) + len(new_ids),
+                                max_review_id=watermarks[book_url])
+        return new_ids
 
 if __name__ == "__main__":
     douban_spider = DoubanBookSpider()
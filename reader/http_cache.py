@@ -0,0 +1,212 @@
+"""
+Persistent HTTP response cache for the crawlers
+Responses are keyed by normalized URL, expire after a per-endpoint TTL and are revalidated with ETag/Last-Modified
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Callable, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+
+from disk_cache import CACHE_DIR, DiskCache
+
+HTTP_CACHE_MAX_MB = int(os.environ.get("DEEPREADER_HTTP_CACHE_MB", 512))
+HTTP_CACHE_ENABLED = os.environ.get("DEEPREADER_HTTP_CACHE", "1") != "0"
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# (pattern searched in the normalized url, ttl in seconds), first match wins.
+# Review lists change as new reviews come in, review pages almost never change.
+DEFAULT_TTLS = [
+    (r"douban\.com/search", DAY),
+    (r"book\.douban\.com/subject/\d+/reviews", 6 * HOUR),
+    (r"book\.douban\.com/subject/\d+/?$", 7 * DAY),
+    (r"book\.douban\.com/review/\d+", 30 * DAY),
+    (r"api\.bilibili\.com/x/web-interface/search", DAY),
+]
+DEFAULT_TTL = DAY
+
+# response headers stored with an entry
+KEPT_HEADERS = {"etag": "ETag", "last-modified": "Last-Modified", "content-type": "Content-Type"}
+
+# anti-bot pages served with status 200, never cached: douban redirects blocked
+# crawlers to sec.douban.com or answers with its "禁止访问" page
+BLOCK_PAGE_PATTERNS = [
+    re.compile("<title>禁止访问</title>".encode("utf-8")),
+    re.compile("检测到有异常请求".encode("utf-8")),
+]
+
+
+def normalize_url(url: str, params: Optional[dict] = None) -> str:
+    """Lower-case scheme and host, drop the fragment and default port, sort query parameters"""
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme, netloc.rsplit(":", 1)[-1]) in (("http", "80"), ("https", "443")):
+        netloc = netloc.rsplit(":", 1)[0]
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if params:
+        query += [(str(key), str(value)) for key, value in params.items()]
+    return urlunsplit((scheme, netloc, parts.path or "/", urlencode(sorted(query)), ""))
+
+
+def is_block_page(url: str, final_url: Optional[str], content: bytes) -> bool:
+    """True for a response that is an anti-bot page rather than the requested resource"""
+    if final_url and urlsplit(final_url).hostname != urlsplit(url).hostname:
+        return True
+    return any(pattern.search(content) for pattern in BLOCK_PAGE_PATTERNS)
+
+
+class CachedResponse:
+    """The part of requests.Response the crawlers use"""
+
+    def __init__(self, url: str, status_code: int, content: bytes, headers: dict,
+                 encoding: Optional[str] = None, from_cache: bool = False):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        self.encoding = encoding
+        self.from_cache = from_cache
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error for url: {self.url}")
+
+
+class HttpCache:
+    """
+    On-disk response cache
+
+    Fresh entries are served without touching the network. Stale entries that
+    carry an ETag or Last-Modified header are revalidated with a conditional
+    request, a 304 answer renews them without downloading the body again.
+    """
+
+    def __init__(self, directory: str = None, max_bytes: int = None, ttls: list = None,
+                 default_ttl: int = DEFAULT_TTL, enabled: bool = HTTP_CACHE_ENABLED):
+        self.store = DiskCache(directory or os.path.join(CACHE_DIR, "http"),
+                               max_bytes or HTTP_CACHE_MAX_MB * 1024 * 1024)
+        self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in (ttls or DEFAULT_TTLS)]
+        self.default_ttl = default_ttl
+        self.enabled = enabled
+
+    def ttl_for(self, url: str) -> int:
+        for pattern, ttl in self.ttls:
+            if pattern.search(url):
+                return ttl
+        return self.default_ttl
+
+    def _key(self, url: str, params: Optional[dict] = None) -> str:
+        return hashlib.sha256(normalize_url(url, params).encode("utf-8")).hexdigest()
+
+    def _response(self, url: str, body: bytes, meta: dict) -> CachedResponse:
+        return CachedResponse(url, meta["status"], body, meta["headers"], meta.get("encoding"), from_cache=True)
+
+    def lookup(self, url: str, params: Optional[dict] = None) -> Optional[CachedResponse]:
+        """The cached response if it is still fresh"""
+        if not self.enabled:
+            return None
+        entry = self.store.get(self._key(url, params))
+        if not entry:
+            return None
+        body, meta = entry
+        if time.time() - meta["fetched_at"] > self.ttl_for(normalize_url(url, params)):
+            return None
+        return self._response(url, body, meta)
+
+    def revalidation_headers(self, url: str, params: Optional[dict] = None) -> dict:
+        """Conditional request headers for a stale entry"""
+        if not self.enabled:
+            return {}
+        meta = self.store.get_meta(self._key(url, params))
+        if not meta:
+            return {}
+        headers = {}
+        if meta["headers"].get("ETag"):
+            headers["If-None-Match"] = meta["headers"]["ETag"]
+        if meta["headers"].get("Last-Modified"):
+            headers["If-Modified-Since"] = meta["headers"]["Last-Modified"]
+        return headers
+
+    def update(self, url: str, status: int, content: bytes, headers: dict, encoding: Optional[str] = None,
+               params: Optional[dict] = None, final_url: Optional[str] = None) -> CachedResponse:
+        """
+        Store a network response, a 304 renews the cached entry and returns it
+
+        final_url is where redirects ended, a response from another host or an
+        anti-bot page is returned but not stored.
+        """
+        key = self._key(url, params)
+        if status == 304 and self.enabled:
+            entry = self.store.get(key)
+            if entry:
+                body, meta = entry
+                meta["fetched_at"] = time.time()
+                self.store.put_meta(key, meta)
+                return self._response(url, body, meta)
+        headers = {KEPT_HEADERS[name.lower()]: value for name, value in headers.items()
+                   if name.lower() in KEPT_HEADERS}
+        if status == 200 and self.enabled and not is_block_page(url, final_url, content):
+            self.store.put(key, content, {
+                "url": normalize_url(url, params),
+                "status": status,
+                "headers": headers,
+                "encoding": encoding,
+                "fetched_at": time.time(),
+            })
+        return CachedResponse(url, status, content, headers, encoding)
+
+    def invalidate(self, url: str, params: Optional[dict] = None):
+        """Forget a response, e.g. an error page served with status 200"""
+        self.store.delete(self._key(url, params))
+
+    def get(self, url: str, session=None, headers: Optional[dict] = None, params: Optional[dict] = None,
+            timeout: Optional[float] = None, before_request: Optional[Callable] = None,
+            revalidate: bool = False) -> CachedResponse:
+        """
+        Cached GET
+
+        Args:
+            session: requests.Session to use, defaults to the requests module
+            before_request: called right before a network request, e.g. to wait for a rate limiter
+            revalidate: ask the server even if the cached entry is still fresh
+        """
+        cached = None if revalidate else self.lookup(url, params)
+        if cached:
+            return cached
+        if before_request:
+            before_request()
+        request_headers = dict(headers or {})
+        request_headers.update(self.revalidation_headers(url, params))
+        response = (session or requests).get(url, headers=request_headers, params=params, timeout=timeout)
+        encoding = response.encoding if "charset" in response.headers.get("Content-Type", "") else None
+        return self.update(url, response.status_code, response.content, dict(response.headers),
+                           encoding or response.apparent_encoding, params, final_url=response.url)
+
+
+_http_cache = None
+_http_cache_lock = threading.Lock()
+
+
+def get_http_cache() -> HttpCache:
+    """Process-wide cache shared by every crawler"""
+    global _http_cache
+    with _http_cache_lock:
+        if _http_cache is None:
+            _http_cache = HttpCache()
+        return _http_cache
@@ -0,0 +1,369 @@
+"""
+Single gateway for every LLM call of DeepReader, used by the reader stages and the website
+Owns the pooled clients, retries with jittered backoff, timeouts, token accounting and the reply cache
+"""
+
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterator, List, Optional
+
+import nerif
+import openai
+import tiktoken
+
+import progress
+import throttle
+from disk_cache import CACHE_DIR, DiskCache
+
+# seconds a single LLM call may take before the caller gives up on it
+DEFAULT_TIMEOUT = float(os.environ.get("DEEPREADER_LLM_TIMEOUT", 300))
+# attempts after the first one for transient errors, and the first backoff in seconds
+LLM_RETRIES = int(os.environ.get("DEEPREADER_LLM_RETRIES", 3))
+LLM_BACKOFF = float(os.environ.get("DEEPREADER_LLM_BACKOFF", 2))
+LLM_CACHE_MAX_MB = int(os.environ.get("DEEPREADER_LLM_CACHE_MB", 1024))
+LLM_CACHE_ENABLED = os.environ.get("DEEPREADER_LLM_CACHE", "1") != "0"
+TOKEN_ENCODING = os.environ.get("DEEPREADER_TOKEN_ENCODING", "cl100k_base")
+# model of the website chat when the caller does not name one
+DEFAULT_CHAT_MODEL = os.environ.get("DEEPREADER_MODEL_NAME", "gpt-4")
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Number of tokens of text
+
+    Falls back to one token per character when the tiktoken encoding cannot
+    be loaded (it is downloaded on first use), which overestimates English
+    text and is close for Chinese.
+    """
+    global _encoding
+    if _encoding is None:
+        try:
+            _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+        except Exception as e:
+            print(f"Cannot load tiktoken encoding {TOKEN_ENCODING} ({e!r}), counting characters instead")
+            _encoding = False
+    if _encoding is False:
+        return len(text)
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+# ----------------------------------------------------------------------
+# reply cache
+# ----------------------------------------------------------------------
+class LLMCache:
+    """
+    Content-addressed store of LLM replies
+
+    The key is sha256 of the model, the prompt template version and the full
+    prompt text, so a reply is reused only for exactly the same request and
+    changing one stage's prompt never invalidates another stage's entries.
+    Any object with the same key/get/put methods can replace it, see set_llm_cache.
+    """
+
+    def __init__(self, directory: str = None, max_bytes: int = None, enabled: bool = LLM_CACHE_ENABLED):
+        self.store = DiskCache(directory or os.path.join(CACHE_DIR, "llm"),
+                               max_bytes or LLM_CACHE_MAX_MB * 1024 * 1024)
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(model_name: str, prompt: str, prompt_version: Optional[str] = None, **kwargs) -> str:
+        payload = json.dumps([model_name, prompt_version, prompt, kwargs], ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.store.get(key) if self.enabled else None
+        with self.lock:
+            if entry:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return entry[0].decode("utf-8") if entry else None
+
+    def put(self, key: str, reply: str, model_name: str, prompt_version: Optional[str] = None):
+        if self.enabled:
+            self.store.put(key, reply.encode("utf-8"), {"model": model_name, "prompt_version": prompt_version})
+
+    def stats(self) -> str:
+        with self.lock:
+            total = self.hits + self.misses
+            rate = self.hits / total if total else 0.0
+            return f"LLM cache: {self.hits} hits, {self.misses} misses ({rate:.0%} hit rate)"
+
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMCache:
+    """Process-wide cache shared by every stage"""
+    global _llm_cache
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = LLMCache()
+        return _llm_cache
+
+
+def set_llm_cache(cache):
+    """Replace the reply cache, e.g. with an in-memory or shared one"""
+    global _llm_cache
+    with _llm_cache_lock:
+        _llm_cache = cache
+
+
+# ----------------------------------------------------------------------
+# token accounting
+# ----------------------------------------------------------------------
+class Usage:
+    """Requests and tokens per model, from the API when it reports them and estimated otherwise"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.models: Dict[str, Dict[str, int]] = {}
+
+    def add(self, model_name: str, prompt_tokens: int, completion_tokens: int):
+        with self.lock:
+            counts = self.models.setdefault(model_name, {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0})
+            counts["requests"] += 1
+            counts["prompt_tokens"] += prompt_tokens
+            counts["completion_tokens"] += completion_tokens
+        progress.bus.advance("LLM", prompt_tokens + completion_tokens, unit="tokens")
+
+    def summary(self) -> str:
+        with self.lock:
+            return "\n".join(
+                f"{model_name}: {counts['requests']} requests, "
+                f"{counts['prompt_tokens']} prompt + {counts['completion_tokens']} completion tokens"
+                for model_name, counts in self.models.items()
+            ) or "No LLM requests"
+
+
+usage = Usage()
+
+
+# ----------------------------------------------------------------------
+# retries and timeouts
+# ----------------------------------------------------------------------
+class CallAbandoned(TimeoutError):
+    """call_with_timeout gave up waiting, the call itself still runs in its thread"""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Rate limits, server errors, timeouts and connection problems are worth another try
+
+    Except a call abandoned by call_with_timeout: its thread still holds a
+    request in flight, a retry would run beside it outside the llm_slots limit.
+    """
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return not isinstance(error, (ValueError, TypeError, KeyError, CallAbandoned))
+
+
+def with_retries(func: Callable, retries: int = None, backoff: float = None):
+    """Call func, retrying transient errors with exponential backoff and full jitter"""
+    retries = LLM_RETRIES if retries is None else retries
+    backoff = LLM_BACKOFF if backoff is None else backoff
+    for attempt in range(retries + 1):
+        try:
+            return func()
+        except Exception as e:
+            if attempt == retries or not is_retryable(e):
+                raise
+            delay = random.uniform(0, backoff * 2 ** attempt)
+            print(f"LLM call failed ({e!r}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def call_with_timeout(func: Callable, timeout: Optional[float]):
+    """
+    Run func and wait at most timeout seconds for it, raises CallAbandoned past that
+
+    nerif does not expose a request timeout, so the call runs in a daemon
+    thread which is abandoned when it takes too long.
+    """
+    if timeout is None:
+        return func()
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(func())
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    try:
+        return future.result(timeout=timeout)
+    except TimeoutError:
+        raise CallAbandoned(f"no reply after {timeout:.0f}s") from None
+
+
+# ----------------------------------------------------------------------
+# pooled clients
+# ----------------------------------------------------------------------
+_client = None
+_client_lock = threading.Lock()
+_models = threading.local()
+
+
+def get_client() -> openai.OpenAI:
+    """
+    Process-wide OpenAI client
+
+    The client is thread-safe and keeps a pool of HTTP connections, every
+    Streamlit session and reader thread shares it. Retries are done by
+    with_retries so the client's own are turned off.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = openai.OpenAI(
+                base_url=os.environ.get("OPENAI_BASE_URL"),
+                api_key=os.environ.get("OPENAI_API_KEY"),
+                timeout=DEFAULT_TIMEOUT,
+                max_retries=0,
+            )
+        return _client
+
+
+def _pooled_model(model_name: str, **kwargs) -> nerif.model.SimpleChatModel:
+    """
+    SimpleChatModel reused by the calling thread
+
+    The model keeps the conversation in self.messages and is not safe to share
+    between threads, but chat() resets it after each reply, so one instance
+    per thread and model is enough. A call that fails leaves its prompt in the
+    conversation, that instance is discarded.
+    """
+    key = (model_name, json.dumps(kwargs, sort_keys=True, default=str))
+    pool = _models.__dict__.setdefault("pool", {})
+    if key not in pool:
+        pool[key] = nerif.model.SimpleChatModel(model_name, **kwargs)
+    return pool[key]
+
+
+def _discard_pooled_model(model_name: str, **kwargs):
+    key = (model_name, json.dumps(kwargs, sort_keys=True, default=str))
+    _models.__dict__.get("pool", {}).pop(key, None)
+
+
+# ----------------------------------------------------------------------
+# calls
+# ----------------------------------------------------------------------
+def chat(model_name: str, prompt: str, timeout: Optional[float] = DEFAULT_TIMEOUT,
+         prompt_version: Optional[str] = None, use_cache: bool = True,
+         validate: Optional[Callable[[str], object]] = None, **kwargs) -> str:
+    """
+    Send one prompt to model_name through nerif and return the reply
+
+    Used by the reader stages, whose model names (openrouter/..., ollama/...)
+    are routed by nerif. The call waits for a slot of the process-wide LLM
+    budget. Cached replies are returned without taking a slot.
+
+    validate raises ValueError for a reply the caller cannot use, such a reply
+    is returned but never cached, so a rerun asks the model again.
+    """
+    def valid(reply: str) -> bool:
+        if validate is None:
+            return True
+        try:
+            validate(reply)
+        except ValueError:
+            return False
+        return True
+
+    cache = get_llm_cache()
+    key = LLMCache.key(model_name, prompt, prompt_version, **kwargs)
+    if use_cache:
+        cached = cache.get(key)
+        if cached is not None and valid(cached):
+            return cached
+
+    def attempt():
+        model = _pooled_model(model_name, **kwargs)
+        try:
+            return call_with_timeout(lambda: model.chat(prompt), timeout)
+        except Exception:
+            # nerif only resets the conversation after a reply, a retry on this
+            # instance would send the failed prompt again, and an abandoned call
+            # after a timeout still uses it
+            _discard_pooled_model(model_name, **kwargs)
+            raise
+
+    with throttle.llm_slots:
+        reply = with_retries(attempt)
+    usage.add(model_name, count_tokens(prompt), count_tokens(reply or ""))
+    if use_cache and reply and valid(reply):
+        cache.put(key, reply, model_name, prompt_version)
+    return reply
+
+
+def complete(messages: List[Dict], model_name: str = None, timeout: Optional[float] = DEFAULT_TIMEOUT,
+             use_cache: bool = False, **kwargs) -> str:
+    """
+    Chat completion through the pooled OpenAI client, used by the website
+
+    Not cached by default: interactive replies should vary between requests
+    and users' conversations are not written to disk. Deterministic batch
+    calls opt in with use_cache=True.
+    """
+    model_name = model_name or DEFAULT_CHAT_MODEL
+    cache = get_llm_cache()
+    key = LLMCache.key(model_name, json.dumps(messages, ensure_ascii=False), "messages", **kwargs)
+    if use_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    completion = with_retries(lambda: get_client().chat.completions.create(
+        model=model_name, messages=messages, timeout=timeout, **kwargs))
+    reply = completion.choices[0].message.content
+    if completion.usage:
+        usage.add(model_name, completion.usage.prompt_tokens, completion.usage.completion_tokens)
+    else:
+        usage.add(model_name, sum(count_tokens(str(m["content"])) for m in messages), count_tokens(reply or ""))
+    if use_cache and reply:
+        cache.put(key, reply, model_name, "messages")
+    return reply
+
+
+def stream(messages: List[Dict], model_name: str = None, timeout: Optional[float] = DEFAULT_TIMEOUT,
+           **kwargs) -> Iterator[str]:
+    """
+    Streamed chat completion, yields the text as it arrives
+
+    Opening the stream is retried, a stream that breaks after the first token
+    is not. The connection is closed however the caller stops iterating.
+    """
+    model_name = model_name or DEFAULT_CHAT_MODEL
+    response = with_retries(lambda: get_client().chat.completions.create(
+        model=model_name, messages=messages, timeout=timeout, stream=True, **kwargs))
+    parts = []
+    try:
+        for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+    finally:
+        response.close()
+        usage.add(model_name, sum(count_tokens(str(m["content"])) for m in messages), count_tokens("".join(parts)))
+
+
+def embed(texts: List[str], model_name: str, timeout: Optional[float] = DEFAULT_TIMEOUT,
+          client: Optional[openai.OpenAI] = None) -> List[List[float]]:
+    """Embeddings of texts in one request, in input order"""
+    client = client or get_client()
+    response = with_retries(lambda: client.embeddings.create(model=model_name, input=texts, timeout=timeout))
+    if getattr(response, "usage", None):
+        usage.add(model_name, response.usage.prompt_tokens, 0)
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
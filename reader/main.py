@@ -1,4 +1,3 @@
-import time
 import douban_crawler
 import video_crawler
 import douban_cleaning
@@ -6,20 +5,123 @@ import video_cleaning
 from parse_review import parse_reviews
 import report
 from bilibili_auto_crawler import auto_process_book_videos
+from scheduler import StageGraph
+import throttle
+import llm
+import progress
+import subtitles
 
 import threading
 import os
 import argparse
+import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-def show_waiting_animation(thread):
-    dots = 0
+def show_progress(thread):
+    """Redraw the running tasks of the progress bus until thread finishes"""
+    width = shutil.get_terminal_size().columns - 1
+    seen = 0
     while thread.is_alive():
-        print(".", end="", flush=True)
-        time.sleep(0.5)
-        dots += 1
-        if dots >= 6:
-            print("\r" + " " * 6 + "\r", end="", flush=True)
-            dots = 0
+        # wakes up on every event, and once a second so the ETA keeps moving
+        seen = progress.bus.wait(seen, timeout=1.0)
+        line = " | ".join(task.describe() for task in progress.bus.snapshot(include_finished=False))
+        print("\r" + line[:width].ljust(width), end="", flush=True)
+    print("\r" + " " * width + "\r", end="", flush=True)
+
+def read_books_file(path):
+    """Read one book title per line, blank lines and # comments are ignored"""
+    spider = douban_crawler.DoubanBookSpider()
+    book_names = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0]
+            if not line.strip():
+                continue
+            book_name = spider.validate_book_name(line)
+            if book_name not in book_names:
+                book_names.append(book_name)
+    return book_names
+
+def build_book_graph(book_name, args, confirm=lambda question: True):
+    """Collect the stages to run for one book"""
+    video_url_file = args.video
+
+    # The video branch and the douban branch do not depend on each other,
+    # they run at the same time and only join at parse_reviews
+    graph = StageGraph(name=book_name if args.books_file else None)
+
+    # Auto search and download Bilibili videos
+    if args.auto_video or video_url_file == "auto":
+        if confirm(f"Auto search and process {book_name} videos from Bilibili? (Y/N): "):
+            graph.add("video", auto_process_book_videos, args=(book_name,),
+                      kwargs={"download_videos": True, "max_videos": args.max_videos})
+    # Manual video crawling (if video file is provided)
+    elif os.path.exists(video_url_file):
+        if confirm(f"Crawl {book_name} from manual video links? (Y/N): "):
+            video_spider = video_crawler.VideoCrawler(book_name)
+            graph.add("video", video_spider.process_video_urls, args=(video_url_file,))
+    else:
+        print(f"⚠️ Video file {video_url_file} not found, skipping video processing")
+
+    # Clean video
+    if confirm(f"Clean {book_name} from video? (Y/N): "):
+        graph.add("video_clean", video_cleaning.clean_all_video_files, args=(book_name + "/video",),
+                  deps=[s for s in ["video"] if s in graph])
+
+    # Crawl douban
+    if confirm(f"Crawl {book_name} from douban? (Y/N): "):
+        douban_spider = douban_crawler.DoubanBookSpider()
+        graph.add("douban", douban_spider.crawl_book, args=(book_name, args.douban))
+
+    # Clean douban
+    if confirm(f"Clean {book_name} from douban? (Y/N): "):
+        graph.add("douban_clean", douban_cleaning.clean_all_douban_files, args=(book_name + "/website",),
+                  deps=[s for s in ["douban"] if s in graph])
+
+    # Parse reviews, waits for both branches but still runs if one of them failed
+    if confirm(f"Parse {book_name} reviews? (Y/N): "):
+        graph.add("parse", parse_reviews, args=(book_name,),
+                  after=[s for s in ["video", "video_clean", "douban", "douban_clean"] if s in graph])
+
+    # Generate report
+    if confirm(f"Generate report for {book_name}? (Y/N): "):
+        graph.add("report", report.report_parser, args=(book_name,),
+                  deps=[s for s in ["parse"] if s in graph])
+
+    return graph
+
+def run_batch(book_names, args):
+    """Run one pipeline per book over a bounded worker pool, returns the per-book results"""
+    def run_book(book_name):
+        return build_book_graph(book_name, args).run()
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(run_book, book_name): book_name for book_name in book_names}
+        for future in as_completed(futures):
+            book_name = futures[future]
+            try:
+                results[book_name] = future.result()
+            except Exception as e:
+                results[book_name] = e
+            print(f"📚 {book_name} finished ({len(results)}/{len(book_names)})", flush=True)
+    return results
+
+def print_batch_summary(book_names, results):
+    print("\n" + "=" * 60)
+    print(f"{'book':<24} {'status':<8} {'time':>9}  failed stages")
+    print("-" * 60)
+    succeeded = 0
+    for book_name in book_names:
+        result = results[book_name]
+        if isinstance(result, Exception):
+            print(f"{book_name:<24} {'error':<8} {'-':>9}  {result}")
+            continue
+        failed = list(result.errors) + list(result.skipped)
+        succeeded += result.ok
+        print(f"{book_name:<24} {'ok' if result.ok else 'failed':<8} {result.elapsed:8.1f}s  {', '.join(failed)}")
+    print("-" * 60)
+    print(f"{succeeded}/{len(book_names)} books succeeded")
 
 def main():
     parser = argparse.ArgumentParser(description="DeepReader - AI书评生成系统")
@@ -27,167 +129,77 @@ def main():
     parser.add_argument("--douban", type=int, default=1, help="豆瓣爬取书籍数量")
     # video url txt file path or auto search
     parser.add_argument("--video", type=str, default="auto", help="视频链接文件路径，或使用'auto'自动搜索")
-    # book name
-    parser.add_argument("--book", type=str, required=True, help="书籍名称")
+    # book name, or a file with one book name per line
+    books = parser.add_mutually_exclusive_group(required=True)
+    books.add_argument("--book", type=str, help="书籍名称")
+    books.add_argument("--books-file", type=str, help="批量模式：每行一个书名的文件")
     # auto mode
     parser.add_argument("--auto", type=bool, default=False, help="自动模式")
     # auto video search
     parser.add_argument("--auto-video", action="store_true", help="自动搜索Bilibili视频")
     # max videos to download
     parser.add_argument("--max-videos", type=int, default=3, help="最大视频下载数量")
+    # batch mode worker pool and shared budgets
+    parser.add_argument("--workers", type=int, default=2, help="批量模式同时处理的书籍数量")
+    parser.add_argument("--crawl-rate", type=float, default=None, help="所有书籍共享的豆瓣请求速率（次/秒）")
+    parser.add_argument("--crawl-concurrency", type=int, default=None, help="每次爬取同时进行的请求数")
+    parser.add_argument("--llm-concurrency", type=int, default=None, help="所有书籍共享的最大并发LLM请求数")
     args = parser.parse_args()
-    
-    douban_count = args.douban
-    video_url_file = args.video
-    book_name = args.book
-    auto = args.auto
-    
-    # -----------------------------------------------------
-    # Auto search and download Bilibili videos
-    # -----------------------------------------------------
-    if args.auto_video or video_url_file == "auto":
-        if auto:
-            user_input = "Y"
-        else:
-            user_input = input(f"Auto search and process {book_name} videos from Bilibili? (Y/N): ")
-        
-        if user_input.upper() in ["Y", "YES"]:
-            print(f"🔍 Starting auto video search for {book_name}...")
-            
-            def auto_video_process():
-                result = auto_process_book_videos(
-                    book_name, 
-                    download_videos=True, 
-                    max_videos=args.max_videos
-                )
-                return result
-            
-            # Start auto video processing in a thread
-            print("Auto video processing", end="", flush=True)
-            auto_thread = threading.Thread(target=auto_video_process)
-            auto_thread.start()
-            
-            show_waiting_animation(auto_thread)
-            print("\n✅ Auto video processing completed!")
-    
+
+    throttle.configure(crawl_rate=args.crawl_rate, crawl_concurrency=args.crawl_concurrency,
+                       llm_concurrency=args.llm_concurrency)
+
     # -----------------------------------------------------
-    # Manual video crawling (if video file is provided)
+    # Batch mode, always automatic
     # -----------------------------------------------------
-    elif os.path.exists(video_url_file):
+    if args.books_file:
+        book_names = read_books_file(args.books_file)
+        if not book_names:
+            print(f"No books found in {args.books_file}")
+            return
+        print(f"Processing {len(book_names)} books with {args.workers} workers...")
+        results = run_batch(book_names, args)
+        print_batch_summary(book_names, results)
+        print(llm.get_llm_cache().stats())
+        print(llm.usage.summary())
+        print(subtitles.stats.summary())
+        return
+
+    book_name = args.book
+    auto = args.auto
+
+    def confirm(question):
         if auto:
-            user_input = "Y"
-        else:
-            user_input = input(f"Crawl {book_name} from manual video links? (Y/N): ")
-        
-        if user_input.upper() in ["Y", "YES"]:
-            print(f"Starting to crawl {book_name} from video, please wait...")
-            print("Spider is working", end="", flush=True)
-            video_spider = video_crawler.VideoCrawler(book_name)
-            # Start the crawling process in a thread
-            crawl_thread = threading.Thread(target=video_spider.process_video_urls, args=(video_url_file,))
-            crawl_thread.start()
-            
-            # Show animation while the thread is running
-            show_waiting_animation(crawl_thread)
-                    
-            print("\nVideo crawling completed!")
-    else:
-        print(f"⚠️ Video file {video_url_file} not found, skipping video processing")
-    
-    # -----------------------------------------------------
-    # Clean video
-    # -----------------------------------------------------
-    if auto:
-        user_input = "Y"
-    else:
-        user_input = input(f"Clean {book_name} from video? (Y/N): ")
-    if user_input.upper() in ["Y", "YES"]:
-        print(f"Cleaning {book_name} from video, please wait...")
-        print("Cleaning in progress", end="", flush=True)
-        # Start the cleaning process in a thread
-        clean_thread = threading.Thread(target=video_cleaning.clean_all_video_files, args=(book_name + "/video",))
-        clean_thread.start()
-        
-        show_waiting_animation(clean_thread)
-        
-        print("\nVideo cleaning completed!")
-    
-    # -----------------------------------------------------
-    # Crawl douban
-    # -----------------------------------------------------
-    if auto:
-        user_input = "Y"
-    else:
-        user_input = input(f"Crawl {book_name} from douban? (Y/N): ")
-    if user_input.upper() in ["Y", "YES"]:
-        print(f"Starting to crawl {book_name} from douban, please wait...")
-        # Create a background animation while the spider is working
-        print("Spider is working", end="", flush=True)
-        douban_spider = douban_crawler.DoubanBookSpider()
-        # Start the crawling process
-        crawl_thread = threading.Thread(target=douban_spider.crawl_book, args=(book_name, douban_count))
-        crawl_thread.start()
-        
-        show_waiting_animation(crawl_thread)
-        
-        print("\nCrawling completed!")
-    
-    # -----------------------------------------------------
-    # Clean douban
-    # -----------------------------------------------------
-    if auto:
-        user_input = "Y"
-    else:
-        user_input = input(f"Clean {book_name} from douban? (Y/N): ")
-    if user_input.upper() in ["Y", "YES"]:
-        print(f"Cleaning {book_name} from douban, please wait...")
-        print("Cleaning in progress", end="", flush=True)
-        # Start the cleaning process in a thread
-        clean_thread = threading.Thread(target=douban_cleaning.clean_all_douban_files, args=(book_name + "/website",))
-        clean_thread.start()
-        
-        # Show animation while the thread is running
-        show_waiting_animation(clean_thread)
-        
-        print("\nDouban cleaning completed!")
-    
-    # -----------------------------------------------------
-    # Parse reviews
-    # -----------------------------------------------------
-    if auto:
-        user_input = "Y"
-    else:
-        user_input = input(f"Parse {book_name} reviews? (Y/N): ")
-    if user_input.upper() in ["Y", "YES"]:
-        print(f"Parsing {book_name} reviews, please wait...")
-        print("Parsing in progress", end="", flush=True)
-        # Start the parsing process in a thread
-        parse_thread = threading.Thread(target=parse_reviews, args=(book_name,))
-        parse_thread.start()
-        
-        # Show animation while the thread is running
-        show_waiting_animation(parse_thread)
-        
-        print("\nParsing completed!")
-    
+            return True
+        return input(question).upper() in ["Y", "YES"]
+
+    graph = build_book_graph(book_name, args, confirm)
+    if not len(graph):
+        print("Nothing to do")
+        return
+
     # -----------------------------------------------------
-    # Generate report
+    # Run the graph
     # -----------------------------------------------------
-    if auto:
-        user_input = "Y"
-    else:
-        user_input = input(f"Generate report for {book_name}? (Y/N): ")
-    if user_input.upper() in ["Y", "YES"]:
-        print(f"Generating report for {book_name}, please wait...")
-        print("Report generation in progress", end="", flush=True)
-        # Start the report generation process in a thread
-        report_thread = threading.Thread(target=report.report_parser, args=(book_name,))
-        report_thread.start()
-        
-        # Show animation while the thread is running
-        show_waiting_animation(report_thread)
-        
-        print("\nReport generation completed!")
+    print(f"Processing {book_name}, please wait...")
+    outcome = {}
+
+    def run_graph():
+        try:
+            outcome["result"] = graph.run()
+        finally:
+            # wake show_progress so it notices the end right away
+            progress.bus.notify()
+
+    run_thread = threading.Thread(target=run_graph)
+    run_thread.start()
+
+    show_progress(run_thread)
+
+    print("\n" + outcome["result"].summary())
+    print(llm.get_llm_cache().stats())
+    print(llm.usage.summary())
+    print(subtitles.stats.summary())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
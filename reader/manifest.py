@@ -0,0 +1,93 @@
+"""
+Per-book checkpoint manifest
+Records, for every stage and every file, the inputs that were used (file hashes, model name, prompt version)
+and the outputs that were written, so a rerun can skip work that is already done
+"""
+
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+MANIFEST_NAME = "manifest.json"
+
+_manifests: Dict[str, "Manifest"] = {}
+_manifests_lock = threading.Lock()
+
+
+def file_hash(path: str) -> str:
+    """sha256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_atomic(path: str, text: str):
+    """Write text so that readers never see a half-written file"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class Manifest:
+    """
+    Stage records of one book, stored in {book_path}/manifest.json
+
+    Use Manifest.for_book so that stages running in parallel threads share one
+    instance and never overwrite each other's records.
+    """
+
+    def __init__(self, book_path: str):
+        self.path = os.path.join(book_path, MANIFEST_NAME)
+        self.lock = threading.RLock()
+        self.data = {"stages": {}}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable manifest {self.path}: {e}")
+
+    @classmethod
+    def for_book(cls, book_path: str) -> "Manifest":
+        key = os.path.abspath(book_path)
+        with _manifests_lock:
+            if key not in _manifests:
+                _manifests[key] = cls(book_path)
+            return _manifests[key]
+
+    def get(self, stage: str, key: str) -> Optional[dict]:
+        with self.lock:
+            return self.data["stages"].get(stage, {}).get(key)
+
+    def keys(self, stage: str) -> List[str]:
+        with self.lock:
+            return list(self.data["stages"].get(stage, {}))
+
+    def is_done(self, stage: str, key: str, inputs: dict) -> bool:
+        """True if key was completed with the same inputs and its outputs are still on disk"""
+        entry = self.get(stage, key)
+        if not entry or entry.get("inputs") != inputs:
+            return False
+        return all(os.path.exists(path) for path in entry.get("outputs", []))
+
+    def record(self, stage: str, key: str, inputs: dict, outputs: List[str] = (), **extra):
+        """Mark key of stage as completed and persist the manifest"""
+        with self.lock:
+            self.data["stages"].setdefault(stage, {})[key] = {
+                "inputs": inputs,
+                "outputs": list(outputs),
+                "completed_at": datetime.now().isoformat(timespec="seconds"),
+                **extra,
+            }
+            self.save()
+
+    def save(self):
+        with self.lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            write_atomic(self.path, json.dumps(self.data, ensure_ascii=False, indent=2))
@@ -1,13 +1,24 @@
-import nerif
 import os
 import pandas as pd
 import json
+import jsonschema
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import llm
+import progress
+from manifest import Manifest, file_hash, write_atomic
 
 # model_name = "openrouter/deepseek/deepseek-r1"
 model_name = "openrouter/anthropic/claude-3.7-sonnet"
 # model_name = "ollama/deepseek-r1:32b"
 
-model = nerif.model.SimpleChatModel(model_name)
+# bump when a prompt changes so existing results are parsed again
+PROMPT_VERSION = "2"
+# reviews parsed at the same time
+PARSE_CONCURRENCY = int(os.environ.get("DEEPREADER_PARSE_CONCURRENCY", 8))
+
+_log_lock = threading.Lock()
 
 prompt_story = """帮我从书评中找到这本书的剧情部分。请严格遵循以下规则：
 - 输出所有和剧情部分相关的句子
@@ -53,60 +64,96 @@ prompt_thinking = """帮我从书评中找到这本书的思考部分。请严
 思考：
 """
 
-def review_parser(review_file):
+prompt_structured = """帮我从书评中找到这本书的剧情、感受、评价和思考四个部分。请严格遵循以下规则：
+- story：输出所有和剧情部分相关的句子，如果没有剧情部分，请输出“没有涉及剧情”
+- feeling：输出所有和感受部分相关的句子，如果没有感受部分，请输出“没有涉及感受”
+- evaluation：输出所有和评价部分相关的句子，如果没有评价部分，请输出“没有包含评价”
+- thinking：输出所有和思考部分相关的句子，如果没有思考部分，请输出“没有涉及思考”
+- 和书本内容无关的句子都算是评论者的思考
+- 和作者相关的生平经历也算做是评论者的思考
+- 请严格遵循书评原文的文本，不要进行任何修改
+- 只输出一个 JSON 对象，不要输出任何其他内容，格式如下：
+{"story": "...", "feeling": "...", "evaluation": "...", "thinking": "..."}
+
+书评：
+<REVIEW>
+"""
+
+review_schema = {
+    "type": "object",
+    "properties": {
+        "story": {"type": "string"},
+        "feeling": {"type": "string"},
+        "evaluation": {"type": "string"},
+        "thinking": {"type": "string"},
+    },
+    "required": ["story", "feeling", "evaluation", "thinking"],
+}
+
+def parse_structured_response(response):
+    """read the JSON object out of a model reply, raises ValueError if it does not match review_schema"""
+    text = response.strip()
+    # models like to wrap JSON in a ```json fence or add a sentence around it
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        raise ValueError("no JSON object in response")
+    try:
+        data = json.loads(text[start:end + 1])
+        jsonschema.validate(data, review_schema)
+    except (json.JSONDecodeError, jsonschema.ValidationError) as e:
+        raise ValueError(f"invalid structured response: {e}")
+    return data["story"], data["feeling"], data["evaluation"], data["thinking"]
+
+def review_parser(review_file, timeout=llm.DEFAULT_TIMEOUT):
+    """
+    split a review into story, feeling, evaluation and thinking
+
+    All four sections come from one structured call, the per-section prompts
+    are only used when the reply is not valid JSON for review_schema.
+    """
     with open(review_file, "r", encoding="utf-8") as f:
         review = f.read()
+    try:
+        return parse_structured_response(
+            llm.chat(model_name, prompt_structured.replace("<REVIEW>", review),
+                     timeout=timeout, prompt_version=PROMPT_VERSION, validate=parse_structured_response))
+    except ValueError as e:
+        print(f"{review_file}: {e}, falling back to per-section prompts")
+    return review_parser_per_section(review, timeout)
+
+def review_parser_per_section(review, timeout=llm.DEFAULT_TIMEOUT):
+    """one call per section, slower but robust to models that cannot produce JSON"""
     prompt1 = prompt_story.replace("<REVIEW>", review)
-    story = model.chat(prompt1)
+    story = llm.chat(model_name, prompt1, timeout=timeout, prompt_version=PROMPT_VERSION)
     prompt2 = prompt_feeling.replace("<REVIEW>", review)
-    feeling = model.chat(prompt2)
+    feeling = llm.chat(model_name, prompt2, timeout=timeout, prompt_version=PROMPT_VERSION)
     prompt3 = prompt_evaluation.replace("<REVIEW>", review)
-    evaluation = model.chat(prompt3)
+    evaluation = llm.chat(model_name, prompt3, timeout=timeout, prompt_version=PROMPT_VERSION)
     prompt4 = prompt_thinking.replace("<REVIEW>", review)
-    thinking = model.chat(prompt4)
+    thinking = llm.chat(model_name, prompt4, timeout=timeout, prompt_version=PROMPT_VERSION)
     return story, feeling, evaluation, thinking
 
 
 
-def parse_reviews(book_path="example_book"):
+def collect_review_files(book_path):
+    """list (source, source_url, file_path) for every cleaned review of a book"""
     douban_folder = os.path.join(book_path, "website")
     video_folder = os.path.join(book_path, "video")
-    parsed_data = []
-    # create a table with the following columns:
+    review_files = []
 
-    # - source
-    # - source_url
-    # - story
-    # - feeling
-    # - evaluation
-    # - thinking
-
-    log_file = "log.txt"
-    
     # read all files in the douban_folder
     if os.path.exists(douban_folder):
-        for file in os.listdir(douban_folder):
+        for file in sorted(os.listdir(douban_folder)):
             if file.endswith("cleaned.txt"):
                 review_id = file.split("_cleaned.txt")[0]
                 review_url = f"https://book.douban.com/review/{review_id}/"
-                file_path = os.path.join(douban_folder, file)
-                story, feeling, evaluation, thinking = review_parser(file_path)
-                source = "douban"   
-                parsed_data.append([source, review_url, story, feeling, evaluation, thinking])
-                with open(log_file, "a", encoding="utf-8") as f:
-                    f.write(f"{file_path} parsed successfully\n")
-                    f.write(f"story: {story}\n")
-                    f.write(f"feeling: {feeling}\n")
-                    f.write(f"evaluation: {evaluation}\n")
-                    f.write(f"thinking: {thinking}\n")
-                    f.write("\n")
+                review_files.append(["douban", review_url, os.path.join(douban_folder, file)])
     else:
         print(f"Douban folder {douban_folder} does not exist, skipping...")
-            
 
     # read all files in the video_folder
     if os.path.exists(video_folder):
-        for file in os.listdir(video_folder):
+        for file in sorted(os.listdir(video_folder)):
             if file.endswith("cleaned.txt"):
                 review_id = file.split("_cleaned.txt")[0]
                 if file.startswith("ytb_"):
@@ -118,18 +165,78 @@ def parse_reviews(book_path="example_book"):
                 else:
                     source = "unknown"
                     review_url = f"https://book.douban.com/review/{review_id}/"
-                file_path = os.path.join(video_folder, file)
-                story, feeling, evaluation, thinking = review_parser(file_path)
-                parsed_data.append([source, review_url, story, feeling, evaluation, thinking])
-                with open(log_file, "a", encoding="utf-8") as f:
-                    f.write(f"{file_path} parsed successfully\n")
-                    f.write(f"story: {story}\n")
-                    f.write(f"feeling: {feeling}\n")
-                    f.write(f"evaluation: {evaluation}\n")
-                    f.write(f"thinking: {thinking}\n")
-                    f.write("\n")
+                review_files.append([source, review_url, os.path.join(video_folder, file)])
     else:
         print(f"Video folder {video_folder} does not exist, skipping...")
+
+    return review_files
+
+def parse_review_file(book_path, source, review_url, file_path, log_file="log.txt", timeout=llm.DEFAULT_TIMEOUT):
+    """
+    parse one review file into a row of parsed_data
+
+    The row is written to {book_path}/parsed/ right away and recorded in the
+    book manifest, so a rerun with the same file, model and prompts reuses it.
+    """
+    manifest = Manifest.for_book(book_path)
+    key = os.path.relpath(file_path, book_path)
+    row_file = os.path.join(book_path, "parsed", key.replace(os.sep, "_").replace(".txt", ".json"))
+    inputs = {"file": file_hash(file_path), "model": model_name, "prompt_version": PROMPT_VERSION}
+
+    if manifest.is_done("parse", key, inputs):
+        with open(row_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    story, feeling, evaluation, thinking = review_parser(file_path, timeout)
+    row = [source, review_url, story, feeling, evaluation, thinking]
+    os.makedirs(os.path.dirname(row_file), exist_ok=True)
+    write_atomic(row_file, json.dumps(row, ensure_ascii=False))
+    manifest.record("parse", key, inputs, [row_file])
+
+    with _log_lock, open(log_file, "a", encoding="utf-8") as f:
+        f.write(f"{file_path} parsed successfully\n")
+        f.write(f"story: {story}\n")
+        f.write(f"feeling: {feeling}\n")
+        f.write(f"evaluation: {evaluation}\n")
+        f.write(f"thinking: {thinking}\n")
+        f.write("\n")
+    return row
+
+def parse_reviews(book_path="example_book", max_workers=PARSE_CONCURRENCY, timeout=llm.DEFAULT_TIMEOUT):
+    """
+    parse every cleaned review of a book into parsed_data.csv / parsed_data.json
+
+    Files are parsed concurrently by up to max_workers threads (the process-wide
+    LLM budget still caps the requests in flight), each LLM call gives up after
+    timeout seconds. Rows keep the order of collect_review_files whatever order
+    the calls finish in. A review that fails is left out and retried on the next run.
+    """
+    # create a table with the following columns:
+
+    # - source
+    # - source_url
+    # - story
+    # - feeling
+    # - evaluation
+    # - thinking
+    review_files = collect_review_files(book_path)
+    parsed_data = [None] * len(review_files)
+    task = progress.task_name(book_path, "parse")
+    progress.bus.start(task, len(review_files), unit="reviews")
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = {
+            pool.submit(parse_review_file, book_path, source, review_url, file_path, timeout=timeout): index
+            for index, (source, review_url, file_path) in enumerate(review_files)
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                parsed_data[index] = future.result()
+            except Exception as e:
+                print(f"Failed to parse {review_files[index][2]}: {e!r}")
+            progress.bus.advance(task, unit="reviews")
+    progress.bus.finish(task)
+    parsed_data = [row for row in parsed_data if row is not None]
                 
     # save the parsed data to a csv file
     csv_file_path = os.path.join(book_path, "parsed_data.csv")
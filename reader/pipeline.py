@@ -0,0 +1,119 @@
+"""
+Producer-consumer pipeline for items that go through several stages
+Every stage has its own worker threads, bounded queues between the stages let item N+1 enter a stage while item N is in the next one
+"""
+
+import queue
+import threading
+import time
+import traceback
+from typing import Callable, Iterable, List, Optional
+
+import progress
+
+# marks the end of the items on a queue, one per worker of the stage reading it
+_END = object()
+
+
+class StreamStage:
+    """
+    One step of the pipeline
+
+    func takes the item of the previous stage and returns the item of the
+    next one, None drops the item (nothing left to do for it). queue_size is
+    how many items may wait for this stage, the stage before blocks when the
+    queue is full. That backpressure is what keeps, for example, downloaded
+    media from piling up ahead of a slower transcription stage.
+    """
+
+    def __init__(self, name: str, func: Callable, workers: int = 1, queue_size: int = 2):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+
+
+class StreamPipeline:
+    """Runs items through StreamStages in order, each item as soon as its previous stage is done with it"""
+
+    def __init__(self, stages: List[StreamStage], task: Optional[str] = None, unit: str = "items",
+                 verbose: bool = True):
+        self.stages = stages
+        # progress task counting the items that left the pipeline, finished or dropped
+        self.task = task
+        self.unit = unit
+        self.verbose = verbose
+        self.results: List = []
+        self.errors: List = []
+        self.timings = {stage.name: 0.0 for stage in stages}
+        self.lock = threading.Lock()
+
+    def _log(self, message: str):
+        if self.verbose:
+            print(message)
+
+    def _left(self):
+        if self.task:
+            progress.bus.advance(self.task, unit=self.unit)
+
+    def _work(self, index: int, queues: List[queue.Queue], remaining: List[int]):
+        stage = self.stages[index]
+        last = index == len(self.stages) - 1
+        while True:
+            item = queues[index].get()
+            if item is _END:
+                break
+            start = time.time()
+            try:
+                result = stage.func(item)
+            except Exception as e:
+                self._log(f"[{stage.name}] failed on {item!r}: {e}")
+                if self.verbose:
+                    traceback.print_exc()
+                with self.lock:
+                    self.errors.append((stage.name, item, e))
+                result = None
+            with self.lock:
+                self.timings[stage.name] += time.time() - start
+            if result is None:
+                self._left()
+            elif last:
+                with self.lock:
+                    self.results.append(result)
+                self._left()
+            else:
+                # blocks while the next stage is busy and its queue is full
+                queues[index + 1].put(result)
+        with self.lock:
+            remaining[index] -= 1
+            closing = remaining[index] == 0
+        # the last worker of a stage to finish ends the next stage
+        if closing and not last:
+            for _ in range(self.stages[index + 1].workers):
+                queues[index + 1].put(_END)
+
+    def run(self, items: Iterable) -> List:
+        """Run every item through all stages, returns the results of the last stage in completion order"""
+        items = list(items)
+        if self.task:
+            progress.bus.start(self.task, len(items), unit=self.unit)
+        queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        remaining = [stage.workers for stage in self.stages]
+        threads = [
+            threading.Thread(target=self._work, args=(index, queues, remaining), name=f"{stage.name}-{n}", daemon=True)
+            for index, stage in enumerate(self.stages) for n in range(stage.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for item in items:
+                queues[0].put(item)
+        finally:
+            for _ in range(self.stages[0].workers):
+                queues[0].put(_END)
+            for thread in threads:
+                thread.join()
+            if self.task:
+                progress.bus.finish(self.task)
+        self._log(" ".join(f"{name} {seconds:.1f}s" for name, seconds in self.timings.items()))
+        return self.results
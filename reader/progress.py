@@ -0,0 +1,202 @@
+"""
+Progress event bus shared by the pipeline stages and the front-ends
+
+Stages publish what they actually did (reviews parsed, bytes downloaded,
+tokens used) to named tasks of the process-wide bus. Front-ends block in
+bus.wait() until something changes instead of polling, and show the real
+throughput and ETA of every task.
+"""
+
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+def task_name(book_name: str, stage: str) -> str:
+    """Name of the task of one stage of one book, front-ends use it to find that task"""
+    return f"{book_name}: {stage}"
+
+
+def format_amount(amount: float, unit: str) -> str:
+    if unit == "bytes":
+        for prefix in ("B", "KB", "MB", "GB"):
+            if amount < 1024 or prefix == "GB":
+                return f"{amount:.0f} {prefix}" if prefix == "B" else f"{amount:.1f} {prefix}"
+            amount /= 1024
+    return f"{amount:.0f}"
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+
+
+class Task:
+    """Progress of one unit of work, a snapshot is a copy that no longer changes"""
+
+    def __init__(self, name: str, total: Optional[float] = None, unit: str = "items"):
+        self.name = name
+        self.total = total
+        self.unit = unit
+        self.done = 0.0
+        self.started = time.time()
+        self.updated = self.started
+        self.finished = False
+
+    def copy(self) -> "Task":
+        task = Task(self.name, self.total, self.unit)
+        task.__dict__.update(self.__dict__)
+        return task
+
+    @property
+    def fraction(self) -> Optional[float]:
+        if not self.total:
+            return None
+        return min(self.done / self.total, 1.0)
+
+    def rate(self, now: Optional[float] = None) -> float:
+        """Units per second since the task started"""
+        elapsed = (self.updated if self.finished else (now or time.time())) - self.started
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def eta(self, now: Optional[float] = None) -> Optional[float]:
+        """Seconds left at the current rate, None while unknown"""
+        if self.finished:
+            return 0.0
+        rate = self.rate(now)
+        if not self.total or not rate:
+            return None
+        return max(self.total - self.done, 0) / rate
+
+    def describe(self) -> str:
+        done = format_amount(self.done, self.unit)
+        if self.total:
+            done += f"/{format_amount(self.total, self.unit)}"
+        unit = "" if self.unit == "bytes" else f" {self.unit}"
+        if self.unit == "bytes":
+            rate = format_amount(self.rate(), self.unit) + "/s"
+        else:
+            rate = f"{self.rate():.1f} {self.unit}/s"
+        text = f"{self.name}: {done}{unit}, {rate}"
+        if self.finished:
+            return text + ", done"
+        eta = self.eta()
+        return text + (f", ETA {format_duration(eta)}" if eta is not None else "")
+
+    def to_dict(self) -> Dict:
+        return {"name": self.name, "done": self.done, "total": self.total, "unit": self.unit,
+                "rate": self.rate(), "eta": self.eta(), "finished": self.finished,
+                "description": self.describe()}
+
+
+class ProgressBus:
+    """
+    Named tasks guarded by one condition variable
+
+    Every change bumps a version number and wakes the subscribers, a
+    subscriber remembers the last version it saw and waits for a newer one.
+    Publishing is a dict update under a lock, cheap enough for per-item calls.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.tasks: Dict[str, Task] = {}
+        self.version = 0
+
+    def _changed(self):
+        self.version += 1
+        self.condition.notify_all()
+
+    def start(self, name: str, total: Optional[float] = None, unit: str = "items"):
+        """Begin (or restart) a task"""
+        with self.condition:
+            self.tasks[name] = Task(name, total, unit)
+            self._changed()
+
+    def expect(self, name: str, amount: float, unit: str = "items"):
+        """Add amount to the total of a task, for work discovered while it runs"""
+        with self.condition:
+            task = self.tasks.setdefault(name, Task(name, 0, unit))
+            task.total = (task.total or 0) + amount
+            task.finished = False
+            self._changed()
+
+    def advance(self, name: str, amount: float = 1, unit: str = "items"):
+        """Record amount more units done, the task is created on first use"""
+        with self.condition:
+            task = self.tasks.get(name)
+            if task is None or task.finished:
+                task = self.tasks[name] = Task(name, None, unit)
+            task.done += amount
+            task.updated = time.time()
+            self._changed()
+
+    def finish(self, name: str):
+        with self.condition:
+            task = self.tasks.get(name)
+            if task is not None and not task.finished:
+                task.finished = True
+                task.updated = time.time()
+            self._changed()
+
+    def notify(self):
+        """Wake every subscriber, e.g. when the work they watch has ended"""
+        with self.condition:
+            self._changed()
+
+    def get(self, name: str) -> Optional[Task]:
+        with self.condition:
+            task = self.tasks.get(name)
+            return task.copy() if task is not None else None
+
+    def snapshot(self, prefix: str = "", include_finished: bool = True) -> List[Task]:
+        """Copies of the tasks whose name starts with prefix, oldest first"""
+        with self.condition:
+            return [task.copy() for task in self.tasks.values()
+                    if task.name.startswith(prefix) and (include_finished or not task.finished)]
+
+    def wait(self, seen: int = 0, timeout: Optional[float] = None) -> int:
+        """
+        Block until the version is newer than seen or timeout passes, returns the current version
+
+        A timeout still makes sense for a display, the ETA of a task changes
+        with time even when no event arrives.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.version != seen, timeout)
+            return self.version
+
+    def clear(self, prefix: str = ""):
+        with self.condition:
+            for name in [name for name in self.tasks if name.startswith(prefix)]:
+                del self.tasks[name]
+            self._changed()
+
+
+# every stage of the process publishes here
+bus = ProgressBus()
+
+
+def download_hook(name: str):
+    """yt-dlp progress hook that publishes the downloaded bytes of every file to task name"""
+    seen: Dict[str, float] = {}
+
+    def hook(status: Dict):
+        filename = status.get("filename", "")
+        if status.get("status") not in ("downloading", "finished"):
+            return
+        if filename not in seen:
+            seen[filename] = 0
+            total = status.get("total_bytes") or status.get("total_bytes_estimate")
+            if total:
+                bus.expect(name, total, unit="bytes")
+        downloaded = status.get("downloaded_bytes") or 0
+        if downloaded > seen[filename]:
+            bus.advance(name, downloaded - seen[filename], unit="bytes")
+            seen[filename] = downloaded
+
+    return hook
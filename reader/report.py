@@ -1,13 +1,131 @@
 import pandas as pd
 import os
-import nerif
+from concurrent.futures import ThreadPoolExecutor
+
+import llm
+from manifest import Manifest, file_hash
+from scheduler import StageGraph
 
 smart_model_name = "google/gemini-2.5-pro-preview-03-25"
+# bump when a prompt changes so existing reports are regenerated
+PROMPT_VERSION = "1"
+# largest block of review descriptions sent in one request, above it the
+# descriptions are summarized chunk by chunk (map) and the summaries merged (reduce)
+CHUNK_TOKENS = int(os.environ.get("DEEPREADER_REPORT_CHUNK_TOKENS", 12000))
+# summarization rounds of condense before what is left is truncated to the budget
+MAX_CONDENSE_ROUNDS = int(os.environ.get("DEEPREADER_REPORT_MAX_ROUNDS", 4))
+
+SECTIONS = {"story": "剧情", "feeling": "感受", "evaluation": "评价", "thinking": "思考"}
+
+summary_prompt = """你是一个书评专家，我们在讨论的书是{book_name}，以下是一部分用户对这本书{label}的描述。
+请把它们归纳成一份{label}摘要，请严格遵循以下规则：
+- 保留所有不同的观点和具体细节，相同的观点合并在一起
+- 不要加入描述中没有的内容
+- 只输出摘要
+
+{descriptions}
+
+{label}摘要：
+"""
+
+def chunk_descriptions(descriptions, budget=CHUNK_TOKENS):
+    """group descriptions in order into chunks of at most budget tokens, a longer description is a chunk of its own"""
+    chunks, chunk, size = [], [], 0
+    for description in descriptions:
+        tokens = llm.count_tokens(description)
+        if chunk and size + tokens > budget:
+            chunks.append(chunk)
+            chunk, size = [], 0
+        chunk.append(description)
+        size += tokens
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+def truncate_descriptions(descriptions, budget=CHUNK_TOKENS):
+    """the descriptions that fit in budget tokens, in order, the first one cut short when it alone is too long"""
+    kept, size = [], 0
+    for description in descriptions:
+        tokens = llm.count_tokens(description)
+        if size + tokens > budget:
+            if not kept:
+                kept.append(description[:len(description) * budget // tokens])
+            break
+        kept.append(description)
+        size += tokens
+    return "".join(kept)
+
+def condense(book_name, section, descriptions, budget=CHUNK_TOKENS, max_rounds=MAX_CONDENSE_ROUNDS):
+    """
+    shrink the descriptions of one section until they fit in budget tokens
+
+    Each chunk is summarized in parallel, the summaries become the descriptions
+    of the next round, so the size of every request stays bounded. After
+    max_rounds, or as soon as a round does not make the text shorter, the rest
+    is truncated instead of spending more tokens on summaries that do not shrink.
+    """
+    label = SECTIONS[section]
+    # a single description over the budget would make a request of its own that is too large
+    descriptions = [truncate_descriptions([description], budget) for description in descriptions]
+    size = sum(llm.count_tokens(description) for description in descriptions)
+    for _ in range(max_rounds):
+        chunks = chunk_descriptions(descriptions, budget)
+        if len(chunks) <= 1 and size <= budget:
+            return "".join(descriptions)
+        print(f"Summarizing {len(descriptions)} {section} descriptions in {len(chunks)} chunks")
+        prompts = [summary_prompt.format(book_name=book_name, label=label, descriptions="".join(chunk))
+                   for chunk in chunks]
+        with ThreadPoolExecutor(max_workers=len(prompts)) as pool:
+            summaries = list(pool.map(
+                lambda prompt: llm.chat(smart_model_name, prompt, prompt_version=PROMPT_VERSION), prompts))
+        descriptions = [f"# 摘要 {id}：{summary}\n" for id, summary in enumerate(summaries, start=1)]
+        previous, size = size, sum(llm.count_tokens(description) for description in descriptions)
+        if size >= previous:
+            print(f"Summaries of the {section} descriptions do not get shorter, truncating them")
+            break
+    if size <= budget:
+        return "".join(descriptions)
+    print(f"{section} descriptions still exceed {budget} tokens, truncating them")
+    return truncate_descriptions(descriptions, budget)
+
+def report_prompt(book_name, responses):
+    return f"""帮我写一篇有深度的书评, 必须完整包含后面的所有内容：
+    书名是{book_name}
+    
+    # 大致剧情：
+    {responses["story"]}
+    
+    # 感受：
+    {responses["feeling"]}
+    
+    # 评价：
+    {responses["evaluation"]}
+    
+    # 思考：
+    {responses["thinking"]}
+    
+    
+    请用 markdown 格式输出，请严格遵循：
+    - 不要包含任何除了 markdown 文档以外的其他内容。
+    - 长度接近 8000 字。
+    - 不要提到「用户xx认为」，的观点，用第一人称写书评。
+    - 单独列出剧情部分
+    - 感受、评价、思考三部分，可以使用分点的形式列举。
+    """
 
 def report_parser(book_name):
     file_path = f"{book_name}/parsed_data.csv"
+    report_path = f"{book_name}.md"
+
+    # skip when parsed_data.csv, the model and the prompts are unchanged
+    manifest = Manifest.for_book(book_name)
+    inputs = {"file": file_hash(file_path), "model": smart_model_name, "prompt_version": PROMPT_VERSION}
+    if manifest.is_done("report", "report", inputs):
+        print(f"Report {report_path} is up to date, skipping")
+        with open(report_path, "r") as f:
+            return f.read()
+
     df = pd.read_csv(file_path)
-    smart_model = nerif.model.SimpleChatModel(model=smart_model_name)
     
     story_prompt = f"""
     你是一个书评专家，我们在讨论的书是{book_name}，以下是一些用户对这本书剧情的描述，
@@ -28,60 +146,58 @@ def report_parser(book_name):
     """
     
     
-    id = 0
-    for index, row in df.iterrows():
-        id += 1
-        story = row["story"]
-        feeling = row["feeling"]
-        evaluation = row["evaluation"]
-        thinking = row["thinking"]
-        
-        story_prompt = story_prompt + f"# {id} 的剧情描述：{story}\n"
-        feeling_prompt = feeling_prompt + f"# {id} 的感受描述：{feeling}\n"
-        evaluation_prompt = evaluation_prompt + f"# {id} 的评价描述：{evaluation}\n"
-        thinking_prompt = thinking_prompt + f"# {id} 的思考描述：{thinking}\n"
-        
-    story_response = smart_model.chat(story_prompt)
-    feeling_prompt = "我们今天来讨论一下 " + book_name + "，这本书大致说了：" + story_response + feeling_prompt + "请根据这些描述，用 2000-3000 字你阅读这本书的感受。"
-    evaluation_prompt = "我们今天来讨论一下 " + book_name + "，这本书大致说了：" + story_response + evaluation_prompt + "请根据这些描述，用 2000-3000 字你阅读这本书的评价。分别探讨这本书的优点和缺点。"
-    thinking_prompt = "我们今天来讨论一下 " + book_name + "，这本书大致说了：" + story_response + thinking_prompt + "请根据这些描述，用 3000-5000 字说说你阅读这本书的思考。可以一定程度上引申和拔高主题。"
-    
-    feeling_response = smart_model.chat(feeling_prompt)
-    evaluation_response = smart_model.chat(evaluation_prompt)
-    thinking_response = smart_model.chat(thinking_prompt)
-    
-    report_prompt = f"""帮我写一篇有深度的书评, 必须完整包含后面的所有内容：
-    书名是{book_name}
-    
-    # 大致剧情：
-    {story_response}
-    
-    # 感受：
-    {feeling_response}
-    
-    # 评价：
-    {evaluation_response}
-    
-    # 思考：
-    {thinking_response}
-    
-    
-    请用 markdown 格式输出，请严格遵循：
-    - 不要包含任何除了 markdown 文档以外的其他内容。
-    - 长度接近 8000 字。
-    - 不要提到「用户xx认为」，的观点，用第一人称写书评。
-    - 单独列出剧情部分
-    - 感受、评价、思考三部分，可以使用分点的形式列举。
-    """
-    
-    with open(f"{book_name}_prompt.md", "w") as f:
-        f.write(report_prompt)
-    
-    report_response = smart_model.chat(report_prompt)
+    descriptions = {section: [] for section in SECTIONS}
+    for id, (_, row) in enumerate(df.iterrows(), start=1):
+        for section, label in SECTIONS.items():
+            descriptions[section].append(f"# {id} 的{label}描述：{row[section]}\n")
+
+    section_prompts = {
+        "story": story_prompt,
+        "feeling": feeling_prompt,
+        "evaluation": evaluation_prompt,
+        "thinking": thinking_prompt,
+    }
+    section_requests = {
+        "feeling": "请根据这些描述，用 2000-3000 字你阅读这本书的感受。",
+        "evaluation": "请根据这些描述，用 2000-3000 字你阅读这本书的评价。分别探讨这本书的优点和缺点。",
+        "thinking": "请根据这些描述，用 3000-5000 字说说你阅读这本书的思考。可以一定程度上引申和拔高主题。",
+    }
+    responses = {}
+
+    def condense_section(section):
+        # books with many reviews are condensed chunk by chunk first
+        section_prompts[section] += condense(book_name, section, descriptions[section])
+
+    def ask(section):
+        prompt = section_prompts[section]
+        if section != "story":
+            prompt = "我们今天来讨论一下 " + book_name + "，这本书大致说了：" + responses["story"] + prompt + section_requests[section]
+        responses[section] = llm.chat(smart_model_name, prompt, prompt_version=PROMPT_VERSION)
+
+    def synthesize():
+        prompt = report_prompt(book_name, responses)
+        with open(f"{book_name}_prompt.md", "w") as f:
+            f.write(prompt)
+        responses["report"] = llm.chat(smart_model_name, prompt, prompt_version=PROMPT_VERSION)
+
+    # story first, the three analyses only need the story, the report needs everything
+    graph = StageGraph(name=f"{book_name} report")
+    for section in SECTIONS:
+        graph.add(f"condense_{section}", condense_section, args=(section,))
+    graph.add("story", ask, args=("story",), deps=["condense_story"])
+    for section in section_requests:
+        graph.add(section, ask, args=(section,), deps=["story", f"condense_{section}"])
+    graph.add("report", synthesize, deps=list(section_requests))
+    result = graph.run()
+    print(result.summary())
+    if result.errors:
+        raise next(iter(result.errors.values()))
+    report_response = responses["report"]
     
     # 保存到文件
-    with open(f"{book_name}.md", "w") as f:
+    with open(report_path, "w") as f:
         f.write(report_response)
+    manifest.record("report", "report", inputs, [report_path, f"{book_name}_prompt.md"])
     
     return report_response
 
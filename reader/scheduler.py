@@ -0,0 +1,162 @@
+"""
+Dependency-graph executor for pipeline stages
+Independent stages run at the same time, each stage starts as soon as the stages it depends on are done
+"""
+
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, Iterable, Optional
+
+import progress
+
+
+class Stage:
+    """A single node of the graph"""
+
+    def __init__(self, name: str, func: Callable, args: tuple = (), kwargs: Optional[dict] = None,
+                 deps: Iterable[str] = (), after: Iterable[str] = ()):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs or {}
+        # deps must succeed before this stage runs, after only has to be finished
+        self.deps = list(deps)
+        self.after = list(after)
+
+
+class GraphResult:
+    """Outcome of one graph run"""
+
+    def __init__(self):
+        self.results: Dict[str, object] = {}
+        self.errors: Dict[str, BaseException] = {}
+        self.skipped: Dict[str, str] = {}
+        self.timings: Dict[str, float] = {}
+        self.elapsed = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors and not self.skipped
+
+    def status(self, name: str) -> str:
+        if name in self.errors:
+            return "failed"
+        if name in self.skipped:
+            return "skipped"
+        if name in self.results:
+            return "done"
+        return "pending"
+
+    def summary(self) -> str:
+        """One line per stage with its status and duration"""
+        lines = []
+        for name in list(self.timings) + list(self.skipped):
+            status = self.status(name)
+            duration = self.timings.get(name)
+            if duration is not None:
+                lines.append(f"{name:<16} {status:<8} {duration:8.1f}s")
+            else:
+                lines.append(f"{name:<16} {status:<8} ({self.skipped[name]})")
+        lines.append(f"{'total':<16} {'':<8} {self.elapsed:8.1f}s")
+        return "\n".join(lines)
+
+
+class StageGraph:
+    """
+    Small DAG of pipeline stages
+
+    Stages are added in dependency order, so the graph can never contain a cycle.
+    """
+
+    def __init__(self, name: Optional[str] = None, verbose: bool = True):
+        self.stages: Dict[str, Stage] = {}
+        # prefix for log lines when several graphs run side by side
+        self.name = name
+        self.verbose = verbose
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.stages
+
+    def __len__(self) -> int:
+        return len(self.stages)
+
+    def add(self, name: str, func: Callable, args: tuple = (), kwargs: Optional[dict] = None,
+            deps: Iterable[str] = (), after: Iterable[str] = ()) -> "StageGraph":
+        """
+        Add a stage
+
+        Args:
+            name: unique stage name
+            func: callable run in a worker thread
+            args, kwargs: arguments for func
+            deps: stages that must succeed first, the stage is skipped if one of them fails
+            after: stages that only have to finish first, whatever their outcome
+        """
+        if name in self.stages:
+            raise ValueError(f"Stage {name} already exists")
+        deps, after = list(deps), list(after)
+        for dep in deps + after:
+            if dep not in self.stages:
+                raise ValueError(f"Stage {name} depends on unknown stage {dep}")
+        self.stages[name] = Stage(name, func, args, kwargs, deps, after)
+        return self
+
+    def _log(self, message: str):
+        if self.verbose:
+            prefix = f"[{self.name}] " if self.name else ""
+            print(prefix + message, flush=True)
+
+    def _run_stage(self, stage: Stage, result: GraphResult):
+        start = time.time()
+        try:
+            return stage.func(*stage.args, **stage.kwargs)
+        finally:
+            result.timings[stage.name] = time.time() - start
+
+    def run(self, max_workers: Optional[int] = None) -> GraphResult:
+        """Run every stage, returns a GraphResult once nothing is left to run"""
+        result = GraphResult()
+        pending = dict(self.stages)
+        running = {}
+        start = time.time()
+        task = progress.task_name(self.name or "pipeline", "stages")
+        progress.bus.start(task, len(self.stages), unit="stages")
+
+        with ThreadPoolExecutor(max_workers=max_workers or max(len(self.stages), 1)) as pool:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    failed = [dep for dep in stage.deps if dep in result.errors or dep in result.skipped]
+                    if failed:
+                        result.skipped[name] = f"{failed[0]} did not succeed"
+                        del pending[name]
+                        progress.bus.advance(task, unit="stages")
+                        self._log(f"⏭️  {name} skipped: {result.skipped[name]}")
+                        continue
+                    finished = set(result.results) | set(result.errors) | set(result.skipped)
+                    if all(dep in finished for dep in stage.deps + stage.after):
+                        self._log(f"▶️  {name} started")
+                        running[pool.submit(self._run_stage, stage, result)] = name
+                        del pending[name]
+
+                if not running:
+                    # only reachable when every pending stage waits on a skipped one
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        result.results[name] = future.result()
+                        self._log(f"✅ {name} completed in {result.timings[name]:.1f}s")
+                    except Exception as e:
+                        result.errors[name] = e
+                        self._log(f"❌ {name} failed: {e}")
+                        if self.verbose:
+                            traceback.print_exception(type(e), e, e.__traceback__)
+                    progress.bus.advance(task, unit="stages")
+
+        progress.bus.finish(task)
+
+        result.elapsed = time.time() - start
+        return result
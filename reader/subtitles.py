@@ -0,0 +1,150 @@
+"""
+Captions of videos, read before any media is downloaded
+
+A video with CC or automatic captions needs neither its media nor Whisper.
+Only videos without captions go on to the audio download and transcription,
+stats counts the hours of speech recognition the captions saved.
+"""
+
+import os
+import re
+import threading
+from typing import Dict, Optional, Tuple
+
+import requests
+import yt_dlp
+
+import progress
+
+# probe for captions first and only transcribe videos without them, "0" always transcribes
+SUBTITLES_FIRST = os.environ.get("DEEPREADER_SUBTITLES_FIRST", "1") != "0"
+# caption languages in order of preference, uploaded captions come before automatic ones
+SUBTITLE_LANGS = ["zh-CN", "zh-Hans", "zh", "ai-zh"]
+# formats that subtitle_text can read, best first
+SUBTITLE_FORMATS = ["srt", "vtt", "ass"]
+
+
+def extract_from_vtt(content: str) -> str:
+    """从VTT格式提取文本"""
+    text_lines = []
+    for line in content.split('\n'):
+        line = line.strip()
+        if line and not line.startswith('WEBVTT') and '-->' not in line and not line.startswith('NOTE'):
+            # 移除HTML标签
+            line = re.sub(r'<[^>]+>', '', line)
+            if line:
+                text_lines.append(line)
+    return '\n'.join(text_lines)
+
+
+def extract_from_srt(content: str) -> str:
+    """从SRT格式提取文本"""
+    text_lines = []
+    for line in content.split('\n'):
+        line = line.strip()
+        if line and not line.isdigit() and '-->' not in line:
+            text_lines.append(line)
+    return '\n'.join(text_lines)
+
+
+def subtitle_text(content: str, ext: str) -> str:
+    """Plain text of a subtitle file in format ext"""
+    if ext == 'vtt':
+        return extract_from_vtt(content)
+    if ext == 'srt':
+        return extract_from_srt(content)
+    # 简单的文本提取
+    text_lines = []
+    for line in content.split('\n'):
+        line = line.strip()
+        if line and not line.startswith(('WEBVTT', 'NOTE', '{')):
+            # 移除时间戳
+            if '-->' not in line and not line.isdigit():
+                text_lines.append(line)
+    return '\n'.join(text_lines)
+
+
+def pick_subtitle(info: Dict) -> Optional[Tuple[str, Dict]]:
+    """(language, format dict) of the best readable caption track of a yt-dlp info dict"""
+    for tracks in (info.get('subtitles') or {}, info.get('automatic_captions') or {}):
+        for lang in SUBTITLE_LANGS:
+            formats = {f.get('ext'): f for f in tracks.get(lang, []) if f.get('url')}
+            for ext in SUBTITLE_FORMATS:
+                if ext in formats:
+                    return lang, formats[ext]
+    return None
+
+
+def probe(url: str, audio_format: Optional[str] = None) -> Dict:
+    """
+    yt-dlp info dict of a video, nothing is downloaded
+
+    With audio_format the info also holds the stream that format selects, so
+    a video without captions needs no second lookup before its download.
+    """
+    ydl_opts = {'quiet': True, 'noplaylist': True, 'skip_download': True,
+                'writesubtitles': True, 'writeautomaticsub': True, 'subtitleslangs': SUBTITLE_LANGS}
+    if audio_format:
+        ydl_opts['format'] = audio_format
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        return ydl.extract_info(url, download=False)
+
+
+def fetch_captions(info: Dict, output_stem: str) -> Optional[str]:
+    """
+    Text of the captions of a probed video, None when it has none
+
+    The caption file itself is kept as output_stem.<lang>.<ext>, outside the
+    video directory so it is not read a second time next to its transcript.
+    """
+    picked = pick_subtitle(info)
+    if picked is None:
+        return None
+    lang, track = picked
+    response = requests.get(track['url'], headers=info.get('http_headers') or {}, timeout=30)
+    response.raise_for_status()
+    response.encoding = response.encoding or 'utf-8'
+    text = subtitle_text(response.text, track['ext'])
+    if not text:
+        return None
+    with open(f"{output_stem}.{lang}.{track['ext']}", 'w', encoding='utf-8') as f:
+        f.write(response.text)
+    return text
+
+
+class CaptionStats:
+    """Videos read from captions and videos transcribed, with the seconds of audio of each"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.captioned_videos = 0
+        self.captioned_seconds = 0.0
+        self.transcribed_videos = 0
+        self.transcribed_seconds = 0.0
+
+    def captioned(self, seconds: float):
+        with self.lock:
+            self.captioned_videos += 1
+            self.captioned_seconds += seconds
+        progress.bus.advance("ASR avoided", seconds / 60, unit="minutes")
+
+    def transcribed(self, seconds: float):
+        with self.lock:
+            self.transcribed_videos += 1
+            self.transcribed_seconds += seconds
+
+    @property
+    def hours_avoided(self) -> float:
+        with self.lock:
+            return self.captioned_seconds / 3600
+
+    def summary(self) -> str:
+        with self.lock:
+            if not self.captioned_videos and not self.transcribed_videos:
+                return "No videos"
+            return (f"Videos: {self.captioned_videos} from captions, {self.transcribed_videos} transcribed, "
+                    f"{self.captioned_seconds / 3600:.2f} ASR hours avoided, "
+                    f"{self.transcribed_seconds / 3600:.2f} hours transcribed")
+
+
+stats = CaptionStats()
@@ -0,0 +1,115 @@
+"""
+Process-wide crawl and LLM budgets
+Every book pipeline running in this process shares the same per-host request rates and the same number of in-flight LLM calls
+"""
+
+import asyncio
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket
+
+    rate tokens are added per second up to capacity. Callers reserve a token
+    and wait out the returned delay, so concurrent callers are served in order.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, tokens: float = 1) -> float:
+        """Take tokens now and return how many seconds the caller has to wait before using them"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self, tokens: float = 1):
+        """Block until tokens are available"""
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self, tokens: float = 1):
+        """Wait for tokens without blocking the event loop"""
+        delay = self.reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def parse_host_rates(spec: str) -> dict:
+    """Parse "host=rate:burst,host=rate" into {host: (rate, burst)}"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        host, _, value = item.partition("=")
+        rate, _, burst = value.partition(":")
+        rates[host.strip()] = (float(rate), int(burst or 1))
+    return rates
+
+
+# douban answers with captchas when hit too often, the default matches the
+# old 10-15s pause between review pages while allowing a short burst
+DEFAULT_CRAWL_RATE = float(os.environ.get("DEEPREADER_CRAWL_RATE", 1 / 12.5))
+DEFAULT_CRAWL_BURST = int(os.environ.get("DEEPREADER_CRAWL_BURST", 5))
+# the Jina reader endpoint allows 20 requests per minute without an API key
+DEFAULT_JINA_RATE = float(os.environ.get("DEEPREADER_JINA_RATE", 20 / 60))
+DEFAULT_JINA_BURST = int(os.environ.get("DEEPREADER_JINA_BURST", 5))
+# number of requests an async crawl keeps in flight
+DEFAULT_CRAWL_CONCURRENCY = int(os.environ.get("DEEPREADER_CRAWL_CONCURRENCY", 4))
+DEFAULT_LLM_CONCURRENCY = int(os.environ.get("DEEPREADER_LLM_CONCURRENCY", 4))
+
+DOUBAN_HOSTS = ("www.douban.com", "book.douban.com")
+JINA_HOST = urlparse(os.environ.get("JINA_READER_URL", "")).netloc
+
+host_rates = {host: (DEFAULT_CRAWL_RATE, DEFAULT_CRAWL_BURST) for host in DOUBAN_HOSTS}
+if JINA_HOST:
+    host_rates[JINA_HOST] = (DEFAULT_JINA_RATE, DEFAULT_JINA_BURST)
+# e.g. DEEPREADER_HOST_RATES="book.douban.com=0.2:3,r.jina.ai=3:10"
+host_rates.update(parse_host_rates(os.environ.get("DEEPREADER_HOST_RATES", "")))
+
+crawl_concurrency_limit = DEFAULT_CRAWL_CONCURRENCY
+llm_slots = threading.BoundedSemaphore(DEFAULT_LLM_CONCURRENCY)
+
+_host_buckets = {}
+_host_buckets_lock = threading.Lock()
+
+
+def bucket_for(url: str) -> TokenBucket:
+    """Token bucket of the host url points to, hosts without a configured rate get the douban default"""
+    host = urlparse(url).netloc
+    with _host_buckets_lock:
+        if host not in _host_buckets:
+            rate, burst = host_rates.get(host, (DEFAULT_CRAWL_RATE, DEFAULT_CRAWL_BURST))
+            _host_buckets[host] = TokenBucket(rate, burst)
+        return _host_buckets[host]
+
+
+def configure(crawl_rate: float = None, crawl_burst: int = None, crawl_concurrency: int = None,
+              llm_concurrency: int = None):
+    """Resize the shared budgets, call before any pipeline starts"""
+    global crawl_concurrency_limit, llm_slots
+    if crawl_rate is not None or crawl_burst is not None:
+        for host in DOUBAN_HOSTS:
+            rate, burst = host_rates[host]
+            host_rates[host] = (crawl_rate or rate, crawl_burst or burst)
+        with _host_buckets_lock:
+            for host in DOUBAN_HOSTS:
+                _host_buckets.pop(host, None)
+    if crawl_concurrency is not None:
+        crawl_concurrency_limit = crawl_concurrency
+    if llm_concurrency is not None:
+        llm_slots = threading.BoundedSemaphore(llm_concurrency)
@@ -0,0 +1,484 @@
+"""
+Long-lived Whisper transcription server
+
+Loading a Whisper model takes seconds and gigabytes, so one server process
+loads it once and transcribes every video of every book back-to-back. Clients
+send jobs over a local socket (multiprocessing.connection), the first client
+starts the server when none is running. When the server cannot be used the
+model is loaded once in the calling process instead.
+
+    python reader/transcriber.py serve [--model large-v3] [--device auto]
+    python reader/transcriber.py audio.mp3 ...
+    python reader/transcriber.py benchmark audio.mp3 [--workers 1,2,4,8]
+"""
+
+import argparse
+import os
+import secrets
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.connection import Client, Listener
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+import audio
+from disk_cache import CACHE_DIR
+
+WHISPER_MODEL = os.environ.get("DEEPREADER_WHISPER_MODEL", "large-v3")
+# auto picks cuda when available and falls back to cpu
+WHISPER_DEVICE = os.environ.get("DEEPREADER_WHISPER_DEVICE", "auto")
+# a unix socket path, or host:port
+TRANSCRIBE_ADDRESS = os.environ.get("DEEPREADER_TRANSCRIBE_ADDRESS", os.path.join(CACHE_DIR, "transcriber.sock"))
+# unset uses a random key kept in AUTHKEY_PATH, only an explicit key allows a host:port address
+TRANSCRIBE_AUTHKEY = os.environ.get("DEEPREADER_TRANSCRIBE_AUTHKEY")
+AUTHKEY_PATH = os.path.join(CACHE_DIR, "transcriber.key")
+# auto starts a server when none answers, off always transcribes in-process
+TRANSCRIBE_SERVER = os.environ.get("DEEPREADER_TRANSCRIBE_SERVER", "auto")
+# an idle server exits after this many seconds and frees the model, 0 keeps it forever
+TRANSCRIBE_IDLE_SECONDS = float(os.environ.get("DEEPREADER_TRANSCRIBE_IDLE", 1800))
+# how long a client waits for a server it started to accept connections
+SERVER_START_SECONDS = 30
+# chunked splits long audio at silence and transcribes the chunks in parallel processes,
+# whole runs one model on the whole file, auto uses chunked on cpu and whole on cuda
+ASR_MODE = os.environ.get("DEEPREADER_ASR_MODE", "auto")
+# processes of the chunked mode, 0 picks as many as the cores and the free memory allow
+ASR_WORKERS = int(os.environ.get("DEEPREADER_ASR_WORKERS", 0))
+# every process loads its own model, at most this many are started when the count is picked
+ASR_MAX_WORKERS = 4
+# resident memory of one loaded model on cpu (GB), large models need about 10
+MODEL_MEMORY_GB = {"tiny": 1, "base": 1, "small": 2, "medium": 5, "turbo": 6}
+LARGE_MODEL_MEMORY_GB = 10
+
+
+def parse_address(value: str):
+    """host:port becomes a TCP address, anything else is a unix socket path"""
+    host, _, port = value.rpartition(":")
+    if host and port.isdigit() and not value.startswith("/"):
+        return host, int(port)
+    return value
+
+
+def load_authkey() -> bytes:
+    """
+    Key the server and its clients authenticate with
+
+    DEEPREADER_TRANSCRIBE_AUTHKEY when set, otherwise a random key created on
+    first use in AUTHKEY_PATH, readable by its owner only.
+    """
+    if TRANSCRIBE_AUTHKEY:
+        return TRANSCRIBE_AUTHKEY.encode("utf-8")
+    os.makedirs(os.path.dirname(AUTHKEY_PATH), exist_ok=True)
+    try:
+        fd = os.open(AUTHKEY_PATH, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        pass
+    else:
+        with os.fdopen(fd, "w") as f:
+            f.write(secrets.token_hex(32))
+    with open(AUTHKEY_PATH) as f:
+        return f.read().strip().encode("utf-8")
+
+
+def resolve_authkey(address, authkey: Optional[bytes] = None) -> bytes:
+    """
+    authkey, or the configured one for a parsed address
+
+    Requests are pickles, so anyone holding the key can run code in the
+    server. A TCP address is refused unless the key was set on purpose.
+    """
+    if authkey is not None:
+        return authkey
+    if not isinstance(address, str) and not TRANSCRIBE_AUTHKEY:
+        raise ValueError(f"Transcription server on {address[0]}:{address[1]} needs "
+                         f"DEEPREADER_TRANSCRIBE_AUTHKEY to be set")
+    return load_authkey()
+
+
+def detect_device() -> str:
+    try:
+        import torch
+    except ImportError:
+        return "cpu"
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def load_model(model_name: str, device: str):
+    import whisper
+    print(f"Loading Whisper {model_name} on {device}...")
+    start = time.time()
+    model = whisper.load_model(model_name, device=device)
+    print(f"Whisper {model_name} loaded in {time.time() - start:.1f}s")
+    return model
+
+
+def available_memory_gb(meminfo: str = "/proc/meminfo") -> Optional[float]:
+    """
+    Memory that can be given to new processes, None where the platform does not report it
+
+    MemAvailable counts the page cache the kernel would drop, the sysconf free
+    pages only count unused memory and are far lower on a busy machine.
+    """
+    try:
+        with open(meminfo) as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024 ** 2
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / 1024 ** 3
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def default_workers(model_name: str = WHISPER_MODEL) -> int:
+    """
+    Processes of the chunked mode when DEEPREADER_ASR_WORKERS is not set
+
+    One model per process, so the count is limited by the free memory, the
+    cores and ASR_MAX_WORKERS, whichever is smallest.
+    """
+    model_gb = MODEL_MEMORY_GB.get(model_name.split(".")[0], LARGE_MODEL_MEMORY_GB)
+    workers = min(os.cpu_count() or 1, ASR_MAX_WORKERS)
+    memory = available_memory_gb()
+    if memory is not None:
+        # leave room for the rest of the process
+        workers = min(workers, int(memory * 0.8 // model_gb))
+    return max(workers, 1)
+
+
+# ----------------------------------------------------------------------
+# chunked transcription
+# ----------------------------------------------------------------------
+_worker_model = None
+
+
+def _init_worker(model_name: str, threads: int, load: Callable):
+    """Runs once in every pool process, the model then serves all of its chunks"""
+    global _worker_model
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    _worker_model = load(model_name, "cpu")
+
+
+def _transcribe_chunk(index: int, samples: np.ndarray, offset: float, language: Optional[str], options: Dict):
+    options = dict(options, fp16=False)
+    result = _worker_model.transcribe(samples, language=language, **options)
+    segments = [{"start": segment["start"] + offset, "end": segment["end"] + offset, "text": segment["text"]}
+                for segment in result.get("segments", [])]
+    return index, result["text"], segments
+
+
+def stitch(chunks: List) -> Dict:
+    """Text and segments of (index, text, segments) chunk results, in audio order"""
+    chunks = sorted(chunks, key=lambda chunk: chunk[0])
+    return {"text": "".join(text for _, text, _ in chunks),
+            "segments": [segment for _, _, segments in chunks for segment in segments]}
+
+
+class ChunkedTranscriber:
+    """
+    Transcribes long audio on many cores
+
+    The audio is cut at silences into chunks of about audio.ASR_CHUNK_SECONDS,
+    which run on a pool of processes with one model each. Segment timestamps
+    are shifted by the start of their chunk, so the stitched result reads like
+    a transcription of the whole file.
+    """
+
+    def __init__(self, model_name: str = WHISPER_MODEL, workers: int = ASR_WORKERS,
+                 chunk_seconds: float = audio.ASR_CHUNK_SECONDS, load: Callable = load_model):
+        cores = os.cpu_count() or 1
+        self.workers = workers or default_workers(model_name)
+        self.chunk_seconds = chunk_seconds
+        self.model_name = model_name
+        # the cores are shared out so the processes do not oversubscribe them
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                        initargs=(model_name, max(cores // self.workers, 1), load))
+
+    def warm_up(self):
+        """Start every process and load its model"""
+        silence = np.zeros(audio.SAMPLE_RATE, dtype=np.float32)
+        futures = [self.pool.submit(_transcribe_chunk, i, silence, 0.0, None, {}) for i in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def transcribe_samples(self, samples: np.ndarray, language: Optional[str] = "zh", **options) -> Dict:
+        futures = [
+            self.pool.submit(_transcribe_chunk, index, samples[start:end], start / audio.SAMPLE_RATE, language, options)
+            for index, (start, end) in enumerate(audio.split_at_silence(samples, chunk_seconds=self.chunk_seconds))
+        ]
+        return stitch([future.result() for future in futures])
+
+    def transcribe(self, audio_path: str, language: Optional[str] = "zh", **options) -> Dict:
+        return self.transcribe_samples(audio.load_audio(audio_path), language, **options)
+
+    def close(self):
+        self.pool.shutdown()
+
+
+class WhisperRunner:
+    """One model (or one pool of models), loaded on first use and shared by every request of the process"""
+
+    def __init__(self, model_name: str = WHISPER_MODEL, device: str = WHISPER_DEVICE,
+                 load: Callable = load_model, mode: str = ASR_MODE, workers: int = ASR_WORKERS):
+        self.model_name = model_name
+        self.device = detect_device() if device == "auto" else device
+        self.load = load
+        self.chunked = mode == "chunked" or (mode == "auto" and self.device == "cpu")
+        self.workers = workers
+        self._model = None
+        self._chunked = None
+        # whisper models are not safe to share between threads
+        self.lock = threading.Lock()
+        self.served = 0
+
+    def transcribe(self, audio_path: str, language: Optional[str] = "zh", **options) -> Dict:
+        """{"text": ..., "segments": [...]} of an audio file"""
+        if self.chunked:
+            with self.lock:
+                if self._chunked is None:
+                    self._chunked = ChunkedTranscriber(self.model_name, self.workers, load=self.load)
+            # the pool queues the chunks of concurrent requests itself
+            result = self._chunked.transcribe(audio_path, language, **options)
+            with self.lock:
+                self.served += 1
+            return result
+        with self.lock:
+            if self._model is None:
+                self._model = self.load(self.model_name, self.device)
+            options.setdefault("fp16", self.device == "cuda")
+            result = self._model.transcribe(audio_path, language=language, **options)
+            self.served += 1
+        return {"text": result["text"], "segments": result.get("segments", [])}
+
+
+class TranscriptionServer:
+    """
+    Serves transcription requests from any number of clients
+
+    Each connection gets a thread, the transcriptions themselves run one at a
+    time on the single model. Requests are dicts:
+    {"op": "transcribe", "path": ..., "language": ..., "options": {...}},
+    {"op": "ping"} and {"op": "shutdown"}.
+    """
+
+    def __init__(self, address: str = TRANSCRIBE_ADDRESS, runner: Optional[WhisperRunner] = None,
+                 idle_timeout: float = TRANSCRIBE_IDLE_SECONDS, authkey: Optional[bytes] = None):
+        self.address = parse_address(address)
+        self.runner = runner or WhisperRunner()
+        self.idle_timeout = idle_timeout
+        self.authkey = resolve_authkey(self.address, authkey)
+        self.stopping = threading.Event()
+        self.active = 0
+        self.last_activity = time.monotonic()
+        self.lock = threading.Lock()
+
+    def handle(self, request: Dict) -> Dict:
+        op = request.get("op")
+        if op == "ping":
+            return {"model": self.runner.model_name, "device": self.runner.device, "served": self.runner.served}
+        if op == "shutdown":
+            # stopped once the reply is sent
+            return {"ok": True}
+        if op == "transcribe":
+            return self.runner.transcribe(request["path"], request.get("language", "zh"), **request.get("options", {}))
+        return {"error": f"unknown op {op!r}"}
+
+    def _serve_connection(self, conn):
+        with conn:
+            while True:
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    return
+                with self.lock:
+                    self.active += 1
+                try:
+                    reply = self.handle(request)
+                except Exception as e:
+                    reply = {"error": f"{type(e).__name__}: {e}"}
+                finally:
+                    with self.lock:
+                        self.active -= 1
+                        self.last_activity = time.monotonic()
+                conn.send(reply)
+                if request.get("op") == "shutdown":
+                    self.stop()
+                    return
+
+    def _watch_idle(self):
+        while not self.stopping.wait(min(self.idle_timeout, 60)):
+            with self.lock:
+                idle = self.active == 0 and time.monotonic() - self.last_activity > self.idle_timeout
+            if idle:
+                print(f"Transcription server idle for {self.idle_timeout:.0f}s, exiting")
+                self.stop()
+
+    def stop(self):
+        """Stop accepting connections, the blocked accept() is woken by a connection of our own"""
+        if self.stopping.is_set():
+            return
+        self.stopping.set()
+        try:
+            Client(self.address, authkey=self.authkey).close()
+        except OSError:
+            pass
+
+    def serve_forever(self, ready: Optional[threading.Event] = None):
+        if isinstance(self.address, str):
+            os.makedirs(os.path.dirname(os.path.abspath(self.address)), exist_ok=True)
+            if os.path.exists(self.address):
+                try:
+                    Client(self.address, authkey=self.authkey).close()
+                    print(f"A transcription server already listens on {self.address}")
+                    return
+                except OSError:
+                    # left behind by a server that did not exit cleanly
+                    os.remove(self.address)
+        listener = Listener(self.address, authkey=self.authkey)
+        print(f"Transcription server listening on {self.address} "
+              f"(model {self.runner.model_name}, device {self.runner.device})")
+        if ready is not None:
+            ready.set()
+        if self.idle_timeout:
+            threading.Thread(target=self._watch_idle, daemon=True).start()
+        try:
+            while not self.stopping.is_set():
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    if not self.stopping.is_set():
+                        print(f"Rejected transcription client: {e}")
+                    continue
+                if self.stopping.is_set():
+                    conn.close()
+                    break
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+
+
+# ----------------------------------------------------------------------
+# client side
+# ----------------------------------------------------------------------
+_local_runner = None
+_local_runner_lock = threading.Lock()
+
+
+def local_runner() -> WhisperRunner:
+    """In-process model for when no server can be reached"""
+    global _local_runner
+    with _local_runner_lock:
+        if _local_runner is None:
+            _local_runner = WhisperRunner()
+        return _local_runner
+
+
+def request(payload: Dict, address: str = TRANSCRIBE_ADDRESS, authkey: Optional[bytes] = None) -> Dict:
+    """Send one request to the server, raises OSError when none is listening"""
+    address = parse_address(address)
+    with Client(address, authkey=resolve_authkey(address, authkey)) as conn:
+        conn.send(payload)
+        reply = conn.recv()
+    if "error" in reply:
+        raise RuntimeError(reply["error"])
+    return reply
+
+
+def start_server(address: str = TRANSCRIBE_ADDRESS, authkey: Optional[bytes] = None) -> bool:
+    """Start a detached server process and wait until it answers"""
+    subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "serve", "--address", address],
+        stdin=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    deadline = time.monotonic() + SERVER_START_SECONDS
+    while time.monotonic() < deadline:
+        try:
+            request({"op": "ping"}, address, authkey)
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+_start_lock = threading.Lock()
+
+
+def transcribe(audio_path: str, language: Optional[str] = "zh", address: str = TRANSCRIBE_ADDRESS,
+               server: str = TRANSCRIBE_SERVER, **options) -> str:
+    """Text of an audio file, from the transcription server when possible"""
+    payload = {"op": "transcribe", "path": os.path.abspath(audio_path), "language": language, "options": options}
+    if server != "off":
+        try:
+            return request(payload, address)["text"]
+        except OSError:
+            pass
+        # several threads may find no server at the same time, only one starts it
+        with _start_lock:
+            try:
+                return request(payload, address)["text"]
+            except OSError:
+                if server == "auto" and start_server(address):
+                    return request(payload, address)["text"]
+        print("Transcription server unavailable, transcribing in-process")
+    return local_runner().transcribe(audio_path, language, **options)["text"]
+
+
+def benchmark(audio_path: str, worker_counts: List[int], model_name: str = WHISPER_MODEL,
+              chunk_seconds: float = audio.ASR_CHUNK_SECONDS):
+    """Print the real-time factor of the chunked mode for each number of processes"""
+    samples = audio.load_audio(audio_path)
+    duration = len(samples) / audio.SAMPLE_RATE
+    chunks = len(audio.split_at_silence(samples, chunk_seconds=chunk_seconds))
+    print(f"{audio_path}: {duration:.0f}s of audio in {chunks} chunks, model {model_name}, {os.cpu_count()} cores")
+    print(f"{'workers':>8} {'load':>8} {'time':>9} {'RTF':>7} {'x realtime':>11}")
+    for workers in worker_counts:
+        transcriber = ChunkedTranscriber(model_name, workers, chunk_seconds)
+        try:
+            start = time.time()
+            transcriber.warm_up()
+            loaded = time.time() - start
+            start = time.time()
+            transcriber.transcribe_samples(samples)
+            elapsed = time.time() - start
+        finally:
+            transcriber.close()
+        # RTF is processing time per second of audio, below 1 is faster than real time
+        print(f"{workers:>8} {loaded:>7.1f}s {elapsed:>8.1f}s {elapsed / duration:>7.3f} {duration / elapsed:>10.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DeepReader Whisper transcription server")
+    parser.add_argument("files", nargs="*", help="audio files to transcribe, or 'serve' to run the server")
+    parser.add_argument("--model", default=WHISPER_MODEL, help="Whisper model size")
+    parser.add_argument("--device", default=WHISPER_DEVICE, help="cuda, cpu or auto")
+    parser.add_argument("--address", default=TRANSCRIBE_ADDRESS, help="unix socket path or host:port")
+    parser.add_argument("--idle", type=float, default=TRANSCRIBE_IDLE_SECONDS, help="exit after this many idle seconds, 0 never")
+    parser.add_argument("--workers", default=None, help="benchmark: comma separated process counts")
+    args = parser.parse_args()
+
+    if args.files == ["serve"]:
+        TranscriptionServer(args.address, WhisperRunner(args.model, args.device), args.idle).serve_forever()
+        return
+    if args.files[:1] == ["benchmark"]:
+        cores = os.cpu_count() or 1
+        counts = [int(n) for n in args.workers.split(",")] if args.workers else \
+            sorted({n for n in (1, 2, 4, 8, 16, cores) if n <= cores})
+        for path in args.files[1:]:
+            benchmark(path, counts, args.model)
+        return
+    for path in args.files:
+        print(f"{path}:\n{transcribe(path, address=args.address)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,11 @@
-import nerif
 import os
+
+import llm
+from manifest import Manifest, file_hash
+
 model_name = "gpt-4o-mini"
+# bump when the cleaning prompt changes so existing outputs are redone
+PROMPT_VERSION = "1"
 
 def clean_video(file_name):
     with open(file_name, "r") as f:
@@ -20,8 +25,7 @@ Text: {text}
 
 Fixed Text:
     """
-    model = nerif.model.SimpleChatModel(model_name)
-    response = model.chat(prompt)
+    response = llm.chat(model_name, prompt, prompt_version=PROMPT_VERSION)
     
     # print(response)
     
@@ -44,10 +48,20 @@ def clean_all_video_files(path="example_book/video"):
         print(f"No video transcript files found in {path}")
         return
     
+    manifest = Manifest.for_book(os.path.dirname(os.path.normpath(path)))
     for file in txt_files:
         if file.endswith(".txt") and not file.endswith("_cleaned.txt"):
-            print(f"Cleaning {file}")
-            clean_video(f"{path}/{file}")
+            clean_video_file(path, file, manifest)
+
+def clean_video_file(path, file, manifest):
+    """Clean one transcript of the video directory path unless the manifest has it cleaned already"""
+    inputs = {"file": file_hash(f"{path}/{file}"), "model": model_name, "prompt_version": PROMPT_VERSION}
+    if manifest.is_done("video_clean", file, inputs):
+        print(f"{file} already cleaned, skipping")
+        return
+    print(f"Cleaning {file}")
+    clean_video(f"{path}/{file}")
+    manifest.record("video_clean", file, inputs, [f"{path}/{file}".replace(".txt", "_cleaned.txt")])
 
 if __name__ == "__main__":
     clean_all_video_files()
@@ -1,13 +1,79 @@
 import yt_dlp
-import whisper
 import os
+import subprocess
 from urllib.parse import urlparse, parse_qs
 
+import requests
+
+import audio
+import progress
+import subtitles
+import transcriber
+import video_cleaning
+from manifest import Manifest
+from pipeline import StreamPipeline, StreamStage
+
+# fetch only the audio stream and decode it once to 16 kHz PCM, "0" downloads the mp4 and converts it to mp3
+AUDIO_ONLY = os.environ.get("DEEPREADER_VIDEO_AUDIO_ONLY", "1") != "0"
+# keep a compact opus copy of the fetched audio, the PCM is deleted after transcription
+AUDIO_ARCHIVE = os.environ.get("DEEPREADER_AUDIO_ARCHIVE", "0") == "1"
+# smallest audio-only stream that is still good for speech, a muxed stream when the site has none
+AUDIO_FORMAT = "bestaudio[abr<=160]/bestaudio/best"
+STREAM_CHUNK_BYTES = 256 * 1024
+# worker threads of the download, transcribe and clean stages of process_video_urls
+VIDEO_DOWNLOAD_WORKERS = int(os.environ.get("DEEPREADER_VIDEO_DOWNLOAD_WORKERS", 1))
+VIDEO_TRANSCRIBE_WORKERS = int(os.environ.get("DEEPREADER_VIDEO_TRANSCRIBE_WORKERS", 1))
+VIDEO_CLEAN_WORKERS = int(os.environ.get("DEEPREADER_VIDEO_CLEAN_WORKERS", 2))
+# videos that may wait for each stage, fetched media beyond this blocks the download stage
+VIDEO_QUEUE_SIZE = int(os.environ.get("DEEPREADER_VIDEO_QUEUE_SIZE", 1))
+
+
+def stream_chunks(stream, on_bytes=None):
+    """
+    Bytes of a resolved yt-dlp format, read over HTTP
+
+    Sites that throttle long responses (YouTube) ask for ranged requests of
+    downloader_options.http_chunk_size, those are made one after another.
+    """
+    headers = dict(stream.get("http_headers") or {})
+    # only an exact length ends the ranges early, filesize_approx may be short
+    size = stream.get("filesize")
+    range_size = (stream.get("downloader_options") or {}).get("http_chunk_size")
+    start = 0
+    while True:
+        if range_size:
+            headers["Range"] = f"bytes={start}-{start + range_size - 1}"
+        with requests.get(stream["url"], headers=headers, stream=True, timeout=30) as response:
+            # a file whose length is a multiple of the range size ends with a range past its end
+            if response.status_code == 416 and start > 0 and (size is None or start >= size):
+                return
+            response.raise_for_status()
+            # a server that ignores Range sends the whole file at once
+            whole = response.status_code != 206
+            # "bytes 0-399/1000" tells the length of the file
+            total = response.headers.get("Content-Range", "").rpartition("/")[2]
+            if total.isdigit():
+                size = int(total)
+            received = 0
+            for chunk in response.iter_content(STREAM_CHUNK_BYTES):
+                received += len(chunk)
+                if on_bytes:
+                    on_bytes(len(chunk))
+                yield chunk
+        start += received
+        # a full range means there may be more, a short one is the end of the file
+        if not range_size or whole or received < range_size or (size and start >= size):
+            return
+
+
 class VideoCrawler:
-    def __init__(self, output_dir):
-        """Initialize VideoCrawler with output directory"""
+    def __init__(self, output_dir, subtitles_first=None):
+        """Initialize VideoCrawler with output directory, subtitles_first defaults to subtitles.SUBTITLES_FIRST"""
         self.output_dir = output_dir
         self.base_dir = f"{output_dir}/video"
+        # raw caption files stay out of base_dir, whose .txt and subtitle files are all read as reviews
+        self.captions_dir = f"{output_dir}/captions"
+        self.subtitles_first = subtitles.SUBTITLES_FIRST if subtitles_first is None else subtitles_first
         os.makedirs(self.base_dir, exist_ok=True)
 
     def get_video_id(self, url):
@@ -38,7 +104,6 @@ class VideoCrawler:
         if 'bilibili.com' in url:
             # Use lux for bilibili downloads
             try:
-                import subprocess
                 temp_video_directory = temp_video_path.rsplit('/', 1)[0]
                 temp_video_name = temp_video_path.rsplit('/', 1)[1]
                 cmd = ['lux', '-o', f"{temp_video_directory}", '-O', temp_video_name, url]
@@ -72,6 +137,7 @@ class VideoCrawler:
                     'preferredcodec': 'mp3',
                     'preferredquality': '192',
                 }],
+                'progress_hooks': [progress.download_hook(progress.task_name(self.output_dir, "video download"))],
             }
             
             try:
@@ -88,62 +154,181 @@ class VideoCrawler:
                     os.remove(temp_video_path)
                 return False
 
+    @staticmethod
+    def audio_stream(info):
+        """Format dict (url, headers, protocol) of the audio stream selected in a yt-dlp info dict"""
+        # a format merged from several streams lists them, the audio one is wanted
+        for stream in info.get('requested_formats') or [info]:
+            if stream.get('acodec') != 'none':
+                return stream
+        return info
+
+    def resolve_audio_stream(self, url):
+        """yt-dlp format dict (url, headers, protocol) of the audio stream of a video"""
+        ydl_opts = {'format': AUDIO_FORMAT, 'quiet': True, 'noplaylist': True}
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            return self.audio_stream(ydl.extract_info(url, download=False))
+
+    def fetch_audio(self, url, wav_path, archive_path=None, info=None):
+        """
+        Fetch only the audio of a video and decode it once to 16 kHz mono PCM
+
+        The stream is piped into a single ffmpeg process while it downloads,
+        which also writes the opus archive when archive_path is given. info is
+        the dict of a probe with AUDIO_FORMAT, the video is only looked up
+        again without it.
+        """
+        task = progress.task_name(self.output_dir, "video download")
+        # an interrupted fetch must not leave a wav that looks complete
+        part_path = wav_path.rsplit('.', 1)[0] + '.part.wav'
+        try:
+            stream = self.audio_stream(info) if info else None
+            if not stream or not stream.get('url'):
+                stream = self.resolve_audio_stream(url)
+            if stream.get('protocol', 'https') in ('http', 'https'):
+                size = stream.get('filesize') or stream.get('filesize_approx')
+                if size:
+                    progress.bus.expect(task, size, unit="bytes")
+                chunks = stream_chunks(stream, lambda n: progress.bus.advance(task, n, unit="bytes"))
+                audio.decode_stream(chunks, part_path, archive_path)
+            else:
+                # manifests (m3u8, dash) are followed by ffmpeg itself
+                subprocess.run(audio.decode_command(stream['url'], part_path, archive_path,
+                                                    stream.get('http_headers')), check=True)
+            os.replace(part_path, wav_path)
+            return True
+        except Exception as e:
+            print(f"Error fetching audio: {e}")
+            for path in (part_path, archive_path):
+                if path and os.path.exists(path):
+                    os.remove(path)
+            return False
+
     def transcribe_audio(self, audio_path):
-        """Transcribe audio using Whisper model"""
+        """Transcribe audio with the shared Whisper server, the model is loaded once for all videos"""
         try:
-            model = whisper.load_model("large-v3", device="cuda")
-            # Load and preprocess audio with Chinese language
-            result = model.transcribe(audio_path, language="zh")
-            print(result["text"])
+            # Chinese audio
+            text = transcriber.transcribe(audio_path, language="zh")
+            print(text)
             
-            return result["text"]
+            return text
         except Exception as e:
             print(f"Error transcribing audio: {e}")
             return None
 
-    def process_video_url(self, url):
-        """Process a single video URL"""
+    def fetch_video(self, url):
+        """
+        Download stage of one video: its captions, or else its audio
+
+        Returns {"url", "video_id", "text_path", "audio_path", "duration"},
+        audio_path is None when the transcript already exists. None means the
+        video cannot be processed.
+        """
         video_id = self.get_video_id(url)
         if not video_id:
             print(f"Could not extract video ID from URL: {url}")
-            return
+            return None
         
-        audio_path = f"{self.base_dir}/{video_id}.mp3"
+        mp3_path = f"{self.base_dir}/{video_id}.mp3"
+        wav_path = f"{self.base_dir}/{video_id}.wav"
+        archive_path = f"{self.base_dir}/{video_id}.opus" if AUDIO_ARCHIVE else None
         text_path = f"{self.base_dir}/{video_id}.txt"
+        video = {"url": url, "video_id": video_id, "text_path": text_path, "audio_path": None, "duration": 0}
         
-        if os.path.exists(audio_path):
-            print(f"Audio file {audio_path} already exists, skipping download...")
+        if os.path.exists(text_path):
+            print(f"Text file {text_path} already exists, skipping download and transcription...")
+            return video
+        
+        # captions make the media and the transcription unnecessary
+        info = None
+        if self.subtitles_first:
+            try:
+                # the same lookup selects the audio stream in case there are no captions
+                info = subtitles.probe(url, audio_format=AUDIO_FORMAT)
+                video["duration"] = info.get('duration') or 0
+                os.makedirs(self.captions_dir, exist_ok=True)
+                captions = subtitles.fetch_captions(info, f"{self.captions_dir}/{video_id}")
+            except Exception as e:
+                print(f"Error reading captions: {e}")
+                captions = None
+            if captions:
+                with open(text_path, 'w', encoding='utf-8') as f:
+                    f.write(captions)
+                subtitles.stats.captioned(video["duration"])
+                print(f"Captions saved to {text_path}, no transcription needed")
+                return video
+        
+        # an mp3 of an earlier run or a PCM left by an interrupted one is used as is
+        video["audio_path"] = next((path for path in (mp3_path, wav_path) if os.path.exists(path)), None)
+        if video["audio_path"]:
+            print(f"Audio file {video['audio_path']} already exists, skipping download...")
         else:
-            # Download audio
             print(f"Downloading audio from {url}...")
-            if not self.download_audio(url, audio_path):
-                return
+            if AUDIO_ONLY and self.fetch_audio(url, wav_path, archive_path, info):
+                video["audio_path"] = wav_path
+            elif self.download_audio(url, mp3_path):
+                video["audio_path"] = mp3_path
+            else:
+                return None
+        return video
+
+    def transcribe_video(self, video):
+        """Transcribe stage of one video, returns the video once its transcript exists, else None"""
+        audio_path = video["audio_path"]
+        if audio_path is None:
+            return video
         
         # Transcribe audio
-        if os.path.exists(text_path):
-            print(f"Text file {text_path} already exists, skipping transcription...")
-            transcription = open(text_path, 'r', encoding='utf-8').read()
-        else:
-            print("Transcribing audio...")
-            transcription = self.transcribe_audio(audio_path)
-            
-        if transcription:
-            # Save transcription
-            with open(text_path, 'w', encoding='utf-8') as f:
-                f.write(transcription)
-            print(f"Transcription saved to {text_path}")
-        else:
+        print(f"Transcribing {audio_path}...")
+        transcription = self.transcribe_audio(audio_path)
+        
+        if not transcription:
             print("Transcription failed")
+            return None
+        # Save transcription
+        with open(video["text_path"], 'w', encoding='utf-8') as f:
+            f.write(transcription)
+        print(f"Transcription saved to {video['text_path']}")
+        subtitles.stats.transcribed(video["duration"])
+        # the PCM only feeds the transcriber, the opus copy is the archive
+        if audio_path.endswith(".wav"):
+            os.remove(audio_path)
+        return dict(video, audio_path=None)
 
-    def process_video_urls(self, url_file):
-        """Process a list of video URLs"""
-        
+    def clean_video(self, video):
+        """Clean stage of one video, the LLM-corrected transcript is written next to it"""
+        manifest = Manifest.for_book(self.output_dir)
+        video_cleaning.clean_video_file(self.base_dir, os.path.basename(video["text_path"]), manifest)
+        return video
+
+    def process_video_url(self, url):
+        """Process a single video URL"""
+        video = self.fetch_video(url)
+        if video:
+            self.transcribe_video(video)
+
+    def process_video_urls(self, url_file, clean=True, download_workers=None, transcribe_workers=None,
+                           clean_workers=None, queue_size=None):
+        """
+        Process a list of video URLs as a pipeline
+
+        Video N+1 downloads while video N is transcribed and video N-1 is
+        cleaned. At most queue_size fetched videos wait for transcription, so
+        the media on disk stays bounded however long the list is.
+        """
         with open(url_file, "r") as f:
             video_urls = f.readlines()
-        video_urls = [url.strip() for url in video_urls]
-        for url in video_urls:
-            print(f"\nProcessing {url}")
-            self.process_video_url(url)
+        # the generated link files have comment lines
+        video_urls = [url.strip() for url in video_urls if url.strip() and not url.startswith('#')]
+        queue_size = queue_size or VIDEO_QUEUE_SIZE
+        stages = [
+            StreamStage("download", self.fetch_video, download_workers or VIDEO_DOWNLOAD_WORKERS, queue_size),
+            StreamStage("transcribe", self.transcribe_video, transcribe_workers or VIDEO_TRANSCRIBE_WORKERS, queue_size),
+        ]
+        if clean:
+            stages.append(StreamStage("clean", self.clean_video, clean_workers or VIDEO_CLEAN_WORKERS, queue_size))
+        pipeline = StreamPipeline(stages, task=progress.task_name(self.output_dir, "video"), unit="videos")
+        return pipeline.run(video_urls)
 
 # Example usage
 if __name__ == "__main__":
@@ -0,0 +1,12 @@
+"""
+Shared test configuration
+"""
+
+import os
+import sys
+
+# reader modules import each other by plain module name (python reader/main.py)
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'reader'))
+# website pages import their helpers by plain module name too (streamlit run website/Home.py)
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'website'))
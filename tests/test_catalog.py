@@ -0,0 +1,39 @@
+"""
+Tests for the website book catalog
+"""
+
+import os
+
+from website import catalog
+
+
+class TestBookCatalog:
+    """Test cases for BookCatalog"""
+
+    def test_lists_books_and_picks_up_changes(self, tmp_path):
+        books = catalog.BookCatalog(str(tmp_path))
+        assert books.titles() == []
+
+        books.save("三国演义", "滚滚长江东逝水")
+        (tmp_path / "notes.txt").write_text("not a book", encoding="utf-8")
+        assert books.titles() == ["三国演义"]
+        entry = books.get("三国演义")
+        assert entry.content == "滚滚长江东逝水"
+        assert entry.tokens > 0
+
+        books.save("三国演义", "浪花淘尽英雄")
+        assert books.get("三国演义").content == "浪花淘尽英雄"
+
+        books.delete("三国演义")
+        assert "三国演义" not in books
+
+    def test_unchanged_files_are_not_read_again(self, tmp_path, monkeypatch):
+        books = catalog.BookCatalog(str(tmp_path))
+        books.save("未来简史", "内容")
+        first = books.get("未来简史")
+
+        monkeypatch.setattr(catalog, "count_tokens", lambda text: 1 / 0)
+        assert books.get("未来简史") is first
+
+    def test_missing_directory_is_empty(self, tmp_path):
+        assert len(catalog.BookCatalog(os.path.join(str(tmp_path), "missing"))) == 0
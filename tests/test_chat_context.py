@@ -0,0 +1,54 @@
+"""
+Tests for the token-budgeted chat context
+"""
+
+from website import chat_context
+
+
+def conversation(turns):
+    messages = [{"role": "system", "content": "书籍提示"}]
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"问题 {i}"})
+        messages.append({"role": "assistant", "content": f"回答 {i}"})
+    messages.append({"role": "user", "content": "最新的问题"})
+    return messages
+
+
+class TestChatContext:
+    """Test cases for ChatContext"""
+
+    def test_short_conversation_is_sent_verbatim(self):
+        context = chat_context.ChatContext(lambda summary, messages: 1 / 0, budget=10000, keep_turns=3)
+        messages = conversation(2)
+        assert context.build(messages) == messages
+
+    def test_old_turns_are_folded_into_the_summary(self):
+        folded = []
+
+        def summarize(summary, messages):
+            folded.extend(messages)
+            return "摘要"
+
+        context = chat_context.ChatContext(summarize, budget=10000, keep_turns=2)
+        messages = conversation(5)
+        context.build(messages)
+        context.pending.result()
+
+        sent = context.build(messages)
+
+        # 11 messages after the system prompt, the last 4 are kept verbatim
+        assert len(folded) == 7
+        assert sent[1]["content"].endswith("摘要")
+        assert sent[2:] == messages[-4:]
+
+    def test_budget_drops_the_oldest_messages(self, monkeypatch):
+        monkeypatch.setattr(chat_context, "count_tokens", len)
+        context = chat_context.ChatContext(lambda summary, messages: "", budget=40, keep_turns=10)
+        messages = conversation(5)
+
+        sent = context.build(messages)
+
+        assert sent[0] == messages[0]
+        assert sent[-1] == messages[-1]
+        assert sum(chat_context.message_tokens(message) for message in sent) <= 40
+        assert len(sent) < len(messages)
@@ -39,4 +39,387 @@ class TestDoubanCrawler:
         # For now, just test the method exists
         spider = DoubanBookSpider()
         assert hasattr(spider, 'search_book')
-        assert callable(getattr(spider, 'search_book', None))
\ No newline at end of file
+        assert callable(getattr(spider, 'search_book', None))
+
+class TestAsyncReviewFetch:
+    """Test cases for the concurrent review fetch path"""
+
+    @pytest.fixture
+    def slow_server(self):
+        """Local HTTP server answering every path after 0.2s"""
+        import threading
+        import time
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                time.sleep(0.2)
+                body = self.path.encode()
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        yield f"http://127.0.0.1:{server.server_port}"
+        server.shutdown()
+
+    def test_reviews_fetched_concurrently_in_order(self, slow_server, monkeypatch, tmp_path):
+        """Four 0.2s pages finish in well under 0.8s and keep their order"""
+        import time
+        import http_cache
+        import throttle
+        from reader import douban_crawler
+
+        monkeypatch.setattr(http_cache, "_http_cache", http_cache.HttpCache(str(tmp_path)))
+        monkeypatch.setattr(douban_crawler, "JINA_READER_URL", "")
+        monkeypatch.setattr(throttle, "crawl_concurrency_limit", 4)
+        monkeypatch.setitem(throttle.host_rates, slow_server.split("//")[1], (100, 10))
+
+        urls = [f"{slow_server}/review/{i}/" for i in range(4)]
+        seen = []
+        start = time.time()
+        reviews = DoubanBookSpider().get_reviews(urls, on_review=lambda url, text: seen.append(url))
+
+        assert time.time() - start < 0.6
+        assert [text for _, text in reviews] == [f"/review/{i}/" for i in range(4)]
+        assert sorted(seen) == urls
+
+    def test_error_and_captcha_pages_are_not_saved(self, monkeypatch, tmp_path):
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        import http_cache
+        import throttle
+        from reader import douban_crawler
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/review/1/"):
+                    self.send_response(403)
+                elif self.path.startswith("/review/2/"):
+                    # blocked crawlers are sent to another host (sec.douban.com)
+                    self.send_response(302)
+                    self.send_header("Location", f"http://localhost:{self.server.server_port}/captcha")
+                else:
+                    self.send_response(200)
+                body = self.path.encode()
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_port}"
+        monkeypatch.setattr(http_cache, "_http_cache", http_cache.HttpCache(str(tmp_path)))
+        monkeypatch.setattr(douban_crawler, "JINA_READER_URL", "")
+        monkeypatch.setitem(throttle.host_rates, base.split("//")[1], (100, 10))
+        saved = []
+
+        urls = [f"{base}/review/{i}/" for i in range(1, 4)]
+        try:
+            reviews = DoubanBookSpider().get_reviews(urls, on_review=lambda url, text: saved.append(url))
+        finally:
+            server.shutdown()
+
+        assert [url for url, _ in reviews] == saved == [f"{base}/review/3/"]
+
+
+class TestIncrementalCrawl:
+    """Test cases for refreshing a book that was crawled before"""
+
+    def test_pagination_stops_at_the_watermark(self, monkeypatch):
+        """Reading newest first stops at the first review not newer than the last crawl"""
+        from reader import douban_crawler
+
+        pages = [
+            "https://book.douban.com/review/40/ https://book.douban.com/review/35/",
+            "https://book.douban.com/review/31/ https://book.douban.com/review/30/ https://book.douban.com/review/12/",
+            "https://book.douban.com/review/5/",
+        ]
+        requested = []
+
+        class Page:
+            def __init__(self, text):
+                self.text = text
+
+        def fake_get(url, revalidate=False):
+            requested.append(url)
+            assert revalidate and "sort=time" in url
+            return Page(pages[len(requested) - 1])
+
+        monkeypatch.setattr(douban_crawler, "JINA_READER_URL", "")
+        spider = DoubanBookSpider()
+        monkeypatch.setattr(spider, "_get", fake_get)
+
+        # 12 was never hot and so never crawled, it is still older than the watermark
+        urls = spider.get_review_urls("https://book.douban.com/subject/1/", watermark=30)
+
+        assert len(requested) == 2
+        assert [douban_crawler.extract_review_id(url) for url in urls] == ["40", "35", "31"]
+
+    def test_refresh_records_the_highest_id(self, tmp_path, monkeypatch):
+        from reader import douban_crawler
+
+        monkeypatch.chdir(tmp_path)
+        book_url = "https://book.douban.com/subject/1/"
+        # the crawler imports manifest by its plain name
+        manifest = douban_crawler.Manifest.for_book("书")
+        manifest.record("douban_watermark", book_url, {}, known_reviews=1, max_review_id=30)
+        seen = []
+
+        spider = DoubanBookSpider()
+        monkeypatch.setattr(spider, "search_book", lambda name: [book_url])
+
+        def fake_review_urls(url, watermark=None):
+            seen.append(watermark)
+            return ["https://book.douban.com/review/41/", "https://book.douban.com/review/37/"]
+
+        monkeypatch.setattr(spider, "get_review_urls", fake_review_urls)
+        monkeypatch.setattr(spider, "get_reviews", lambda urls, on_review=None: [
+            on_review(url, "书评") or [url, "书评"] for url in urls])
+
+        assert spider.crawl_book("书", limit=1) == ["41", "37"]
+        assert seen == [30]
+        assert manifest.get("douban_watermark", book_url)["max_review_id"] == 41
+
+
+class TestVideoAudio:
+    """Test cases for the audio-only video path"""
+
+    @pytest.fixture
+    def media_server(self):
+        """Local HTTP server of 1000 bytes that answers Range requests, without Content-Range"""
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        body = bytes(range(250)) * 4
+        ranges = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                start, end = 0, len(body) - 1
+                if "Range" in self.headers:
+                    ranges.append(self.headers["Range"])
+                    start, end = (int(n) for n in self.headers["Range"].split("=")[1].split("-"))
+                    if start >= len(body):
+                        self.send_response(416)
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                part = body[start:end + 1]
+                self.send_response(206 if "Range" in self.headers else 200)
+                self.send_header("Content-Length", str(len(part)))
+                self.end_headers()
+                self.wfile.write(part)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        yield f"http://127.0.0.1:{server.server_port}/audio.m4a", body, ranges
+        server.shutdown()
+
+    def test_stream_is_read_in_ranges(self, media_server):
+        from reader import video_crawler
+
+        url, body, ranges = media_server
+        received = []
+        stream = {"url": url, "downloader_options": {"http_chunk_size": 400}}
+        data = b"".join(video_crawler.stream_chunks(stream, received.append))
+
+        assert data == body
+        assert sum(received) == len(body)
+        assert ranges == ["bytes=0-399", "bytes=400-799", "bytes=800-1199"]
+
+    def test_range_past_the_end_ends_the_stream(self, media_server):
+        """A length that is a multiple of the range size makes the last request start at the end"""
+        from reader import video_crawler
+
+        url, body, ranges = media_server
+        stream = {"url": url, "downloader_options": {"http_chunk_size": 500}}
+        data = b"".join(video_crawler.stream_chunks(stream))
+
+        assert data == body
+        assert ranges == ["bytes=0-499", "bytes=500-999", "bytes=1000-1499"]
+
+    def test_decode_writes_pcm_and_archive_in_one_run(self):
+        from reader import audio
+
+        cmd = audio.decode_command("pipe:0", "v.wav", "v.opus", headers={"Referer": "https://www.bilibili.com"})
+
+        assert cmd.count("ffmpeg") == 1 and cmd.count("-i") == 1
+        assert cmd[cmd.index("-headers") + 1] == "Referer: https://www.bilibili.com\r\n"
+        assert cmd[cmd.index("-ar") + 1] == "16000" and "v.wav" in cmd
+        assert cmd[-1] == "v.opus" and "libopus" in cmd
+        assert "-nostdin" not in cmd
+        assert "libopus" not in audio.decode_command("in.mp4", "v.wav")
+
+    def test_pcm_is_read_without_ffmpeg(self, tmp_path):
+        import wave
+        import numpy as np
+        from reader import audio
+
+        path = str(tmp_path / "v.wav")
+        with wave.open(path, "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(audio.SAMPLE_RATE)
+            f.writeframes(np.array([0, 16384, -32768], dtype=np.int16).tobytes())
+
+        assert audio.load_audio(path).tolist() == [0.0, 0.5, -1.0]
+
+    def test_pcm_is_removed_after_transcription(self, tmp_path, monkeypatch):
+        from reader import video_crawler
+
+        def fake_fetch(url, wav_path, archive_path=None, info=None):
+            open(wav_path, "wb").close()
+            return True
+
+        crawler = video_crawler.VideoCrawler(str(tmp_path / "book"))
+        monkeypatch.setattr(video_crawler.subtitles, "probe", lambda url, audio_format=None: {})
+        monkeypatch.setattr(crawler, "fetch_audio", fake_fetch)
+        monkeypatch.setattr(crawler, "transcribe_audio", lambda path: f"text of {os.path.basename(path)}")
+
+        crawler.process_video_url("https://www.bilibili.com/video/BV1xx411c7mD")
+
+        assert sorted(os.listdir(crawler.base_dir)) == ["bilibili_BV1xx411c7mD.txt"]
+        with open(f"{crawler.base_dir}/bilibili_BV1xx411c7mD.txt", encoding="utf-8") as f:
+            assert f.read() == "text of bilibili_BV1xx411c7mD.wav"
+
+
+class TestSubtitlesFirst:
+    """Test cases for reading captions instead of transcribing"""
+
+    def test_uploaded_captions_win_over_automatic_ones(self):
+        from reader import subtitles
+
+        info = {
+            "subtitles": {"danmaku": [{"ext": "xml", "url": "d"}], "zh-Hans": [{"ext": "json", "url": "j"}]},
+            "automatic_captions": {"zh": [{"ext": "vtt", "url": "a"}]},
+        }
+        assert subtitles.pick_subtitle(info) == ("zh", {"ext": "vtt", "url": "a"})
+
+        info["subtitles"]["zh-CN"] = [{"ext": "vtt", "url": "v"}, {"ext": "srt", "url": "s"}]
+        assert subtitles.pick_subtitle(info) == ("zh-CN", {"ext": "srt", "url": "s"})
+        assert subtitles.pick_subtitle({"subtitles": {"en": [{"ext": "srt", "url": "e"}]}}) is None
+
+    def test_captioned_video_is_not_downloaded(self, tmp_path, monkeypatch):
+        from reader import video_crawler
+
+        stats = video_crawler.subtitles.CaptionStats()
+        monkeypatch.setattr(video_crawler.subtitles, "stats", stats)
+        monkeypatch.setattr(video_crawler.subtitles, "probe", lambda url, audio_format=None: {"duration": 1800, "subtitles": {}})
+        def fake_fetch_captions(info, stem):
+            with open(f"{stem}.zh-CN.srt", "w", encoding="utf-8") as f:
+                f.write("1\n00:00:01,000 --> 00:00:02,000\n第一句\n")
+            return "第一句\n第二句"
+
+        monkeypatch.setattr(video_crawler.subtitles, "fetch_captions", fake_fetch_captions)
+        crawler = video_crawler.VideoCrawler(str(tmp_path / "book"))
+        monkeypatch.setattr(crawler, "fetch_audio", lambda *args: pytest.fail("media was downloaded"))
+        monkeypatch.setattr(crawler, "download_audio", lambda *args: pytest.fail("media was downloaded"))
+
+        crawler.process_video_url("https://www.bilibili.com/video/BV1")
+
+        with open(f"{crawler.base_dir}/bilibili_BV1.txt", encoding="utf-8") as f:
+            assert f.read() == "第一句\n第二句"
+        assert stats.hours_avoided == 0.5
+        assert stats.captioned_videos == 1 and stats.transcribed_videos == 0
+        # the raw captions are not read again as a subtitle of the video directory
+        assert os.listdir(crawler.base_dir) == ["bilibili_BV1.txt"]
+        assert os.listdir(crawler.captions_dir) == ["bilibili_BV1.zh-CN.srt"]
+
+    def test_explicit_subtitles_only_overrides_the_setting(self, tmp_path, monkeypatch):
+        from reader import bilibili_auto_crawler, video_crawler
+
+        probed = []
+        monkeypatch.setattr(video_crawler.subtitles, "SUBTITLES_FIRST", False)
+        monkeypatch.setattr(video_crawler.subtitles, "stats", video_crawler.subtitles.CaptionStats())
+        monkeypatch.setattr(video_crawler.subtitles, "probe", lambda url, audio_format=None: probed.append(url) or {"duration": 60})
+        monkeypatch.setattr(video_crawler.subtitles, "fetch_captions", lambda info, stem: "字幕")
+        # bilibili_auto_crawler imports the module by its plain name
+        monkeypatch.setattr(bilibili_auto_crawler.VideoCrawler, "fetch_audio",
+                            lambda *args: pytest.fail("audio was downloaded"))
+        monkeypatch.chdir(tmp_path)
+
+        video = {"title": "书评", "url": "https://www.bilibili.com/video/BV3"}
+        files = bilibili_auto_crawler.BilibiliAutoCrawler().download_videos([video], "书", 1, subtitles_only=True)
+
+        assert probed == [video["url"]]
+        assert files == ["书/video/video_1_info.json"]
+        assert (tmp_path / "书" / "video" / "bilibili_BV3.txt").read_text(encoding="utf-8") == "字幕"
+
+    def test_video_without_captions_is_transcribed(self, tmp_path, monkeypatch):
+        from reader import video_crawler
+
+        stats = video_crawler.subtitles.CaptionStats()
+        monkeypatch.setattr(video_crawler.subtitles, "stats", stats)
+        monkeypatch.setattr(video_crawler.subtitles, "probe", lambda url, audio_format=None: {"duration": 600})
+        def fake_fetch(url, wav_path, archive_path=None, info=None):
+            open(wav_path, "wb").close()
+            return True
+
+        crawler = video_crawler.VideoCrawler(str(tmp_path / "book"))
+        monkeypatch.setattr(crawler, "fetch_audio", fake_fetch)
+        monkeypatch.setattr(crawler, "transcribe_audio", lambda path: "转录")
+
+        crawler.process_video_url("https://www.bilibili.com/video/BV2")
+
+        assert stats.hours_avoided == 0
+        assert (stats.transcribed_videos, stats.transcribed_seconds) == (1, 600)
+        assert "0.17 hours transcribed" in stats.summary()
+
+    def test_probed_stream_is_fetched_without_a_second_lookup(self, tmp_path, monkeypatch):
+        from reader import video_crawler
+
+        audio_format = {"format_id": "30216", "url": "https://cdn/a.m4s", "protocol": "https", "acodec": "mp4a"}
+        info = {"duration": 60, "requested_formats": [audio_format]}
+        probes = []
+        decoded = []
+        monkeypatch.setattr(video_crawler.subtitles, "stats", video_crawler.subtitles.CaptionStats())
+        monkeypatch.setattr(video_crawler.subtitles, "probe",
+                            lambda url, audio_format=None: probes.append(audio_format) or info)
+        monkeypatch.setattr(video_crawler, "stream_chunks", lambda stream, on_bytes=None: [stream["url"]])
+        def fake_decode(chunks, path, archive_path=None):
+            decoded.extend(chunks)
+            open(path, "wb").close()
+
+        monkeypatch.setattr(video_crawler.audio, "decode_stream", fake_decode)
+        crawler = video_crawler.VideoCrawler(str(tmp_path / "book"))
+        monkeypatch.setattr(crawler, "resolve_audio_stream", lambda url: pytest.fail("video was looked up twice"))
+
+        video = crawler.fetch_video("https://www.bilibili.com/video/BV4")
+
+        assert probes == [video_crawler.AUDIO_FORMAT]
+        assert decoded == ["https://cdn/a.m4s"]
+        assert video["audio_path"].endswith("bilibili_BV4.wav")
+
+    def test_srt_text(self):
+        from reader import subtitles
+
+        content = "1\n00:00:01,000 --> 00:00:02,000\n你好\n\n2\n00:00:02,000 --> 00:00:03,000\n世界\n"
+        assert subtitles.subtitle_text(content, "srt") == "你好\n世界"
+
+    def test_url_file_runs_through_all_stages(self, tmp_path, monkeypatch):
+        from reader import video_crawler
+
+        url_file = tmp_path / "links.txt"
+        url_file.write_text("# 《书》相关视频链接\n\nhttps://www.bilibili.com/video/BV1\nhttps://www.bilibili.com/video/BV2\n",
+                            encoding="utf-8")
+        crawler = video_crawler.VideoCrawler(str(tmp_path / "book"))
+        monkeypatch.setattr(crawler, "fetch_video", lambda url: {"url": url, "audio_path": None})
+        monkeypatch.setattr(crawler, "clean_video", lambda video: dict(video, cleaned=True))
+
+        results = crawler.process_video_urls(str(url_file))
+
+        assert sorted(video["url"] for video in results) == [
+            "https://www.bilibili.com/video/BV1", "https://www.bilibili.com/video/BV2"]
+        assert all(video["cleaned"] for video in results)
@@ -0,0 +1,51 @@
+"""
+Tests for the batched embedding service
+"""
+
+import threading
+from types import SimpleNamespace
+
+from disk_cache import DiskCache
+from website import embeddings
+
+
+class FakeClient:
+    def __init__(self):
+        self.batches = []
+        self.lock = threading.Lock()
+        self.embeddings = SimpleNamespace(create=self.create)
+
+    def create(self, model, input, **kwargs):
+        with self.lock:
+            self.batches.append(list(input))
+        # answer out of order, the service sorts by index
+        return SimpleNamespace(data=[
+            SimpleNamespace(index=i, embedding=[float(len(text)), 1.0])
+            for i, text in reversed(list(enumerate(input)))
+        ])
+
+
+class TestEmbeddingService:
+    """Test cases for EmbeddingService"""
+
+    def test_batches_dedupes_and_caches(self, tmp_path):
+        client = FakeClient()
+        cache = DiskCache(str(tmp_path), 1 << 20)
+        service = embeddings.EmbeddingService(client, "m", cache=cache, batch_size=2, max_workers=2)
+        texts = ["a", "bb", "a", "ccc", "dddd", ""]
+
+        vectors = service.embed(texts)
+
+        assert vectors.shape == (6, 2)
+        assert vectors[:, 0].tolist() == [1, 2, 1, 3, 4, 1]
+        # five distinct texts in batches of two
+        assert sorted(len(batch) for batch in client.batches) == [1, 2, 2]
+
+        again = embeddings.EmbeddingService(client, "m", cache=cache)
+        assert again.embed(["bb", "eeeee"])[:, 0].tolist() == [2, 5]
+        assert client.batches[-1] == ["eeeee"]
+        assert (again.hits, again.misses) == (1, 1)
+
+    def test_pack_batches_respects_the_token_limit(self, monkeypatch):
+        monkeypatch.setattr(embeddings, "count_tokens", len)
+        assert embeddings.pack_batches(["x" * 40] * 5, batch_size=10, batch_tokens=100) == [[0, 1], [2, 3], [4]]
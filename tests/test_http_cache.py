@@ -0,0 +1,99 @@
+"""
+Tests for the crawler HTTP response cache
+"""
+
+from reader.disk_cache import DiskCache
+from reader.http_cache import HttpCache, normalize_url
+
+
+class FakeResponse:
+    def __init__(self, status_code, content=b"", headers=None, url=None):
+        self.status_code = status_code
+        self.url = url
+        self.content = content
+        self.headers = headers or {}
+        self.encoding = "utf-8"
+        self.apparent_encoding = "utf-8"
+
+
+class FakeSession:
+    """Records requests and answers from a queue of FakeResponses"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def get(self, url, headers=None, params=None, timeout=None):
+        self.requests.append(headers or {})
+        return self.responses.pop(0)
+
+
+class TestHttpCache:
+    """Test cases for HttpCache"""
+
+    def test_normalize_url(self):
+        assert normalize_url("HTTPS://Book.Douban.com:443/review/1/?b=2&a=1#top") == \
+            "https://book.douban.com/review/1/?a=1&b=2"
+        assert normalize_url("https://api.bilibili.com/x", {"page": 1}) == "https://api.bilibili.com/x?page=1"
+
+    def test_fresh_entry_skips_network(self, tmp_path):
+        cache = HttpCache(str(tmp_path), enabled=True)
+        session = FakeSession(FakeResponse(200, "书评".encode()))
+
+        first = cache.get("https://book.douban.com/review/1/", session=session)
+        second = cache.get("https://book.douban.com/review/1/", session=session)
+
+        assert len(session.requests) == 1
+        assert second.from_cache and second.text == first.text == "书评"
+
+    def test_stale_entry_is_revalidated(self, tmp_path):
+        """An expired entry sends If-None-Match and a 304 keeps the cached body"""
+        cache = HttpCache(str(tmp_path), ttls=[(r".", 0)], enabled=True)
+        session = FakeSession(FakeResponse(200, b"page", {"ETag": '"v1"'}), FakeResponse(304))
+
+        cache.get("https://book.douban.com/subject/1/reviews", session=session)
+        response = cache.get("https://book.douban.com/subject/1/reviews", session=session)
+
+        assert session.requests[1]["If-None-Match"] == '"v1"'
+        assert response.text == "page"
+
+    def test_errors_are_not_cached(self, tmp_path):
+        cache = HttpCache(str(tmp_path), enabled=True)
+        session = FakeSession(FakeResponse(403), FakeResponse(200, b"ok"))
+
+        assert cache.get("https://www.douban.com/search?q=x", session=session).status_code == 403
+        assert cache.get("https://www.douban.com/search?q=x", session=session).text == "ok"
+
+    def test_anti_bot_pages_are_not_cached(self, tmp_path):
+        """douban's captcha page comes with status 200 after a redirect to sec.douban.com"""
+        cache = HttpCache(str(tmp_path), enabled=True)
+        url = "https://book.douban.com/review/1/"
+        session = FakeSession(
+            FakeResponse(200, b"captcha", url="https://sec.douban.com/c?r=" + url),
+            FakeResponse(200, "<title>禁止访问</title>".encode(), url=url),
+            FakeResponse(200, "书评".encode(), url=url),
+        )
+
+        assert cache.get(url, session=session).text == "captcha"
+        assert not cache.get(url, session=session).from_cache
+        assert cache.get(url, session=session).text == "书评"
+        assert cache.get(url, session=session).from_cache
+        assert len(session.requests) == 3
+
+
+class TestDiskCache:
+    """Test cases for the LRU store"""
+
+    def test_least_recently_used_is_evicted(self, tmp_path):
+        import os
+        store = DiskCache(str(tmp_path), max_bytes=25)
+        store.put("aa01", b"x" * 10, {})
+        store.put("bb02", b"x" * 10, {})
+        # make aa01 the oldest access, then read bb02
+        os.utime(tmp_path / "aa" / "aa01.bin", (1, 1))
+        store.get("bb02")
+        store.put("cc03", b"x" * 10, {})
+
+        assert store.get("aa01") is None
+        assert store.get("bb02") is not None
+        assert store.get("cc03") is not None
@@ -0,0 +1,65 @@
+"""
+Tests for the durable background job queue
+"""
+
+from website import jobs
+from website import job_worker
+
+
+class TestJobStore:
+    """Test cases for JobStore and the worker loop"""
+
+    def test_job_runs_once_and_its_events_are_replayed(self, tmp_path, monkeypatch):
+        # the worker changes into the directory the job was submitted from
+        monkeypatch.chdir(tmp_path)
+        store = jobs.JobStore(str(tmp_path / "jobs.sqlite3"))
+        job_id = store.submit("add_book", {"book_name": "活着"}, cwd=str(tmp_path))
+        assert store.get(job_id)["status"] == jobs.QUEUED
+
+        job = store.claim(pid=123)
+        assert job["id"] == job_id and job["status"] == jobs.RUNNING
+        # a second worker finds nothing to do
+        assert store.claim(pid=456) is None
+
+        def handler(params, events):
+            events.put({"type": "update", "step": "爬取豆瓣", "progress": 10, "log": "开始"})
+            events.put({"type": "update", "step": "生成报告", "progress": 80, "log": params["book_name"]})
+
+        job_worker.run_job(store, job, {"add_book": handler})
+
+        job = store.get(job_id)
+        assert (job["status"], job["step"], job["progress"]) == (jobs.DONE, "生成报告", 80)
+        events = store.events(job_id)
+        assert [event["type"] for event in events] == ["update", "update", "success"]
+        # a reattached page only asks for what it has not seen
+        assert store.events(job_id, after=events[0]["event_id"]) == events[1:]
+
+    def test_failures_and_confirmations_are_recorded(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        store = jobs.JobStore(str(tmp_path / "jobs.sqlite3"))
+        failing = store.submit("add_book", {}, cwd=str(tmp_path))
+        waiting = store.submit("add_book", {}, cwd=str(tmp_path))
+
+        def crash(params, events):
+            raise RuntimeError("network down")
+
+        def ask(params, events):
+            events.put({"type": "need_confirmation", "confirmation_type": "book_selection", "books_info": []})
+
+        job_worker.run_job(store, store.claim(pid=1), {"add_book": crash})
+        job_worker.run_job(store, store.claim(pid=1), {"add_book": ask})
+
+        assert store.get(failing)["status"] == jobs.FAILED
+        assert store.get(failing)["error"] == "network down"
+        assert store.get(waiting)["status"] == jobs.WAITING
+
+    def test_jobs_of_a_dead_worker_are_failed(self, tmp_path, monkeypatch):
+        store = jobs.JobStore(str(tmp_path / "jobs.sqlite3"))
+        job_id = store.submit("add_book", {}, cwd=str(tmp_path))
+        store.claim(pid=999999)
+        store.heartbeat(999999)
+        monkeypatch.setattr(jobs, "pid_alive", lambda pid: False)
+
+        assert store.live_workers() == []
+        store.fail_orphans()
+        assert store.get(job_id)["status"] == jobs.FAILED
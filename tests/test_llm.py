@@ -0,0 +1,170 @@
+"""
+Tests for the LLM gateway
+"""
+
+import openai
+import pytest
+
+from reader import llm
+
+
+class FakeModel:
+    calls = 0
+
+    def __init__(self, model_name, **kwargs):
+        self.model_name = model_name
+
+    def chat(self, prompt):
+        FakeModel.calls += 1
+        return f"{self.model_name}: {prompt}"
+
+
+class TestLLMCache:
+    """Test cases for the cache underneath llm.chat"""
+
+    def test_same_request_is_answered_from_cache(self, tmp_path, monkeypatch):
+        FakeModel.calls = 0
+        cache = llm.LLMCache(str(tmp_path), max_bytes=1 << 20)
+        monkeypatch.setattr(llm, "_llm_cache", cache)
+        monkeypatch.setattr(llm.nerif.model, "SimpleChatModel", FakeModel)
+        # models pooled by earlier tests in this thread are not fakes
+        monkeypatch.setattr(llm, "_models", llm.threading.local())
+
+        assert llm.chat("model-a", "hello", prompt_version="1") == "model-a: hello"
+        assert llm.chat("model-a", "hello", prompt_version="1") == "model-a: hello"
+        assert FakeModel.calls == 1
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        # a new prompt version or another model is a different request
+        llm.chat("model-a", "hello", prompt_version="2")
+        llm.chat("model-b", "hello", prompt_version="1")
+        assert FakeModel.calls == 3
+
+    def test_size_cap_evicts_old_replies(self, tmp_path):
+        cache = llm.LLMCache(str(tmp_path), max_bytes=1000)
+        for i in range(5):
+            cache.put(llm.LLMCache.key("m", str(i)), "x" * 300, "m")
+        assert cache.store.total_bytes <= 1000
+        assert cache.get(llm.LLMCache.key("m", "4")) == "x" * 300
+
+
+    def test_completions_are_not_cached_unless_asked(self, tmp_path, monkeypatch):
+        replies = iter(["first", "second", "third", "fourth"])
+
+        class Completions:
+            def create(self, **kwargs):
+                message = type("Message", (), {"content": next(replies)})
+                choice = type("Choice", (), {"message": message})
+                return type("Completion", (), {"choices": [choice], "usage": None})
+
+        client = type("Client", (), {"chat": type("Chat", (), {"completions": Completions()})})
+        cache = llm.LLMCache(str(tmp_path), max_bytes=1 << 20)
+        monkeypatch.setattr(llm, "_llm_cache", cache)
+        monkeypatch.setattr(llm, "get_client", lambda: client)
+        messages = [{"role": "user", "content": "推荐三个问题"}]
+
+        assert llm.complete(messages, "model-a") == "first"
+        assert llm.complete(messages, "model-a") == "second"
+        assert cache.store.total_bytes == 0
+        assert llm.complete(messages, "model-a", use_cache=True) == "third"
+        assert llm.complete(messages, "model-a", use_cache=True) == "third"
+
+
+class TestRetries:
+    """Test cases for the retry and accounting around every call"""
+
+    def test_transient_errors_are_retried(self, monkeypatch):
+        sleeps = []
+        monkeypatch.setattr(llm.time, "sleep", sleeps.append)
+        attempts = []
+
+        def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise ConnectionError("reset")
+            return "ok"
+
+        assert llm.with_retries(flaky, retries=3, backoff=1) == "ok"
+        assert len(attempts) == 3
+        # full jitter below the doubling backoff
+        assert 0 <= sleeps[0] <= 1 and 0 <= sleeps[1] <= 2
+
+    def test_bad_requests_are_not_retried(self, monkeypatch):
+        monkeypatch.setattr(llm.time, "sleep", lambda delay: None)
+        attempts = []
+
+        def bad():
+            attempts.append(1)
+            raise ValueError("bad prompt")
+
+        with pytest.raises(ValueError):
+            llm.with_retries(bad, retries=3)
+        assert len(attempts) == 1
+
+    def test_rate_limits_are_retryable(self):
+        request = openai._base_client.httpx.Request("POST", "http://localhost")
+        response = openai._base_client.httpx.Response(429, request=request)
+        assert llm.is_retryable(openai.RateLimitError("slow down", response=response, body=None))
+        response = openai._base_client.httpx.Response(400, request=request)
+        assert not llm.is_retryable(openai.BadRequestError("bad", response=response, body=None))
+
+    def test_abandoned_calls_are_not_retried(self, monkeypatch):
+        release = llm.threading.Event()
+        attempts = []
+
+        class HangingModel:
+            def __init__(self, model_name, **kwargs):
+                pass
+
+            def chat(self, prompt):
+                attempts.append(prompt)
+                release.wait(5)
+                return "late"
+
+        monkeypatch.setattr(llm.nerif.model, "SimpleChatModel", HangingModel)
+        monkeypatch.setattr(llm, "_models", llm.threading.local())
+        monkeypatch.setattr(llm.time, "sleep", lambda delay: None)
+        try:
+            with pytest.raises(TimeoutError):
+                llm.chat("model-a", "PROMPT", timeout=0.05, use_cache=False)
+        finally:
+            release.set()
+        # the abandoned thread still holds its request, no second one is sent beside it
+        assert attempts == ["PROMPT"]
+        assert llm.is_retryable(TimeoutError("socket timed out"))
+
+    def test_retry_does_not_resend_the_failed_prompt(self, tmp_path, monkeypatch):
+        sent = []
+
+        class StatefulModel:
+            """Keeps the conversation until a reply succeeds, like nerif's SimpleChatModel"""
+            failures = 1
+
+            def __init__(self, model_name, **kwargs):
+                self.messages = [{"role": "system", "content": "system"}]
+
+            def chat(self, prompt):
+                self.messages.append({"role": "user", "content": prompt})
+                sent.append([message["content"] for message in self.messages])
+                if StatefulModel.failures:
+                    StatefulModel.failures -= 1
+                    raise ConnectionError("reset")
+                self.messages = self.messages[:1]
+                return "ok"
+
+        monkeypatch.setattr(llm, "_llm_cache", llm.LLMCache(str(tmp_path), max_bytes=1 << 20))
+        monkeypatch.setattr(llm.nerif.model, "SimpleChatModel", StatefulModel)
+        monkeypatch.setattr(llm, "_models", llm.threading.local())
+        monkeypatch.setattr(llm.time, "sleep", lambda delay: None)
+
+        assert llm.chat("model-a", "PROMPT-A", use_cache=False) == "ok"
+        assert llm.chat("model-a", "PROMPT-B", use_cache=False) == "ok"
+        assert sent == [["system", "PROMPT-A"], ["system", "PROMPT-A"], ["system", "PROMPT-B"]]
+
+    def test_usage_is_counted_per_model(self):
+        usage = llm.Usage()
+        usage.add("model-a", 10, 5)
+        usage.add("model-a", 1, 1)
+        usage.add("model-b", 2, 0)
+        assert usage.models["model-a"] == {"requests": 2, "prompt_tokens": 11, "completion_tokens": 6}
+        assert "model-b: 1 requests" in usage.summary()
@@ -0,0 +1,43 @@
+"""
+Tests for the per-book checkpoint manifest
+"""
+
+from reader.manifest import Manifest, file_hash
+
+
+class TestManifest:
+    """Test cases for Manifest"""
+
+    def test_record_and_reload(self, tmp_path):
+        """Records survive a new Manifest instance reading the same book"""
+        output = tmp_path / "douban_1_cleaned.txt"
+        output.write_text("cleaned")
+        Manifest(str(tmp_path)).record("douban_clean", "douban_1.txt", {"file": "abc"}, [str(output)])
+
+        manifest = Manifest(str(tmp_path))
+        assert manifest.is_done("douban_clean", "douban_1.txt", {"file": "abc"})
+        assert manifest.keys("douban_clean") == ["douban_1.txt"]
+
+    def test_changed_inputs_are_not_done(self, tmp_path):
+        """A different file hash, model or prompt version invalidates the record"""
+        manifest = Manifest(str(tmp_path))
+        manifest.record("parse", "a.txt", {"file": "abc", "model": "m1", "prompt_version": "1"})
+
+        assert manifest.is_done("parse", "a.txt", {"file": "abc", "model": "m1", "prompt_version": "1"})
+        assert not manifest.is_done("parse", "a.txt", {"file": "abc", "model": "m2", "prompt_version": "1"})
+        assert not manifest.is_done("parse", "b.txt", {"file": "abc", "model": "m1", "prompt_version": "1"})
+
+    def test_missing_output_is_not_done(self, tmp_path):
+        manifest = Manifest(str(tmp_path))
+        manifest.record("report", "report", {"file": "abc"}, [str(tmp_path / "gone.md")])
+        assert not manifest.is_done("report", "report", {"file": "abc"})
+
+    def test_for_book_shares_instances(self, tmp_path):
+        assert Manifest.for_book(str(tmp_path)) is Manifest.for_book(str(tmp_path / "."))
+
+    def test_file_hash_follows_content(self, tmp_path):
+        path = tmp_path / "review.txt"
+        path.write_text("one")
+        first = file_hash(str(path))
+        path.write_text("two")
+        assert file_hash(str(path)) != first
@@ -0,0 +1,101 @@
+"""
+Tests for review parsing
+"""
+
+import json
+import time
+
+from reader import parse_review
+
+
+def write_review(tmp_path):
+    path = tmp_path / "douban_1_cleaned.txt"
+    path.write_text("一篇书评", encoding="utf-8")
+    return str(path)
+
+
+class TestReviewParser:
+    """Test cases for review_parser"""
+
+    def test_single_structured_call(self, tmp_path, monkeypatch):
+        calls = []
+        reply = {"story": "剧情", "feeling": "感受", "evaluation": "评价", "thinking": "思考"}
+
+        def fake_chat(model_name, prompt, **kwargs):
+            calls.append(prompt)
+            return "```json\n" + json.dumps(reply, ensure_ascii=False) + "\n```"
+
+        monkeypatch.setattr(parse_review.llm, "chat", fake_chat)
+
+        assert parse_review.review_parser(write_review(tmp_path)) == ("剧情", "感受", "评价", "思考")
+        assert len(calls) == 1
+
+    def test_falls_back_to_per_section_prompts(self, tmp_path, monkeypatch):
+        """A reply missing a section is rejected by the schema"""
+        calls = []
+
+        def fake_chat(model_name, prompt, **kwargs):
+            calls.append(prompt)
+            if len(calls) == 1:
+                return json.dumps({"story": "剧情"})
+            return f"section {len(calls)}"
+
+        monkeypatch.setattr(parse_review.llm, "chat", fake_chat)
+
+        result = parse_review.review_parser(write_review(tmp_path))
+
+        assert result == ("section 2", "section 3", "section 4", "section 5")
+        assert len(calls) == 5
+
+    def test_malformed_structured_reply_is_not_cached(self, tmp_path, monkeypatch):
+        """A rerun asks the model again instead of replaying the bad JSON"""
+        good = json.dumps({"story": "剧情", "feeling": "感受", "evaluation": "评价", "thinking": "思考"},
+                          ensure_ascii=False)
+        structured_replies = ["not json", good]
+        structured_calls = []
+
+        class FakeModel:
+            def __init__(self, model_name, **kwargs):
+                pass
+
+            def chat(self, prompt):
+                if prompt.startswith(parse_review.prompt_structured.split("<REVIEW>")[0]):
+                    structured_calls.append(prompt)
+                    return structured_replies[len(structured_calls) - 1]
+                return "section"
+
+        llm = parse_review.llm
+        monkeypatch.setattr(llm, "_llm_cache", llm.LLMCache(str(tmp_path / "cache"), max_bytes=1 << 20))
+        monkeypatch.setattr(llm.nerif.model, "SimpleChatModel", FakeModel)
+        monkeypatch.setattr(llm, "_models", llm.threading.local())
+        review_file = write_review(tmp_path)
+
+        assert parse_review.review_parser(review_file) == ("section",) * 4
+        assert parse_review.review_parser(review_file) == ("剧情", "感受", "评价", "思考")
+        # the valid reply is cached now
+        assert parse_review.review_parser(review_file) == ("剧情", "感受", "评价", "思考")
+        assert len(structured_calls) == 2
+
+
+class TestParseReviews:
+    """Test cases for parse_reviews"""
+
+    def test_output_order_does_not_depend_on_completion_order(self, tmp_path, monkeypatch):
+        douban = tmp_path / "website"
+        douban.mkdir()
+        for review_id in ("3", "1", "2"):
+            (douban / f"{review_id}_cleaned.txt").write_text(f"review {review_id}", encoding="utf-8")
+
+        def fake_chat(model_name, prompt, **kwargs):
+            review_id = prompt.split("review ")[1][0]
+            # the first review finishes last
+            time.sleep(0.2 if review_id == "1" else 0.01)
+            return json.dumps({"story": review_id, "feeling": "", "evaluation": "", "thinking": ""})
+
+        monkeypatch.setattr(parse_review.llm, "chat", fake_chat)
+        monkeypatch.chdir(tmp_path)
+
+        parse_review.parse_reviews(str(tmp_path), max_workers=3)
+
+        rows = json.loads((tmp_path / "parsed_data.json").read_text(encoding="utf-8"))
+        assert [row[2] for row in rows] == ["1", "2", "3"]
@@ -0,0 +1,79 @@
+"""
+Tests for the producer-consumer stage pipeline
+"""
+
+import threading
+import time
+
+from reader.pipeline import StreamPipeline, StreamStage
+
+
+def sleeper(delay, log=None, name=""):
+    def step(item):
+        if log is not None:
+            log.append((name, item))
+        time.sleep(delay)
+        return item
+    return step
+
+
+class TestStreamPipeline:
+    """Test cases for StreamPipeline"""
+
+    def test_stages_overlap(self):
+        """Three items through three 0.1s stages take about 5 steps instead of 9"""
+        pipeline = StreamPipeline([StreamStage(name, sleeper(0.1)) for name in ("download", "transcribe", "clean")],
+                                  verbose=False)
+        start = time.time()
+        results = pipeline.run([1, 2, 3])
+
+        assert time.time() - start < 0.75
+        assert results == [1, 2, 3]
+
+    def test_full_queue_holds_back_the_producer(self):
+        """A slow consumer keeps the fast stage at most queue_size + workers items ahead"""
+        fetched = []
+        consumed = []
+        in_flight = []
+        lock = threading.Lock()
+
+        def fetch(item):
+            with lock:
+                fetched.append(item)
+                in_flight.append(len(fetched) - len(consumed))
+            return item
+
+        def consume(item):
+            time.sleep(0.05)
+            with lock:
+                consumed.append(item)
+            return item
+
+        pipeline = StreamPipeline([StreamStage("fetch", fetch), StreamStage("consume", consume, queue_size=1)],
+                                  verbose=False)
+        pipeline.run(range(8))
+
+        assert sorted(consumed) == list(range(8))
+        # one being consumed, one waiting in the queue, one held by the fetch worker
+        assert max(in_flight) <= 3
+
+    def test_failed_items_are_dropped(self):
+        def check(item):
+            if item == 2:
+                raise ValueError("bad item")
+            return item
+
+        pipeline = StreamPipeline([StreamStage("check", check, workers=2), StreamStage("keep", lambda item: item)],
+                                  verbose=False)
+        results = pipeline.run([1, 2, 3])
+
+        assert sorted(results) == [1, 3]
+        assert [(stage, item) for stage, item, _ in pipeline.errors] == [("check", 2)]
+
+    def test_none_drops_an_item(self):
+        log = []
+        pipeline = StreamPipeline([StreamStage("filter", lambda item: item if item % 2 else None),
+                                   StreamStage("keep", sleeper(0, log, "keep"), workers=3)], verbose=False)
+
+        assert sorted(pipeline.run(range(6))) == [1, 3, 5]
+        assert sorted(item for _, item in log) == [1, 3, 5]
@@ -0,0 +1,72 @@
+"""
+Tests for the progress event bus
+"""
+
+import threading
+import time
+
+from reader import progress
+from reader import scheduler
+
+
+class TestProgressBus:
+    """Test cases for ProgressBus"""
+
+    def test_rate_and_eta_follow_the_published_work(self):
+        bus = progress.ProgressBus()
+        bus.start("book: parse", total=10, unit="reviews")
+        bus.advance("book: parse", 4, unit="reviews")
+        task = bus.get("book: parse")
+        task.started -= 2  # four reviews in two seconds
+
+        now = task.started + 2
+        assert abs(task.rate(now) - 2) < 1e-6
+        assert abs(task.eta(now) - 3) < 1e-6
+        assert task.fraction == 0.4
+
+        bus.finish("book: parse")
+        assert bus.get("book: parse").describe().endswith("done")
+        assert bus.snapshot(include_finished=False) == []
+
+    def test_wait_blocks_until_something_is_published(self):
+        bus = progress.ProgressBus()
+        seen = bus.version
+        woken = []
+
+        def subscriber():
+            woken.append(bus.wait(seen, timeout=5))
+
+        thread = threading.Thread(target=subscriber)
+        thread.start()
+        time.sleep(0.1)
+        assert not woken
+        bus.advance("LLM", 120, unit="tokens")
+        thread.join(timeout=1)
+        assert woken == [seen + 1]
+        # nothing new, the wait only ends at the timeout
+        assert bus.wait(bus.version, timeout=0.05) == bus.version
+
+    def test_download_hook_publishes_byte_deltas(self, monkeypatch):
+        bus = progress.ProgressBus()
+        monkeypatch.setattr(progress, "bus", bus)
+        hook = progress.download_hook("book: video download")
+        hook({"status": "downloading", "filename": "a.mp4", "downloaded_bytes": 1024, "total_bytes": 4096})
+        hook({"status": "downloading", "filename": "a.mp4", "downloaded_bytes": 3072, "total_bytes": 4096})
+        hook({"status": "finished", "filename": "a.mp4", "downloaded_bytes": 4096, "total_bytes": 4096})
+
+        task = bus.get("book: video download")
+        assert (task.done, task.total, task.unit) == (4096, 4096, "bytes")
+        assert "4.0 KB/4.0 KB" in task.describe()
+
+    def test_stage_graph_publishes_finished_stages(self, monkeypatch):
+        bus = progress.ProgressBus()
+        # the reader modules import the bus by plain module name
+        monkeypatch.setattr(scheduler.progress, "bus", bus)
+        graph = scheduler.StageGraph(name="book", verbose=False)
+        graph.add("a", lambda: None)
+        graph.add("b", lambda: 1 / 0)
+        graph.add("c", lambda: None, deps=["b"])
+        graph.run()
+
+        task = bus.get(progress.task_name("book", "stages"))
+        assert (task.done, task.total, task.finished) == (3, 3, True)
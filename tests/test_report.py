@@ -0,0 +1,108 @@
+"""
+Tests for report generation
+"""
+
+import threading
+import time
+
+from reader import report
+
+
+class TestCondense:
+    """Test cases for the map-reduce summarization of review descriptions"""
+
+    def test_small_input_is_kept_verbatim(self, monkeypatch):
+        monkeypatch.setattr(report.llm, "chat", lambda *args, **kwargs: 1 / 0)
+        descriptions = ["# 1 的剧情描述：a\n", "# 2 的剧情描述：b\n"]
+        assert report.condense("书", "story", descriptions, budget=1000) == "".join(descriptions)
+
+    def test_chunks_respect_the_budget(self, monkeypatch):
+        monkeypatch.setattr(report.llm, "count_tokens", len)
+        chunks = report.chunk_descriptions(["a" * 40, "b" * 40, "c" * 40, "d" * 200], budget=100)
+        assert [len(chunk) for chunk in chunks] == [2, 1, 1]
+
+    def test_large_input_is_summarized_until_it_fits(self, monkeypatch):
+        calls = []
+
+        def fake_chat(model_name, prompt, **kwargs):
+            calls.append(prompt)
+            return "s"
+
+        monkeypatch.setattr(report.llm, "count_tokens", len)
+        monkeypatch.setattr(report.llm, "chat", fake_chat)
+        descriptions = [f"# {i} 的感受描述：{'x' * 50}\n" for i in range(20)]
+
+        condensed = report.condense("书", "feeling", descriptions, budget=200)
+
+        # 20 descriptions of ~60 characters fit 3 to a chunk, so one round of 7 summaries
+        assert len(calls) == 7
+        assert condensed.count("摘要") == 7
+        assert len(condensed) <= 200
+
+    def test_summaries_that_do_not_shrink_stop_the_rounds(self, monkeypatch):
+        calls = []
+
+        def echo_chat(model_name, prompt, **kwargs):
+            # a summary longer than its input
+            calls.append(prompt)
+            return "y" * 200
+
+        monkeypatch.setattr(report.llm, "count_tokens", len)
+        monkeypatch.setattr(report.llm, "chat", echo_chat)
+        descriptions = [f"# {i} 的感受描述：{'x' * 150}\n" for i in range(6)]
+
+        condensed = report.condense("书", "feeling", descriptions, budget=200)
+
+        assert len(calls) == 6
+        assert 0 < len(condensed) <= 200
+
+    def test_rounds_are_capped(self, monkeypatch):
+        calls = []
+
+        def slow_chat(model_name, prompt, **kwargs):
+            calls.append(prompt)
+            return "s" * 80
+
+        monkeypatch.setattr(report.llm, "count_tokens", len)
+        monkeypatch.setattr(report.llm, "chat", slow_chat)
+        descriptions = [f"# {i} 的感受描述：{'x' * 150}\n" for i in range(40)]
+
+        condensed = report.condense("书", "feeling", descriptions, budget=200, max_rounds=2)
+
+        # 40 chunks, then 40 summaries of ~90 characters in 20 chunks, then truncation
+        assert len(calls) == 60
+        assert len(condensed) <= 200
+
+    def test_oversized_description_is_cut_to_the_budget(self, monkeypatch):
+        monkeypatch.setattr(report.llm, "count_tokens", len)
+        monkeypatch.setattr(report.llm, "chat", lambda *args, **kwargs: 1 / 0)
+        assert report.condense("书", "story", ["z" * 500], budget=200) == "z" * 200
+
+
+class TestReportGraph:
+    """Test cases for the report dependency graph"""
+
+    def test_analyses_run_concurrently_after_the_story(self, tmp_path, monkeypatch):
+        book = tmp_path / "书"
+        book.mkdir()
+        (book / "parsed_data.csv").write_text(
+            "source,source_url,story,feeling,evaluation,thinking\ndouban,u,剧情,感受,评价,思考\n", encoding="utf-8")
+        lock = threading.Lock()
+        running, peak, order = [0], [0], []
+
+        def fake_chat(model_name, prompt, **kwargs):
+            kind = "report" if prompt.startswith("帮我写") else "story" if "1000-2000" in prompt else "analysis"
+            with lock:
+                order.append(kind)
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            return kind
+
+        monkeypatch.setattr(report.llm, "chat", fake_chat)
+
+        assert report.report_parser(str(book)) == "report"
+        assert order[0] == "story" and order[-1] == "report"
+        assert peak[0] == 3
@@ -0,0 +1,68 @@
+"""
+Tests for retrieval of book context
+"""
+
+import json
+from types import SimpleNamespace
+
+from disk_cache import DiskCache
+from website import embeddings, retrieval
+
+VOCABULARY = ["曹操", "刘备", "赤壁", "诸葛亮"]
+
+
+class FakeClient:
+    """Embeds a text as the counts of a few words"""
+
+    def __init__(self):
+        self.calls = 0
+        self.embeddings = SimpleNamespace(create=self.create)
+
+    def create(self, model, input, **kwargs):
+        self.calls += 1
+        return SimpleNamespace(data=[
+            SimpleNamespace(index=i, embedding=[text.count(word) for word in VOCABULARY] + [0.1])
+            for i, text in enumerate(input)
+        ])
+
+
+class TestRetrieval:
+    """Test cases for indexing and searching a book"""
+
+    def test_chunks_cover_report_and_review_sections(self):
+        report = "# 剧情\n\n曹操败于赤壁。\n\n# 人物\n\n刘备三顾茅庐。"
+        rows = [["douban", "u", "剧情", "没有涉及感受", "诸葛亮很聪明", ""]]
+
+        chunks = retrieval.build_chunks(report, rows)
+
+        texts = [chunk["text"] for chunk in chunks]
+        assert any("赤壁" in text for text in texts)
+        assert "评价（来自douban书评）：诸葛亮很聪明" in texts
+        assert not any("没有涉及" in text for text in texts)
+
+    def test_split_text_respects_the_budget(self, monkeypatch):
+        monkeypatch.setattr(retrieval, "count_tokens", len)
+        text = "\n\n".join(["# 标题"] + ["字" * 40] * 5)
+        chunks = retrieval.split_text(text, max_tokens=100)
+        assert len(chunks) > 1
+        assert all(chunk.startswith("# 标题") for chunk in chunks)
+
+    def test_index_is_persisted_and_searched(self, tmp_path, monkeypatch):
+        cache = DiskCache(str(tmp_path / "cache"), 1 << 20)
+        monkeypatch.setattr(retrieval, "EmbeddingService",
+                            lambda client, model=None: embeddings.EmbeddingService(client, model or "m", cache=cache))
+        prompt_path = tmp_path / "三国演义.md"
+        prompt_path.write_text("曹操败于赤壁。\n\n刘备三顾茅庐请诸葛亮。", encoding="utf-8")
+        parsed = tmp_path / "parsed_data.json"
+        parsed.write_text(json.dumps([["douban", "u", "", "", "赤壁之战写得好", ""]]), encoding="utf-8")
+        client = FakeClient()
+
+        count = retrieval.index_book(client, str(prompt_path), str(parsed))
+        assert count == 2
+        # both chunks go out in one request, unchanged inputs are not embedded again
+        assert retrieval.index_book(client, str(prompt_path), str(parsed)) == 2
+        assert client.calls == 1
+
+        index = retrieval.BookIndex(retrieval.VectorStore(retrieval.index_base(str(prompt_path))))
+        best = index.search(client.create(None, ["诸葛亮"]).data[0].embedding, k=1)
+        assert "诸葛亮" in best[0]["text"]
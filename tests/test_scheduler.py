@@ -0,0 +1,68 @@
+"""
+Tests for the pipeline stage scheduler
+"""
+
+import threading
+import time
+
+import pytest
+
+from reader.scheduler import StageGraph
+
+
+class TestStageGraph:
+    """Test cases for StageGraph"""
+
+    def test_independent_branches_run_concurrently(self):
+        """Two branches that take 0.2s each finish in well under 0.4s"""
+        graph = StageGraph(verbose=False)
+        graph.add("a", time.sleep, args=(0.2,))
+        graph.add("b", time.sleep, args=(0.2,))
+        graph.add("join", lambda: "joined", deps=["a", "b"])
+
+        result = graph.run()
+
+        assert result.ok
+        assert result.results["join"] == "joined"
+        assert result.elapsed < 0.35
+
+    def test_dependencies_are_respected(self):
+        """A stage only starts after its dependencies finished"""
+        order = []
+        lock = threading.Lock()
+
+        def step(name, delay=0.0):
+            time.sleep(delay)
+            with lock:
+                order.append(name)
+
+        graph = StageGraph(verbose=False)
+        graph.add("crawl", step, args=("crawl", 0.1))
+        graph.add("clean", step, args=("clean",), deps=["crawl"])
+        graph.add("parse", step, args=("parse",), deps=["clean"])
+        graph.run()
+
+        assert order == ["crawl", "clean", "parse"]
+
+    def test_failure_skips_hard_dependents_only(self):
+        """deps are skipped after a failure, after-only stages still run"""
+        def boom():
+            raise RuntimeError("boom")
+
+        graph = StageGraph(verbose=False)
+        graph.add("video", boom)
+        graph.add("video_clean", lambda: None, deps=["video"])
+        graph.add("douban", lambda: None)
+        graph.add("parse", lambda: "parsed", after=["video_clean", "douban"])
+
+        result = graph.run()
+
+        assert result.status("video") == "failed"
+        assert result.status("video_clean") == "skipped"
+        assert result.results["parse"] == "parsed"
+
+    def test_unknown_dependency_rejected(self):
+        """Dependencies must be added before the stages that need them"""
+        graph = StageGraph(verbose=False)
+        with pytest.raises(ValueError):
+            graph.add("parse", lambda: None, deps=["crawl"])
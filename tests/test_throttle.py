@@ -0,0 +1,34 @@
+"""
+Tests for the shared crawl and LLM budgets
+"""
+
+import time
+
+import pytest
+
+from reader.throttle import TokenBucket
+
+
+class TestTokenBucket:
+    """Test cases for TokenBucket"""
+
+    def test_burst_is_free(self):
+        """Up to capacity tokens are available immediately"""
+        bucket = TokenBucket(rate=1, capacity=3)
+        assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+
+    def test_reservations_queue_up(self):
+        """Callers past the burst wait one interval more than the previous one"""
+        bucket = TokenBucket(rate=10, capacity=1)
+        bucket.reserve()
+        first = bucket.reserve()
+        second = bucket.reserve()
+        assert first == pytest.approx(0.1, abs=0.01)
+        assert second == pytest.approx(0.2, abs=0.01)
+
+    def test_acquire_paces_requests(self):
+        bucket = TokenBucket(rate=20, capacity=1)
+        start = time.monotonic()
+        for _ in range(3):
+            bucket.acquire()
+        assert time.monotonic() - start >= 0.09
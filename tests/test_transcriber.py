@@ -0,0 +1,182 @@
+"""
+Tests for the Whisper transcription server and the chunked mode
+"""
+
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pytest
+
+from reader import audio, transcriber
+
+
+class FakeModel:
+    def __init__(self):
+        self.calls = []
+
+    def transcribe(self, path, language=None, **options):
+        self.calls.append((path, language, options))
+        return {"text": f"{language}:{path.rsplit('/', 1)[-1]}"}
+
+
+class SecondsModel:
+    """Answers with the length of the chunk it was given"""
+
+    def transcribe(self, samples, language=None, **options):
+        seconds = len(samples) / audio.SAMPLE_RATE
+        return {"text": f"[{seconds:.0f}]", "segments": [{"start": 0.0, "end": seconds, "text": f"[{seconds:.0f}]"}]}
+
+
+def load_seconds_model(model_name, device):
+    # module level, the pool processes must be able to unpickle it
+    return SecondsModel()
+
+
+def speech(pattern, sample_rate=audio.SAMPLE_RATE):
+    """A tone for every (seconds, True) and silence for every (seconds, False) of pattern"""
+    parts = []
+    for seconds, loud in pattern:
+        t = np.arange(int(seconds * sample_rate)) / sample_rate
+        parts.append((0.5 * np.sin(2 * np.pi * 220 * t) if loud else np.zeros_like(t)).astype(np.float32))
+    return np.concatenate(parts)
+
+
+@pytest.fixture(autouse=True)
+def key_path(tmp_path, monkeypatch):
+    """Keep the generated key out of the real cache directory"""
+    monkeypatch.setattr(transcriber, "TRANSCRIBE_AUTHKEY", None)
+    monkeypatch.setattr(transcriber, "AUTHKEY_PATH", str(tmp_path / "keys" / "transcriber.key"))
+    return tmp_path / "keys" / "transcriber.key"
+
+
+@contextmanager
+def running_server(address, load):
+    server = transcriber.TranscriptionServer(
+        address, transcriber.WhisperRunner("tiny", "cpu", load=load, mode="whole"), idle_timeout=0)
+    ready = threading.Event()
+    thread = threading.Thread(target=server.serve_forever, args=(ready,))
+    thread.start()
+    ready.wait(5)
+    try:
+        yield server
+    finally:
+        transcriber.request({"op": "shutdown"}, address)
+        thread.join(5)
+    assert not thread.is_alive()
+
+
+class TestTranscriptionServer:
+    """Test cases for the server and its client"""
+
+    def test_model_is_loaded_once_for_many_files(self, tmp_path):
+        loads = []
+
+        def load(model_name, device):
+            loads.append((model_name, device))
+            return FakeModel()
+
+        address = str(tmp_path / "t.sock")
+        with running_server(address, load):
+            texts = [transcriber.transcribe(f"book/video/{i}.mp3", address=address, server="on") for i in range(3)]
+            assert texts == ["zh:0.mp3", "zh:1.mp3", "zh:2.mp3"]
+            assert loads == [("tiny", "cpu")]
+            assert transcriber.request({"op": "ping"}, address)["served"] == 3
+
+    def test_errors_are_returned_to_the_client(self, tmp_path):
+        def load(model_name, device):
+            raise FileNotFoundError("no weights")
+
+        address = str(tmp_path / "t.sock")
+        with running_server(address, load):
+            with pytest.raises(RuntimeError, match="no weights"):
+                transcriber.transcribe("a.mp3", address=address, server="on")
+
+    def test_falls_back_to_a_local_model(self, tmp_path, monkeypatch):
+        model = FakeModel()
+        runner = transcriber.WhisperRunner("tiny", "cpu", load=lambda model_name, device: model, mode="whole")
+        monkeypatch.setattr(transcriber, "_local_runner", runner)
+
+        # nothing listens there and starting a server is not allowed
+        text = transcriber.transcribe("a.mp3", address=str(tmp_path / "none.sock"), server="on")
+        assert text == "zh:a.mp3"
+        assert model.calls == [("a.mp3", "zh", {"fp16": False})]
+
+
+    def test_a_random_key_is_generated_once(self, key_path):
+        key = transcriber.load_authkey()
+
+        assert len(key) == 64 and key != b"deepreader"
+        assert key_path.stat().st_mode & 0o777 == 0o600
+        assert transcriber.load_authkey() == key
+
+    def test_tcp_needs_an_explicit_key(self, monkeypatch):
+        with pytest.raises(ValueError, match="DEEPREADER_TRANSCRIBE_AUTHKEY"):
+            transcriber.TranscriptionServer("0.0.0.0:9999", runner=transcriber.WhisperRunner("tiny", "cpu"))
+        with pytest.raises(ValueError):
+            transcriber.request({"op": "ping"}, "example.com:9999")
+
+        monkeypatch.setattr(transcriber, "TRANSCRIBE_AUTHKEY", "secret")
+        server = transcriber.TranscriptionServer("0.0.0.0:9999", runner=transcriber.WhisperRunner("tiny", "cpu"))
+        assert server.authkey == b"secret"
+
+
+class TestChunkedTranscription:
+    """Test cases for silence splitting and the process pool"""
+
+    def test_cuts_land_in_silence(self):
+        # speech with a short pause every 7 seconds
+        samples = speech([(7, True), (0.5, False)] * 6)
+        ranges = audio.split_at_silence(samples, chunk_seconds=10, search_seconds=5)
+
+        assert ranges[0][0] == 0 and ranges[-1][1] == len(samples)
+        assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+        for _, end in ranges[:-1]:
+            # every cut is inside one of the pauses
+            assert end / audio.SAMPLE_RATE % 7.5 >= 7
+        assert len(ranges) > 1
+
+    def test_short_audio_is_one_chunk(self):
+        samples = speech([(3, True)])
+        assert audio.split_at_silence(samples, chunk_seconds=10, search_seconds=5) == [(0, len(samples))]
+
+    def test_stitch_orders_chunks(self):
+        chunks = [(1, "b", [{"start": 10.0, "end": 12.0, "text": "b"}]),
+                  (0, "a", [{"start": 0.0, "end": 2.0, "text": "a"}])]
+        result = transcriber.stitch(chunks)
+        assert result["text"] == "ab"
+        assert [segment["start"] for segment in result["segments"]] == [0.0, 10.0]
+
+    def test_timestamps_are_shifted_to_the_whole_file(self):
+        samples = speech([(7, True), (1, False)] * 3)
+        chunked = transcriber.ChunkedTranscriber("tiny", workers=2, chunk_seconds=8, load=load_seconds_model)
+        try:
+            result = chunked.transcribe_samples(samples)
+        finally:
+            chunked.close()
+
+        ranges = audio.split_at_silence(samples, chunk_seconds=8)
+        starts = [segment["start"] for segment in result["segments"]]
+        assert starts == [start / audio.SAMPLE_RATE for start, _ in ranges]
+        assert result["segments"][-1]["end"] == pytest.approx(len(samples) / audio.SAMPLE_RATE)
+        assert result["text"] == "".join(segment["text"] for segment in result["segments"])
+
+    def test_worker_count_fits_in_memory(self, monkeypatch):
+        monkeypatch.setattr(transcriber.os, "cpu_count", lambda: 64)
+        monkeypatch.setattr(transcriber, "available_memory_gb", lambda: 32)
+
+        # a large model is ~10 GB per process
+        assert transcriber.default_workers("large-v3") == 2
+        assert transcriber.default_workers("tiny.en") == transcriber.ASR_MAX_WORKERS
+        monkeypatch.setattr(transcriber, "available_memory_gb", lambda: 4)
+        assert transcriber.default_workers("large-v3") == 1
+
+    def test_available_memory_counts_reclaimable_cache(self, tmp_path, monkeypatch):
+        meminfo = tmp_path / "meminfo"
+        meminfo.write_text("MemTotal:       33554432 kB\nMemFree:         1048576 kB\n"
+                           "MemAvailable:   25165824 kB\n")
+
+        assert transcriber.available_memory_gb(str(meminfo)) == 24
+
+        monkeypatch.setattr(transcriber.os, "sysconf", lambda name: 1024 if name == "SC_PAGE_SIZE" else 1024 ** 2)
+        assert transcriber.available_memory_gb(str(tmp_path / "missing")) == 1
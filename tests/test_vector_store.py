@@ -0,0 +1,52 @@
+"""
+Tests for the memory-mapped vector store
+"""
+
+import numpy as np
+
+from website.vector_store import VectorStore, normalize
+
+
+def random_vectors(count, dim=16, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+
+
+class TestVectorStore:
+    """Test cases for VectorStore"""
+
+    def test_exact_search_matches_brute_force(self, tmp_path):
+        vectors = random_vectors(300)
+        store = VectorStore(str(tmp_path / "book"), dtype="float32")
+        store.add(list(range(300)), vectors)
+        queries = random_vectors(5, seed=1)
+
+        results = store.search(queries, k=3)
+
+        expected = np.argsort(-(normalize(queries) @ normalize(vectors).T), axis=1)[:, :3]
+        assert [[record["id"] for record, _ in result] for result in results] == expected.tolist()
+
+    def test_appends_are_seen_by_other_readers(self, tmp_path):
+        writer = VectorStore(str(tmp_path / "book"))
+        reader = VectorStore(str(tmp_path / "book"))
+        writer.add(["a"], [[1.0, 0.0]], [{"text": "first"}])
+        assert len(reader) == 1
+
+        # grows past the initial capacity of 64 rows
+        writer.add([f"b{i}" for i in range(100)], np.tile([1.0, 0.0], (100, 1)))
+        writer.add(["c"], [[0.0, 1.0]], [{"text": "last"}])
+
+        assert len(reader) == 102
+        assert reader.vectors().dtype == np.float16
+        assert reader.search([0.0, 1.0], k=1)[0][0][0]["text"] == "last"
+
+    def test_ivf_partition_finds_near_duplicates(self, tmp_path):
+        vectors = random_vectors(2000, dim=32)
+        store = VectorStore(str(tmp_path / "book"), ivf_threshold=1000)
+        store.add(list(range(1000)), vectors[:1000])
+        store.add(list(range(1000, 2000)), vectors[1000:])
+        assert (tmp_path / "book.ivf.npz").exists()
+
+        queries = vectors[::100] + 0.01
+        results = store.search(queries, k=1, nprobe=4)
+
+        assert [result[0][0]["id"] for result in results] == list(range(0, 2000, 100))
@@ -5,6 +5,8 @@ DeepReader 主页
 
 import streamlit as st
 
+from catalog import get_catalog
+
 # ============================================================================
 # 页面配置
 # ============================================================================
@@ -80,10 +82,4 @@ with st.sidebar:
     """)
     
     st.markdown("### 📊 系统状态")
-    import os
-    book_prompt_dir = os.path.join(os.path.dirname(__file__), "book_prompt")
-    if os.path.exists(book_prompt_dir):
-        book_count = len([f for f in os.listdir(book_prompt_dir) if f.endswith('.md')])
-        st.metric("书籍总数", book_count)
-    else:
-        st.metric("书籍总数", 0)
\ No newline at end of file
+    st.metric("书籍总数", len(get_catalog()))
\ No newline at end of file
@@ -0,0 +1,391 @@
+"""
+添加新书的完整处理流程
+由后台任务进程（job_worker.py）运行，进度写入任务数据库
+"""
+
+import os
+import time
+import json
+from datetime import datetime
+import subprocess
+
+import reader_path  # noqa: F401
+import douban_crawler
+import douban_cleaning
+import video_cleaning
+from parse_review import parse_reviews
+import report
+import bilibili_auto_crawler
+import subtitles
+
+from catalog import get_catalog
+from retrieval import index_new_book
+
+
+def search_book_on_douban(book_name):
+    """搜索豆瓣书籍并返回结果"""
+    spider = douban_crawler.DoubanBookSpider()
+    book_urls = spider.search_book(book_name)
+    
+    if book_urls:
+        # 获取前3本书的信息
+        books_info = []
+        for i, url in enumerate(book_urls[:3]):
+            info = spider.get_book_info(url)
+            if info:
+                info['url'] = url
+                books_info.append(info)
+        return books_info
+    return []
+
+def generate_book_prompt_sync(book_name, include_video, status_queue, selected_book_url=None, auto_mode=False):
+    """同步生成书籍的完整处理流程（在后台任务进程中运行，status_queue 只需要 put 方法）"""
+    def update_status(step, progress, log_message):
+        """记录生成状态"""
+        status_queue.put({
+            "type": "update",
+            "step": step,
+            "progress": progress,
+            "log": f"[{datetime.now().strftime('%H:%M:%S')}] {log_message}"
+        })
+    
+    def run_with_progress(func, args, step_name, progress_start, progress_end):
+        """带进度更新的函数运行"""
+        update_status(step_name, progress_start, f"开始{step_name}...")
+        
+        try:
+            result = func(*args)
+            update_status(step_name, progress_end, f"✅ {step_name}完成")
+            return result
+        except Exception as e:
+            update_status(step_name, progress_end, f"❌ {step_name}失败: {str(e)}")
+            raise e
+    
+    try:
+        # 1. 搜索豆瓣书籍
+        if not selected_book_url:
+            update_status("搜索书籍", 0, f"正在豆瓣搜索《{book_name}》...")
+            books_info = search_book_on_douban(book_name)
+            
+            if not books_info:
+                raise Exception("未在豆瓣找到相关书籍")
+            
+            if auto_mode:
+                # 自动模式：选择第一本书
+                selected_book_url = books_info[0]['url']
+                update_status("自动选择", 5, f"自动选择：{books_info[0]['title']}")
+            else:
+                # 请求用户确认
+                status_queue.put({
+                    "type": "need_confirmation",
+                    "confirmation_type": "book_selection",
+                    "books_info": books_info
+                })
+                return  # 暂停执行，等待用户确认
+        
+        # 2. 爬取豆瓣书评（使用用户选择的URL）
+        update_status("爬取豆瓣", 10, f"开始爬取《{book_name}》的豆瓣书评...")
+        
+        # 创建一个临时的爬虫函数来使用指定的URL
+        def crawl_specific_book():
+            spider = douban_crawler.DoubanBookSpider()
+            # 获取书籍信息
+            update_status("爬取豆瓣", 10, f"正在获取书籍信息...")
+            book_info = spider.get_book_info(selected_book_url)
+            
+            # 创建保存目录
+            save_dir = f"{book_name}/website"
+            os.makedirs(save_dir, exist_ok=True)
+            
+            # 保存书籍信息
+            with open(f"{save_dir}/book_info.json", 'w', encoding='utf-8') as f:
+                json.dump(book_info, f, ensure_ascii=False, indent=2)
+            
+            # 获取评论URLs
+            update_status("爬取豆瓣", 12, f"正在获取书评列表...")
+            review_urls = spider.get_review_urls(selected_book_url, range=5)
+            total_reviews = len(review_urls[:5])
+            
+            # 逐条获取评论内容
+            reviews = []
+            for i, review_url in enumerate(review_urls[:5]):
+                update_status("爬取豆瓣", 12 + (i+1) * 8 / total_reviews, 
+                            f"正在处理第 {i+1}/{total_reviews} 条书评")
+                # 获取单条评论
+                review_data = spider.get_reviews([review_url])
+                if review_data:
+                    reviews.extend(review_data)
+                    # 保存评论
+                    review_content = review_data[0][1]
+                    with open(f"{save_dir}/review_{i+1}.txt", 'w', encoding='utf-8') as f:
+                        f.write(review_content)
+                time.sleep(2)  # 避免请求过快
+        
+        run_with_progress(
+            crawl_specific_book,
+            (),
+            "爬取豆瓣书评",
+            10, 20
+        )
+        
+        # 3. 清理豆瓣数据
+        run_with_progress(
+            douban_cleaning.clean_all_douban_files,
+            (f"{book_name}/website",),
+            "清理豆瓣数据",
+            20, 30
+        )
+        
+        # 4. 自动搜索和处理视频
+        if include_video:
+            def video_process():
+                update_status("搜索视频", 30, "正在搜索B站相关视频...")
+                
+                # 创建爬虫实例
+                crawler = bilibili_auto_crawler.BilibiliAutoCrawler()
+                
+                # 搜索视频
+                videos = crawler.search_videos(book_name)
+                if not videos:
+                    update_status("搜索视频", 35, "未找到相关视频")
+                    return
+                
+                update_status("搜索视频", 35, f"找到 {len(videos)} 个相关视频")
+                
+                # 创建链接文件
+                links_file = crawler.create_video_links_file(videos, book_name)
+                
+                # 下载视频（最多3个）
+                max_videos = min(3, len(videos))
+                for i, video in enumerate(videos[:max_videos]):
+                    progress = 35 + (i + 1) * 15 / max_videos
+                    video_title = video.get('title', '未知标题')[:30] + '...'
+                    video_url = f"https://www.bilibili.com/video/{video.get('bvid', '')}"
+                    update_status("下载视频", progress, 
+                                f"正在处理第 {i+1}/{max_videos} 个视频：{video_title}\n链接：{video_url}")
+                    
+                    # 下载单个视频
+                    try:
+                        if subtitles.SUBTITLES_FIRST:
+                            # 有字幕时不下载视频，没有字幕只下载音频并转录
+                            crawler.download_videos([video], book_name, 1, subtitles_only=True)
+                            update_status("下载视频", progress, f"✅ 视频 {i+1} 处理完成")
+                            continue
+                        
+                        # 首先尝试使用 lux
+                        video_dir = f"{book_name}/video"
+                        os.makedirs(video_dir, exist_ok=True)
+                        
+                        # 尝试使用 lux 下载
+                        lux_cmd = f"lux -o {video_dir} {video_url}"
+                        lux_result = subprocess.run(lux_cmd, shell=True, capture_output=True, text=True)
+                        
+                        if lux_result.returncode == 0:
+                            update_status("下载视频", progress, 
+                                        f"✅ 使用 lux 成功下载视频 {i+1}")
+                        else:
+                            # lux 失败，尝试使用 yt-dlp
+                            update_status("下载视频", progress, 
+                                        f"lux 下载失败，尝试使用 yt-dlp...")
+                            crawler.download_videos([video], book_name, 1)
+                        
+                        time.sleep(2)  # 避免请求过快
+                    except Exception as e:
+                        update_status("下载视频", progress, 
+                                    f"视频 {i+1} 下载失败，跳过：{str(e)[:50]}...")
+                        continue
+                
+                # 提取字幕（字幕优先模式下字幕已保存为每个视频的文稿，不再合并，避免重复清理和解析）
+                if not subtitles.SUBTITLES_FIRST:
+                    update_status("提取字幕", 48, "正在提取视频字幕...")
+                    crawler.extract_subtitles_text(book_name)
+                
+                update_status("视频处理完成", 50, f"✅ 视频处理完成，共处理 {max_videos} 个视频")
+            
+            run_with_progress(
+                video_process,
+                (),
+                "搜索视频书评",
+                30, 50
+            )
+            
+            # 5. 清理视频数据
+            def clean_video_data():
+                try:
+                    video_cleaning.clean_all_video_files(f"{book_name}/video")
+                except Exception as e:
+                    update_status("清理视频数据", 60, f"⚠️ 视频数据清理跳过: {str(e)}")
+                    # 不抛出异常，继续执行
+            
+            run_with_progress(
+                clean_video_data,
+                (),
+                "清理视频数据",
+                50, 60
+            )
+        else:
+            update_status("跳过视频处理", 60, "用户选择不包含视频书评")
+        
+        # 6. 解析书评
+        def parse_reviews_with_status():
+            try:
+                update_status("解析书评", 60, "正在读取收集到的书评...")
+                
+                # 统计文件数量
+                website_dir = f"{book_name}/website"
+                video_dir = f"{book_name}/video"
+                
+                website_files = []
+                video_files = []
+                
+                if os.path.exists(website_dir):
+                    website_files = [f for f in os.listdir(website_dir) if f.endswith('.txt')]
+                if os.path.exists(video_dir):
+                    video_files = [f for f in os.listdir(video_dir) if f.endswith('.txt')]
+                
+                total_files = len(website_files) + len(video_files)
+                update_status("解析书评", 65, f"找到 {len(website_files)} 个豆瓣书评，{len(video_files)} 个视频转录文本")
+                
+                # 执行解析
+                update_status("解析书评", 70, "正在分析书评内容，提取关键信息...")
+                parse_reviews(book_name)
+                
+                update_status("解析书评", 80, f"✅ 书评解析完成，共处理 {total_files} 个文件")
+            except Exception as e:
+                update_status("解析书评", 80, f"⚠️ 书评解析部分失败: {str(e)[:100]}...")
+                # 不抛出异常，继续执行
+        
+        run_with_progress(
+            parse_reviews_with_status,
+            (),
+            "解析书评内容",
+            60, 80
+        )
+        
+        # 7. 生成报告
+        def generate_report_with_status():
+            try:
+                update_status("生成报告", 80, "正在整合所有分析结果...")
+                
+                # 检查是否有解析的数据
+                parsed_data_path = f"{book_name}/parsed_data.json"
+                if not os.path.exists(parsed_data_path):
+                    # 如果没有解析数据，创建一个简单的报告
+                    update_status("生成报告", 85, "未找到解析数据，生成基础报告...")
+                    
+                    # 读取原始书评创建简单报告
+                    reviews = []
+                    website_dir = f"{book_name}/website"
+                    if os.path.exists(website_dir):
+                        for file in os.listdir(website_dir):
+                            if file.endswith('.txt') and not file.endswith('_cleaned.txt'):
+                                with open(os.path.join(website_dir, file), 'r', encoding='utf-8') as f:
+                                    reviews.append(f.read()[:500])  # 取前500字符
+                    
+                    # 创建简单报告
+                    simple_report = f"""# 《{book_name}》书评汇总
+
+## 收集到的书评摘要
+
+"""
+                    for i, review in enumerate(reviews[:5]):  # 最多显示5条
+                        simple_report += f"### 书评 {i+1}\n{review}...\n\n"
+                    
+                    # 保存报告
+                    report_path = f"{book_name}/report.md"
+                    with open(report_path, "w", encoding="utf-8") as f:
+                        f.write(simple_report)
+                else:
+                    # 执行正常的报告生成
+                    report.report_parser(book_name)
+                
+                update_status("生成报告", 90, "✅ 综合报告生成完成")
+            except Exception as e:
+                update_status("生成报告", 90, f"⚠️ 报告生成部分失败: {str(e)[:100]}...")
+                # 创建最基础的报告
+                basic_report = f"""# 《{book_name}》阅读指南
+
+## 书籍信息
+书名：《{book_name}》
+
+## 内容简介
+（根据收集的书评整理）
+
+本书的详细内容正在整理中...
+"""
+                report_path = f"{book_name}/report.md"
+                os.makedirs(book_name, exist_ok=True)
+                with open(report_path, "w", encoding="utf-8") as f:
+                    f.write(basic_report)
+        
+        run_with_progress(
+            generate_report_with_status,
+            (),
+            "生成综合报告",
+            80, 90
+        )
+        
+        # 8. 生成并保存prompt
+        update_status("生成Prompt", 90, "正在生成最终的书籍prompt...")
+        
+        # 清理视频文件以节省空间（保留字幕）
+        try:
+            video_dir = f"{book_name}/video"
+            if os.path.exists(video_dir):
+                for file in os.listdir(video_dir):
+                    file_path = os.path.join(video_dir, file)
+                    # 只删除视频文件，保留txt字幕文件
+                    if os.path.isfile(file_path) and not file.endswith('.txt'):
+                        os.remove(file_path)
+                        print(f"Removed video file: {file}")
+        except Exception as e:
+            print(f"Error cleaning video files: {e}")
+        
+        # 读取生成的报告
+        report_path = f"{book_name}/report.md"
+        if os.path.exists(report_path):
+            with open(report_path, "r", encoding="utf-8") as f:
+                report_content = f.read()
+            
+            # 生成prompt格式
+            prompt_content = f"""# 《{book_name}》深度阅读指南
+
+## 书籍概览
+{report_content}
+
+## 讨论要点
+- 探讨书中的核心主题和思想
+- 分析主要人物的成长和变化
+- 思考书中观点对现实生活的启发
+- 分享个人的阅读感受和思考
+
+## 推荐问题
+1. 这本书最打动你的地方是什么？
+2. 书中的哪个观点让你产生了新的思考？
+3. 如果你是书中的主人公，你会做出什么不同的选择？
+"""
+            
+            if auto_mode:
+                # 自动模式：直接保存
+                index_new_book(get_catalog().save(book_name, prompt_content), book_name)
+                
+                update_status("完成", 100, f"✅ 《{book_name}》的prompt已生成并保存")
+                status_queue.put({"type": "success", "book_name": book_name})
+            else:
+                # 暂时保存prompt内容，等待用户确认
+                status_queue.put({
+                    "type": "need_confirmation",
+                    "confirmation_type": "add_to_chat",
+                    "prompt_content": prompt_content,
+                    "book_name": book_name
+                })
+                
+                update_status("完成", 100, f"✅ 《{book_name}》的prompt已生成，等待确认")
+        else:
+            raise Exception("报告生成失败，未找到报告文件")
+            
+    except Exception as e:
+        # 失败时不删除已收集的数据
+        update_status("错误", 100, f"❌ 生成失败: {str(e)}")
+        update_status("提示", 100, "⚠️ 已收集的数据保留在相应目录中")
+        status_queue.put({"type": "error", "error": str(e)})
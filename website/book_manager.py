@@ -7,13 +7,17 @@ import streamlit as st
 import os
 import sys
 import threading
-import time
 from datetime import datetime
 
 # 添加父目录到路径，以便导入 reader 模块
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import reader_path  # noqa: F401
 
 from reader import douban_crawler, douban_cleaning, parse_review, report
+# 与 reader 模块使用同一个进度总线
+import progress
+from catalog import get_catalog
+from retrieval import index_new_book
 
 # ============================================================================
 # 页面配置
@@ -59,13 +63,17 @@ with st.form("add_book_form"):
 # ============================================================================
 # 书籍处理逻辑
 # ============================================================================
-def show_waiting_animation(thread, progress_bar, status_text):
-    """显示等待动画"""
-    progress = 0
+def show_progress(thread, progress_bar, status_text, task=None):
+    """显示步骤的实际进度、速度和预计剩余时间，直到线程结束"""
+    seen = 0
     while thread.is_alive():
-        progress = (progress + 1) % 100
-        progress_bar.progress(progress)
-        time.sleep(0.1)
+        # 有新进度时立即唤醒，否则每秒刷新一次预计剩余时间
+        seen = progress.bus.wait(seen, timeout=1.0)
+        current = progress.bus.get(task) if task else None
+        if current is not None:
+            if current.fraction is not None:
+                progress_bar.progress(current.fraction)
+            status_text.text(current.describe())
     progress_bar.progress(100)
 
 def process_book_pipeline(book_name, douban_count, auto_process):
@@ -94,7 +102,7 @@ def process_book_pipeline(book_name, douban_count, auto_process):
             crawl_thread.start()
             
             # 显示进度动画
-            show_waiting_animation(crawl_thread, progress_bar_1, status_text_1)
+            show_progress(crawl_thread, progress_bar_1, status_text_1, progress.task_name(book_name, "douban"))
             
             status_text_1.text("✅ 豆瓣数据爬取完成")
             st.success("豆瓣书评数据爬取成功！")
@@ -117,7 +125,7 @@ def process_book_pipeline(book_name, douban_count, auto_process):
             )
             clean_thread.start()
             
-            show_waiting_animation(clean_thread, progress_bar_2, status_text_2)
+            show_progress(clean_thread, progress_bar_2, status_text_2)
             
             status_text_2.text("✅ 数据清理完成")
             st.success("豆瓣数据清理成功！")
@@ -140,7 +148,7 @@ def process_book_pipeline(book_name, douban_count, auto_process):
             )
             parse_thread.start()
             
-            show_waiting_animation(parse_thread, progress_bar_3, status_text_3)
+            show_progress(parse_thread, progress_bar_3, status_text_3, progress.task_name(book_name, "parse"))
             
             status_text_3.text("✅ 书评解析完成")
             st.success("书评解析成功！")
@@ -163,7 +171,8 @@ def process_book_pipeline(book_name, douban_count, auto_process):
             )
             report_thread.start()
             
-            show_waiting_animation(report_thread, progress_bar_4, status_text_4)
+            show_progress(report_thread, progress_bar_4, status_text_4,
+                          progress.task_name(f"{book_name} report", "stages"))
             
             status_text_4.text("✅ 报告生成完成")
             st.success("综合报告生成成功！")
@@ -233,14 +242,8 @@ def create_book_prompt(book_name):
         with open(report_path, 'r', encoding='utf-8') as f:
             report_content = f.read()
     
-    # 创建书籍提示目录
-    prompt_dir = "website/book_prompt"
-    os.makedirs(prompt_dir, exist_ok=True)
-    
     # 写入书籍提示文件
-    prompt_file = f"{prompt_dir}/{book_name}.md"
-    with open(prompt_file, 'w', encoding='utf-8') as f:
-        f.write(report_content)
+    index_new_book(get_catalog().save(book_name, report_content), book_name)
 
 # ============================================================================
 # 执行书籍添加
@@ -248,12 +251,7 @@ def create_book_prompt(book_name):
 if submit_button and book_name:
     if book_name.strip():
         # 检查书籍是否已存在
-        prompt_dir = "website/book_prompt"
-        existing_books = []
-        if os.path.exists(prompt_dir):
-            existing_books = [f[:-3] for f in os.listdir(prompt_dir) if f.endswith('.md')]
-        
-        if book_name in existing_books:
+        if book_name in get_catalog():
             st.warning(f"书籍《{book_name}》已存在，是否要重新处理？")
             if st.button("确认重新处理"):
                 process_book_pipeline(book_name, douban_count, auto_process)
@@ -268,42 +266,37 @@ if submit_button and book_name:
 st.header("📖 现有书籍")
 
 # 加载现有书籍列表
-prompt_dir = "website/book_prompt"
-if os.path.exists(prompt_dir):
-    existing_books = [f[:-3] for f in os.listdir(prompt_dir) if f.endswith('.md')]
+existing_books = get_catalog().titles()
+if existing_books:
+    st.write(f"当前共有 **{len(existing_books)}** 本书籍：")
     
-    if existing_books:
-        st.write(f"当前共有 **{len(existing_books)}** 本书籍：")
-        
-        # 创建书籍网格显示
-        cols = st.columns(3)
-        for i, book in enumerate(existing_books):
-            with cols[i % 3]:
-                with st.container():
-                    st.markdown(f"**📚 {book}**")
-                    
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        if st.button("💬 对话", key=f"chat_{i}"):
-                            st.query_params["book"] = book
-                            st.switch_page("pages/1_💬_聊天室.py")
-                    with col2:
-                        if st.button("🗑️ 删除", key=f"delete_{i}"):
-                            if st.session_state.get(f"confirm_delete_{i}"):
-                                # 执行删除
-                                try:
-                                    os.remove(f"{prompt_dir}/{book}.md")
-                                    st.success(f"已删除《{book}》")
-                                    st.rerun()
-                                except Exception as e:
-                                    st.error(f"删除失败: {e}")
-                            else:
-                                st.session_state[f"confirm_delete_{i}"] = True
-                                st.warning("再次点击确认删除")
-    else:
-        st.info("还没有添加任何书籍，请使用上方的表单添加新书籍。")
+    # 创建书籍网格显示
+    cols = st.columns(3)
+    for i, book in enumerate(existing_books):
+        with cols[i % 3]:
+            with st.container():
+                st.markdown(f"**📚 {book}**")
+                
+                col1, col2 = st.columns(2)
+                with col1:
+                    if st.button("💬 对话", key=f"chat_{i}"):
+                        st.query_params["book"] = book
+                        st.switch_page("pages/1_💬_聊天室.py")
+                with col2:
+                    if st.button("🗑️ 删除", key=f"delete_{i}"):
+                        if st.session_state.get(f"confirm_delete_{i}"):
+                            # 执行删除
+                            try:
+                                get_catalog().delete(book)
+                                st.success(f"已删除《{book}》")
+                                st.rerun()
+                            except Exception as e:
+                                st.error(f"删除失败: {e}")
+                        else:
+                            st.session_state[f"confirm_delete_{i}"] = True
+                            st.warning("再次点击确认删除")
 else:
-    st.info("书籍目录不存在，请先添加一本书籍。")
+    st.info("还没有添加任何书籍，请使用上方的表单添加新书籍。")
 
 # ============================================================================
 # 使用说明
@@ -347,11 +340,7 @@ with st.sidebar:
     st.markdown("### 📊 系统状态")
     
     # 显示书籍数量
-    if os.path.exists(prompt_dir):
-        book_count = len([f for f in os.listdir(prompt_dir) if f.endswith('.md')])
-        st.metric("已添加书籍", book_count)
-    else:
-        st.metric("已添加书籍", 0)
+    st.metric("已添加书籍", len(get_catalog()))
     
     # 显示磁盘使用情况
     st.markdown("### 💾 存储信息")
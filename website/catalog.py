@@ -0,0 +1,113 @@
+"""
+Book catalog shared by every page of the DeepReader web interface
+"""
+
+import os
+import threading
+from typing import Dict, List, Optional
+
+import streamlit as st
+
+from utils import count_tokens
+
+BOOK_PROMPT_DIR = os.getenv(
+    "DEEPREADER_BOOK_PROMPT_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "book_prompt")
+)
+
+# files stored next to a book prompt, e.g. the retrieval index
+SIDECAR_SUFFIXES = (".index.json", ".vectors.npy", ".ids.jsonl", ".ivf.npz")
+
+
+class BookEntry:
+    """One book prompt file"""
+
+    def __init__(self, title: str, path: str, size: int, mtime: float, content: str):
+        self.title = title
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.content = content
+        self.tokens = count_tokens(content)
+
+
+class BookCatalog:
+    """
+    Books available in the book prompt directory
+
+    Each lookup costs one scandir of that directory. A file is only read again
+    (and its tokens counted again) when its mtime or size changed, so reruns
+    of a page never walk the working tree or re-read unchanged prompts.
+    """
+
+    def __init__(self, directory: str = BOOK_PROMPT_DIR):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self._entries: Dict[str, BookEntry] = {}
+
+    def _refresh(self) -> Dict[str, BookEntry]:
+        with self.lock:
+            try:
+                files = [entry for entry in os.scandir(self.directory)
+                         if entry.is_file() and entry.name.endswith(".md")]
+            except FileNotFoundError:
+                files = []
+            entries = {}
+            for file in files:
+                title = file.name[:-3]
+                stat = file.stat()
+                cached = self._entries.get(title)
+                if cached and cached.mtime == stat.st_mtime and cached.size == stat.st_size:
+                    entries[title] = cached
+                    continue
+                try:
+                    with open(file.path, "r", encoding="utf-8") as f:
+                        content = f.read()
+                except OSError:
+                    continue
+                entries[title] = BookEntry(title, file.path, stat.st_size, stat.st_mtime, content)
+            self._entries = entries
+            return entries
+
+    def books(self) -> List[BookEntry]:
+        """Every book, sorted by title"""
+        entries = self._refresh()
+        return [entries[title] for title in sorted(entries)]
+
+    def titles(self) -> List[str]:
+        return sorted(self._refresh())
+
+    def get(self, title: str) -> Optional[BookEntry]:
+        return self._refresh().get(title)
+
+    def __contains__(self, title: str) -> bool:
+        return title in self._refresh()
+
+    def __len__(self) -> int:
+        return len(self._refresh())
+
+    def path_for(self, title: str) -> str:
+        return os.path.join(self.directory, f"{title}.md")
+
+    def save(self, title: str, content: str) -> str:
+        """Write the prompt of a book, replacing the file atomically"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path_for(title)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        return path
+
+    def delete(self, title: str):
+        os.remove(self.path_for(title))
+        for suffix in SIDECAR_SUFFIXES:
+            sidecar = os.path.join(self.directory, f"{title}{suffix}")
+            if os.path.exists(sidecar):
+                os.remove(sidecar)
+
+
+@st.cache_resource
+def get_catalog() -> BookCatalog:
+    """Catalog shared by all sessions and pages of this server"""
+    return BookCatalog()
@@ -0,0 +1,125 @@
+"""
+Token-budgeted chat context for the DeepReader chat pages
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+import reader_path  # noqa: F401
+import llm
+from utils import count_tokens
+
+# 每轮发送给模型的最大 token 数（包含系统提示）
+CHAT_CONTEXT_TOKENS = int(os.getenv("DEEPREADER_CHAT_CONTEXT_TOKENS", 16000))
+# 原样保留的最近对话轮数，更早的对话并入摘要
+CHAT_KEEP_TURNS = int(os.getenv("DEEPREADER_CHAT_KEEP_TURNS", 6))
+# 每条消息的格式开销
+MESSAGE_OVERHEAD_TOKENS = 4
+
+summary_prompt = """下面是一段关于读书的对话的已有摘要和后续对话，请把它们合并成一份新的摘要。请严格遵循以下规则：
+- 保留用户的观点、问题、偏好和双方已经讨论过的结论
+- 不超过 500 字
+- 只输出摘要
+
+已有摘要：
+{summary}
+
+后续对话：
+{dialogue}
+
+新的摘要：
+"""
+
+
+def message_tokens(message: Dict) -> int:
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def make_summarizer(model_name: str) -> Callable[[str, List[Dict]], str]:
+    """Summarizer that folds messages into the summary with one completion call"""
+    def summarize(summary: str, messages: List[Dict]) -> str:
+        dialogue = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+        return llm.complete(
+            [{"role": "user", "content": summary_prompt.format(summary=summary or "无", dialogue=dialogue)}],
+            model_name
+        )
+    return summarize
+
+
+class ChatContext:
+    """
+    Builds the messages sent for each turn of one chat session
+
+    The system prompt and the last keep_turns turns are sent verbatim, older
+    turns are represented by a rolling summary. The summary is updated by a
+    background thread so a turn never waits for it; until it catches up the
+    unsummarized turns are sent as long as they fit in the budget.
+    """
+
+    def __init__(self, summarize: Callable[[str, List[Dict]], str],
+                 budget: int = CHAT_CONTEXT_TOKENS, keep_turns: int = CHAT_KEEP_TURNS):
+        self.summarize = summarize
+        self.budget = budget
+        self.keep_turns = keep_turns
+        self.summary = ""
+        # number of messages after the system prompt already folded into the summary
+        self.summarized = 0
+        # bumped by reset so a summary of a cleared conversation is discarded
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = None
+
+    def _update_summary(self, messages: List[Dict], upto: int):
+        with self.lock:
+            summary, start, generation = self.summary, self.summarized, self.generation
+        if upto <= start:
+            return
+        try:
+            new_summary = self.summarize(summary, messages[start:upto])
+        except Exception as e:
+            print(f"Failed to update chat summary: {e}")
+            return
+        with self.lock:
+            # the session may have been cleared while the summary was being written
+            if self.generation == generation and self.summarized == start:
+                self.summary, self.summarized = new_summary, upto
+
+    def _schedule(self, messages: List[Dict], upto: int):
+        if self.pending is not None and not self.pending.done():
+            return
+        self.pending = self.executor.submit(self._update_summary, list(messages), upto)
+
+    def build(self, messages: List[Dict]) -> List[Dict]:
+        """Messages to send, messages[0] is the system prompt and the last one the new user message"""
+        system, history = messages[0], messages[1:]
+        with self.lock:
+            if self.summarized > len(history):
+                self.summary, self.summarized = "", 0
+            summary, summarized = self.summary, self.summarized
+
+        recent_start = max(len(history) - self.keep_turns * 2, 0)
+        if recent_start > summarized:
+            self._schedule(history, recent_start)
+
+        head = [system]
+        if summary:
+            head.append({"role": "system", "content": f"之前对话的摘要：\n{summary}"})
+        used = sum(message_tokens(message) for message in head)
+
+        # newest first, the latest user message is always kept
+        kept = []
+        for message in reversed(history[summarized:]):
+            tokens = message_tokens(message)
+            if kept and used + tokens > self.budget:
+                break
+            kept.append(message)
+            used += tokens
+        return head + kept[::-1]
+
+    def reset(self):
+        with self.lock:
+            self.summary, self.summarized = "", 0
+            self.generation += 1
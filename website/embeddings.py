@@ -0,0 +1,124 @@
+"""
+Batched and cached embedding computation for the DeepReader retrieval index
+"""
+
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+
+import reader_path  # noqa: F401
+import llm
+from disk_cache import CACHE_DIR, DiskCache
+from utils import count_tokens
+
+EMBEDDING_MODEL_NAME = os.getenv("DEEPREADER_EMBEDDING_MODEL", "text-embedding-3-small")
+# OpenAI 每个请求最多 2048 条输入、共 300k token，单条输入最多 8191 token
+EMBEDDING_BATCH_SIZE = int(os.getenv("DEEPREADER_EMBEDDING_BATCH_SIZE", 2048))
+EMBEDDING_BATCH_TOKENS = int(os.getenv("DEEPREADER_EMBEDDING_BATCH_TOKENS", 300000))
+EMBEDDING_MAX_INPUT_TOKENS = 8191
+# 同时进行的请求数
+EMBEDDING_CONCURRENCY = int(os.getenv("DEEPREADER_EMBEDDING_CONCURRENCY", 4))
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("DEEPREADER_EMBEDDING_CACHE_MB", 256))
+
+
+def embedding_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\n{text}".encode("utf-8")).hexdigest()
+
+
+def pack_batches(texts: List[str], batch_size: int = EMBEDDING_BATCH_SIZE,
+                 batch_tokens: int = EMBEDDING_BATCH_TOKENS) -> List[List[int]]:
+    """Group the indices of texts into requests under both per-request limits"""
+    batches, batch, tokens = [], [], 0
+    for index, text in enumerate(texts):
+        size = min(count_tokens(text), EMBEDDING_MAX_INPUT_TOKENS)
+        if batch and (len(batch) >= batch_size or tokens + size > batch_tokens):
+            batches.append(batch)
+            batch, tokens = [], 0
+        batch.append(index)
+        tokens += size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class EmbeddingService:
+    """
+    Embeds many texts with as few requests as possible
+
+    Identical texts are embedded once, vectors already in the content-hash
+    cache are not requested again, and the remaining texts are packed into
+    batches that are sent max_workers at a time.
+    """
+
+    def __init__(self, client, model: str = EMBEDDING_MODEL_NAME, cache: Optional[DiskCache] = None,
+                 batch_size: int = EMBEDDING_BATCH_SIZE, batch_tokens: int = EMBEDDING_BATCH_TOKENS,
+                 max_workers: int = EMBEDDING_CONCURRENCY):
+        self.client = client
+        self.model = model
+        self.cache = cache if cache is not None else get_embedding_cache()
+        self.batch_size = batch_size
+        self.batch_tokens = batch_tokens
+        self.max_workers = max_workers
+        self.hits = 0
+        self.misses = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def _request(self, texts: List[str]) -> List[List[float]]:
+        embeddings = llm.embed(texts, self.model, client=self.client)
+        with self.lock:
+            self.requests += 1
+        return embeddings
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """float32 matrix with one row per text, in order"""
+        # the API rejects empty inputs
+        texts = [text if text.strip() else " " for text in texts]
+        keys = [embedding_key(self.model, text) for text in texts]
+        vectors = {}
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key in vectors or key in missing:
+                continue
+            entry = self.cache.get(key)
+            if entry:
+                vectors[key] = np.frombuffer(entry[0], dtype=np.float32)
+            else:
+                missing[key] = text
+        with self.lock:
+            self.hits += len(vectors)
+            self.misses += len(missing)
+
+        missing_keys, missing_texts = list(missing), list(missing.values())
+        batches = pack_batches(missing_texts, self.batch_size, self.batch_tokens)
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(batches) or 1))) as pool:
+            results = pool.map(lambda batch: self._request([missing_texts[i] for i in batch]), batches)
+            for batch, embeddings in zip(batches, results):
+                for i, embedding in zip(batch, embeddings):
+                    vector = np.asarray(embedding, dtype=np.float32)
+                    vectors[missing_keys[i]] = vector
+                    self.cache.put(missing_keys[i], vector.tobytes(), {"model": self.model, "dim": len(vector)})
+
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([vectors[key] for key in keys])
+
+    def embed_one(self, text: str) -> np.ndarray:
+        return self.embed([text])[0]
+
+
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> DiskCache:
+    """Process-wide vector cache in ~/.cache/deepreader/embeddings"""
+    global _embedding_cache
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = DiskCache(os.path.join(CACHE_DIR, "embeddings"), EMBEDDING_CACHE_MAX_MB * 1024 * 1024)
+        return _embedding_cache
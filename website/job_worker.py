@@ -0,0 +1,119 @@
+"""
+Worker process of the DeepReader background jobs
+
+Started by jobs.ensure_worker, runs queued jobs one at a time and exits
+after WORKER_IDLE_SECONDS without work:
+
+    python website/job_worker.py [--db path]
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from typing import Callable, Dict
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import reader_path  # noqa: F401
+import progress
+from jobs import JOBS_DB, WORKER_IDLE_SECONDS, JobStore
+
+POLL_SECONDS = 1.0
+HEARTBEAT_SECONDS = 5.0
+# at most one progress event per interval is stored for a job
+PROGRESS_SECONDS = 2.0
+
+
+class JobEvents:
+    """Queue-like sink, put() records a status dict of the job"""
+
+    def __init__(self, store: JobStore, job_id: str):
+        self.store = store
+        self.job_id = job_id
+
+    def put(self, payload: Dict):
+        self.store.add_event(self.job_id, payload)
+
+
+def add_book(params: Dict, events: JobEvents):
+    from add_book import generate_book_prompt_sync
+    generate_book_prompt_sync(status_queue=events, **params)
+
+
+JOB_HANDLERS: Dict[str, Callable[[Dict, JobEvents], None]] = {
+    "add_book": add_book,
+}
+
+
+def forward_progress(store: JobStore, job_id: str, stopped: threading.Event):
+    """Store the tasks of the progress bus as events of the job while it runs"""
+    seen = progress.bus.version
+    while True:
+        version = progress.bus.wait(seen, timeout=PROGRESS_SECONDS)
+        if stopped.is_set():
+            return
+        if version != seen:
+            seen = version
+            tasks = [task.to_dict() for task in progress.bus.snapshot(include_finished=False)]
+            store.add_event(job_id, {"type": "progress", "tasks": tasks})
+        if stopped.wait(PROGRESS_SECONDS):
+            return
+
+
+def run_job(store: JobStore, job: Dict, handlers: Dict = JOB_HANDLERS):
+    """Run one claimed job, its outcome is always recorded"""
+    progress.bus.clear()
+    stopped = threading.Event()
+    forwarder = threading.Thread(target=forward_progress, args=(store, job["id"], stopped), daemon=True)
+    forwarder.start()
+    error = None
+    try:
+        # 书籍数据目录相对于提交任务的页面的工作目录
+        os.chdir(job["cwd"])
+        handlers[job["kind"]](job["params"], JobEvents(store, job["id"]))
+    except Exception as e:
+        print(f"Job {job['id']} failed: {e}")
+        error = str(e)
+    finally:
+        # the last progress event comes before the outcome
+        stopped.set()
+        progress.bus.notify()
+        forwarder.join()
+    store.finish(job["id"], error)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DeepReader background job worker")
+    parser.add_argument("--db", default=JOBS_DB, help="Path of the job database")
+    args = parser.parse_args()
+
+    store = JobStore(args.db)
+    pid = os.getpid()
+    stopped = threading.Event()
+
+    def heartbeat():
+        # a long job keeps the main thread busy, the heartbeat shows the process is still working
+        while not stopped.wait(HEARTBEAT_SECONDS):
+            store.heartbeat(pid)
+
+    store.heartbeat(pid)
+    threading.Thread(target=heartbeat, daemon=True).start()
+    idle_since = time.monotonic()
+    try:
+        while time.monotonic() - idle_since < WORKER_IDLE_SECONDS:
+            job = store.claim(pid)
+            if job is None:
+                time.sleep(POLL_SECONDS)
+                continue
+            print(f"Running job {job['id']} ({job['kind']})")
+            run_job(store, job)
+            idle_since = time.monotonic()
+    finally:
+        stopped.set()
+        store.remove_worker(pid)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Durable background jobs of the DeepReader web interface
+
+Long-running work such as adding a book is not run inside the Streamlit
+script. A page submits a job to a SQLite queue, a separate worker process
+(job_worker.py) runs it and records its progress events in the same
+database. The page only stores the job id, so it can reattach after a
+browser refresh or a restart of the Streamlit server.
+"""
+
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import reader_path  # noqa: F401
+from disk_cache import CACHE_DIR
+
+JOBS_DB = os.getenv("DEEPREADER_JOBS_DB", os.path.join(CACHE_DIR, "jobs.sqlite3"))
+# 后台进程空闲多久后退出，以及多久没有心跳视为已退出（秒）
+WORKER_IDLE_SECONDS = float(os.getenv("DEEPREADER_JOB_WORKER_IDLE", 600))
+WORKER_STALE_SECONDS = 30
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "job_worker.py")
+
+# queued -> running -> done / failed, a job waiting for the user is finished from the worker's view
+QUEUED, RUNNING, WAITING, DONE, FAILED = "queued", "running", "waiting", "done", "failed"
+FINISHED = (WAITING, DONE, FAILED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    cwd TEXT NOT NULL,
+    status TEXT NOT NULL,
+    step TEXT NOT NULL DEFAULT '',
+    progress REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    worker_pid INTEGER,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    time REAL NOT NULL,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_job ON events (job_id, id);
+CREATE TABLE IF NOT EXISTS workers (
+    pid INTEGER PRIMARY KEY,
+    heartbeat REAL NOT NULL
+);
+"""
+
+
+def pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobStore:
+    """
+    Job queue and progress log in one SQLite file
+
+    Every call opens its own short transaction, so the Streamlit server,
+    any number of sessions and the worker process can use the same file.
+    Payloads are the status dicts the add-book pipeline always produced
+    ({"type": "update", ...}, {"type": "success", ...}, ...).
+    """
+
+    def __init__(self, path: str = JOBS_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            # readers do not block the worker's writes
+            db.execute("PRAGMA journal_mode=WAL")
+            yield db
+        finally:
+            db.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    # ------------------------------------------------------------------
+    # pages
+    # ------------------------------------------------------------------
+    def submit(self, kind: str, params: Dict, cwd: Optional[str] = None) -> str:
+        """Queue a job and return its id"""
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO jobs (id, kind, params, cwd, status, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(params, ensure_ascii=False), cwd or os.getcwd(), QUEUED, now, now)
+            )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        return job
+
+    def events(self, job_id: str, after: int = 0) -> List[Dict]:
+        """Events of a job newer than event id after, each with its id under "event_id" """
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT id, payload FROM events WHERE job_id = ? AND id > ? ORDER BY id", (job_id, after)
+            ).fetchall()
+        return [dict(json.loads(row["payload"]), event_id=row["id"]) for row in rows]
+
+    # ------------------------------------------------------------------
+    # worker
+    # ------------------------------------------------------------------
+    def claim(self, pid: int) -> Optional[Dict]:
+        """Mark the oldest queued job as running by pid and return it"""
+        with self._transaction() as db:
+            row = db.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is not None:
+                db.execute("UPDATE jobs SET status = ?, worker_pid = ?, updated = ? WHERE id = ?",
+                           (RUNNING, pid, time.time(), row["id"]))
+        return self.get(row["id"]) if row is not None else None
+
+    def add_event(self, job_id: str, payload: Dict):
+        """Record one status dict and apply it to the job row"""
+        now = time.time()
+        with self._transaction() as db:
+            db.execute("INSERT INTO events (job_id, time, payload) VALUES (?, ?, ?)",
+                       (job_id, now, json.dumps(payload, ensure_ascii=False)))
+            kind = payload.get("type")
+            if kind == "update":
+                db.execute("UPDATE jobs SET step = ?, progress = ?, updated = ? WHERE id = ?",
+                           (payload.get("step", ""), payload.get("progress", 0), now, job_id))
+            elif kind in ("success", "error", "need_confirmation"):
+                status = {"success": DONE, "error": FAILED, "need_confirmation": WAITING}[kind]
+                db.execute("UPDATE jobs SET status = ?, error = ?, updated = ? WHERE id = ?",
+                           (status, payload.get("error"), now, job_id))
+
+    def finish(self, job_id: str, error: Optional[str] = None):
+        """Close a job whose function returned or raised without reporting its outcome"""
+        job = self.get(job_id)
+        if job is None or job["status"] in FINISHED:
+            return
+        if error is None:
+            self.add_event(job_id, {"type": "success", "book_name": job["params"].get("book_name", "")})
+        else:
+            self.add_event(job_id, {"type": "error", "error": error})
+
+    def fail_orphans(self):
+        """Jobs left running by a worker that stopped sending heartbeats will never finish"""
+        alive = set(self.live_workers())
+        with self._connect() as db:
+            rows = db.execute("SELECT id, worker_pid FROM jobs WHERE status = ?", (RUNNING,)).fetchall()
+        for row in rows:
+            if row["worker_pid"] not in alive:
+                self.add_event(row["id"], {"type": "error", "error": "后台任务进程已退出"})
+
+    def heartbeat(self, pid: int):
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO workers (pid, heartbeat) VALUES (?, ?)", (pid, time.time()))
+
+    def remove_worker(self, pid: int):
+        with self._connect() as db:
+            db.execute("DELETE FROM workers WHERE pid = ?", (pid,))
+
+    def live_workers(self) -> List[int]:
+        """Workers whose process exists and whose heartbeat is recent"""
+        with self._connect() as db:
+            db.execute("DELETE FROM workers WHERE heartbeat < ?", (time.time() - WORKER_STALE_SECONDS,))
+            pids = [row["pid"] for row in db.execute("SELECT pid FROM workers").fetchall()]
+        alive = [pid for pid in pids if pid_alive(pid)]
+        for pid in set(pids) - set(alive):
+            self.remove_worker(pid)
+        return alive
+
+
+def ensure_worker(store: JobStore) -> Optional[int]:
+    """Start the worker process unless one is already running, returns the pid of a new worker"""
+    if store.live_workers():
+        return None
+    store.fail_orphans()
+    # 独立的会话，Streamlit 服务重启时不会结束正在运行的任务
+    process = subprocess.Popen(
+        [sys.executable, WORKER_SCRIPT, "--db", store.path],
+        cwd=os.getcwd(),
+        stdin=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    store.heartbeat(process.pid)
+    return process.pid
@@ -4,7 +4,6 @@ DeepReader 主聊天界面
 """
 
 import streamlit as st
-import openai
 import os
 import json
 from datetime import datetime
@@ -13,7 +12,12 @@ import io
 import base64
 from cairosvg import svg2png, svg2pdf
 
+import reader_path  # noqa: F401
+import llm
 from prompt import compress_text, get_card_system_prompt, get_card_response
+from catalog import get_catalog
+from chat_context import ChatContext, make_summarizer
+from retrieval import load_index
 
 # ============================================================================
 # 页面配置
@@ -28,60 +32,26 @@ st.set_page_config(
 # API 配置
 # ============================================================================
 def get_api_client():
-    """获取配置好的 OpenAI 客户端"""
-    openai_api_key = os.getenv("OPENAI_API_KEY")
-    openai_base_url = os.getenv("OPENAI_BASE_URL")
-    
-    if not openai_api_key:
+    """获取共享的 OpenAI 客户端，所有会话复用同一个连接池"""
+    if not os.getenv("OPENAI_API_KEY"):
         st.error("请设置 OPENAI_API_KEY 环境变量")
         st.stop()
-    
-    return openai.OpenAI(
-        base_url=openai_base_url,
-        api_key=openai_api_key,
-    )
+    return llm.get_client()
 
 client = get_api_client()
 model_name = os.getenv("DEEPREADER_MODEL_NAME", "gpt-4")
 
-def get_response(messages):
-    """从 LLM API 获取响应"""
-    try:
-        completion = client.chat.completions.create(
-            model=model_name,
-            messages=messages
-        )
-        return completion.choices[0].message.content
-    except Exception as e:
-        st.error(f"API 调用失败: {e}")
-        return None
+def stream_response(messages):
+    """从 LLM API 流式获取响应，逐块返回文本"""
+    # 无论正常结束、出错还是被取消，网关都会关闭连接
+    return llm.stream(messages, model_name)
 
 # ============================================================================
 # 书籍选择和会话管理
 # ============================================================================
-def find_book_prompt_dir(start_path="."):
-    """查找书籍提示文件目录"""
-    for root, dirs, files in os.walk(start_path):
-        if "book_prompt" in dirs:
-            return os.path.abspath(os.path.join(root, "book_prompt"))
-    return None
-
-def load_available_books():
-    """加载可用的书籍列表"""
-    book_prompt_dir = find_book_prompt_dir()
-    if not book_prompt_dir or not os.path.exists(book_prompt_dir):
-        st.error("未找到书籍提示目录")
-        return [], None
-    
-    try:
-        books = [book[:-3] for book in os.listdir(book_prompt_dir) if book.endswith('.md')]
-        return books, book_prompt_dir
-    except Exception as e:
-        st.error(f"加载书籍列表失败: {e}")
-        return [], None
-
-# 加载书籍列表（每次都重新加载以获取最新列表）
-books, book_prompt_dir = load_available_books()
+# 书籍目录在所有会话之间共享，只有文件变化时才重新读取
+catalog = get_catalog()
+books = catalog.titles()
 
 if not books:
     st.error('没有找到任何书籍，请先使用"添加新书"功能添加书籍')
@@ -123,12 +93,11 @@ if not selected_book:
     st.stop()
 
 # 加载书籍提示
-try:
-    with open(f"{book_prompt_dir}/{selected_book}.md", "r", encoding="utf-8") as f:
-        book_prompt = f.read()
-except Exception as e:
-    st.error(f"加载书籍信息失败: {e}")
+book_entry = catalog.get(selected_book)
+if book_entry is None:
+    st.error(f"加载书籍信息失败: 未找到《{selected_book}》")
     st.stop()
+book_prompt = book_entry.content
 
 # 清理聊天历史（当书籍更换时）
 if "previous_book" not in st.session_state:
@@ -199,10 +168,14 @@ ENFJ（外向、温暖、善于倾听和分享的朋友形象）
 提出三个关于这本书，可以引人思考的简短问题，只要三个问题。一行一个，不需要序号。
 """
         
-        response = get_response([
-            {"role": "system", "content": initial_prompt}, 
-            {"role": "user", "content": template_qa}
-        ])
+        try:
+            response = llm.complete([
+                {"role": "system", "content": initial_prompt}, 
+                {"role": "user", "content": template_qa}
+            ], model_name)
+        except Exception as e:
+            st.error(f"API 调用失败: {e}")
+            response = None
         
         if response:
             # 解析问题
@@ -289,6 +262,24 @@ initial_prompt = prompt_template.format(book_name=selected_book, book_prompt=boo
 if "messages" not in st.session_state or not st.session_state.messages:
     st.session_state.messages = []
     st.session_state.messages.append({"role": "system", "content": initial_prompt})
+    st.session_state.pop("chat_context", None)
+
+def with_retrieved_context(messages, question):
+    """已建立索引的书籍只在系统提示中放入和问题相关的片段"""
+    book_index = load_index(book_entry.path)
+    if book_index is None:
+        return messages
+    try:
+        context = book_index.retrieve(client, question)
+    except Exception as e:
+        print(f"检索失败，使用完整书籍提示: {e}")
+        return messages
+    system_prompt = prompt_template.format(book_name=selected_book, book_prompt=context)
+    return [{"role": "system", "content": system_prompt}] + messages[1:]
+
+# 只发送系统提示、对话摘要和最近几轮对话，控制每轮的 token 数
+if "chat_context" not in st.session_state:
+    st.session_state.chat_context = ChatContext(make_summarizer(model_name))
 
 # 显示聊天消息（跳过系统提示）
 for message in st.session_state.messages:
@@ -300,22 +291,38 @@ for message in st.session_state.messages:
 # ============================================================================
 # 聊天界面
 # ============================================================================
+if st.session_state.pop("stream_cancelled", False):
+    st.toast("已停止生成")
+
 if prompt := st.chat_input("输入你的想法..."):
     print(f"{prompt} {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     
     # 显示用户消息
     st.chat_message("user").markdown(prompt)
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    pending_messages = st.session_state.messages + [{"role": "user", "content": prompt}]
     
-    # 获取AI响应
-    with st.spinner('思考中...'):
-        response = get_response(st.session_state.messages)
+    # 流式显示AI响应
+    response = None
+    with st.chat_message("assistant"):
+        stop_placeholder = st.empty()
+        # 点击停止会触发重新运行并中断当前脚本，未完成的回复不会写入历史
+        stop_placeholder.button(
+            "⏹️ 停止生成",
+            key="stop_streaming",
+            on_click=lambda: st.session_state.update(stream_cancelled=True)
+        )
+        chunks = stream_response(st.session_state.chat_context.build(with_retrieved_context(pending_messages, prompt)))
+        try:
+            response = st.write_stream(chunks)
+        except Exception as e:
+            st.error(f"API 调用失败: {e}")
+        finally:
+            chunks.close()
+        stop_placeholder.empty()
     
     if response:
-        # 显示AI响应
-        with st.chat_message("assistant"):
-            st.markdown(response)
-        st.session_state.messages.append({"role": "assistant", "content": response})
+        # 回复完整后才写入会话
+        st.session_state.messages = pending_messages + [{"role": "assistant", "content": response}]
         
         # 保存聊天历史
         chat_history_dir = "website/chat_history"
@@ -461,5 +468,6 @@ with st.sidebar:
     
     if st.button("🗑️ 清空对话"):
         st.session_state.messages = [st.session_state.messages[0]]  # 保留系统提示
+        st.session_state.chat_context.reset()
         st.session_state.system_prompt = None
         st.rerun()
\ No newline at end of file
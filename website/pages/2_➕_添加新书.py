@@ -4,27 +4,13 @@
 """
 
 import streamlit as st
-import os
-import sys
-import threading
-import time
-import json
-from datetime import datetime
-import subprocess
-import queue
 
-# 添加reader目录到系统路径
-reader_path = os.path.join(os.path.dirname(__file__), '..', '..', 'reader')
-if reader_path not in sys.path:
-    sys.path.append(reader_path)
+from catalog import get_catalog
+from retrieval import index_new_book
+from jobs import JobStore, ensure_worker, QUEUED, RUNNING
 
-import douban_crawler
-import douban_cleaning
-import video_cleaning
-from parse_review import parse_reviews
-import report
-from bilibili_auto_crawler import auto_process_book_videos
-import bilibili_auto_crawler
+# 后台任务进度的轮询间隔（秒）
+JOB_POLL_SECONDS = 1.0
 
 # ============================================================================
 # 页面配置
@@ -56,377 +42,70 @@ if "generation_status" not in st.session_state:
         "book_info": None
     }
 
-if "status_queue" not in st.session_state:
-    st.session_state.status_queue = queue.Queue()
+if "job_id" not in st.session_state:
+    st.session_state.job_id = None
+    st.session_state.last_event_id = 0
 
 # ============================================================================
-# 辅助函数
+# 后台任务
 # ============================================================================
-def search_book_on_douban(book_name):
-    """搜索豆瓣书籍并返回结果"""
-    spider = douban_crawler.DoubanBookSpider()
-    book_urls = spider.search_book(book_name)
-    
-    if book_urls:
-        # 获取前3本书的信息
-        books_info = []
-        for i, url in enumerate(book_urls[:3]):
-            info = spider.get_book_info(url)
-            if info:
-                info['url'] = url
-                books_info.append(info)
-        return books_info
-    return []
+@st.cache_resource
+def get_job_store():
+    return JobStore()
 
-def generate_book_prompt_sync(book_name, include_video, status_queue, selected_book_url=None, auto_mode=False):
-    """同步生成书籍的完整处理流程（在线程中运行）"""
-    def update_status(step, progress, log_message):
-        """更新生成状态（线程安全）"""
-        status_queue.put({
-            "type": "update",
-            "step": step,
-            "progress": progress,
-            "log": f"[{datetime.now().strftime('%H:%M:%S')}] {log_message}"
-        })
-    
-    def run_with_progress(func, args, step_name, progress_start, progress_end):
-        """带进度更新的函数运行"""
-        update_status(step_name, progress_start, f"开始{step_name}...")
-        
-        try:
-            result = func(*args)
-            update_status(step_name, progress_end, f"✅ {step_name}完成")
-            return result
-        except Exception as e:
-            update_status(step_name, progress_end, f"❌ {step_name}失败: {str(e)}")
-            raise e
-    
-    try:
-        # 1. 搜索豆瓣书籍
-        if not selected_book_url:
-            update_status("搜索书籍", 0, f"正在豆瓣搜索《{book_name}》...")
-            books_info = search_book_on_douban(book_name)
-            
-            if not books_info:
-                raise Exception("未在豆瓣找到相关书籍")
-            
-            if auto_mode:
-                # 自动模式：选择第一本书
-                selected_book_url = books_info[0]['url']
-                update_status("自动选择", 5, f"自动选择：{books_info[0]['title']}")
-            else:
-                # 请求用户确认
-                status_queue.put({
-                    "type": "need_confirmation",
-                    "confirmation_type": "book_selection",
-                    "books_info": books_info
-                })
-                return  # 暂停执行，等待用户确认
-        
-        # 2. 爬取豆瓣书评（使用用户选择的URL）
-        update_status("爬取豆瓣", 10, f"开始爬取《{book_name}》的豆瓣书评...")
-        
-        # 创建一个临时的爬虫函数来使用指定的URL
-        def crawl_specific_book():
-            spider = douban_crawler.DoubanBookSpider()
-            # 获取书籍信息
-            update_status("爬取豆瓣", 10, f"正在获取书籍信息...")
-            book_info = spider.get_book_info(selected_book_url)
-            
-            # 创建保存目录
-            save_dir = f"{book_name}/website"
-            os.makedirs(save_dir, exist_ok=True)
-            
-            # 保存书籍信息
-            with open(f"{save_dir}/book_info.json", 'w', encoding='utf-8') as f:
-                json.dump(book_info, f, ensure_ascii=False, indent=2)
-            
-            # 获取评论URLs
-            update_status("爬取豆瓣", 12, f"正在获取书评列表...")
-            review_urls = spider.get_review_urls(selected_book_url, range=5)
-            total_reviews = len(review_urls[:5])
-            
-            # 逐条获取评论内容
-            reviews = []
-            for i, review_url in enumerate(review_urls[:5]):
-                update_status("爬取豆瓣", 12 + (i+1) * 8 / total_reviews, 
-                            f"正在处理第 {i+1}/{total_reviews} 条书评")
-                # 获取单条评论
-                review_data = spider.get_reviews([review_url])
-                if review_data:
-                    reviews.extend(review_data)
-                    # 保存评论
-                    review_content = review_data[0][1]
-                    with open(f"{save_dir}/review_{i+1}.txt", 'w', encoding='utf-8') as f:
-                        f.write(review_content)
-                time.sleep(2)  # 避免请求过快
-        
-        run_with_progress(
-            crawl_specific_book,
-            (),
-            "爬取豆瓣书评",
-            10, 20
-        )
-        
-        # 3. 清理豆瓣数据
-        run_with_progress(
-            douban_cleaning.clean_all_douban_files,
-            (f"{book_name}/website",),
-            "清理豆瓣数据",
-            20, 30
-        )
-        
-        # 4. 自动搜索和处理视频
-        if include_video:
-            def video_process():
-                update_status("搜索视频", 30, "正在搜索B站相关视频...")
-                
-                # 创建爬虫实例
-                crawler = bilibili_auto_crawler.BilibiliAutoCrawler()
-                
-                # 搜索视频
-                videos = crawler.search_videos(book_name)
-                if not videos:
-                    update_status("搜索视频", 35, "未找到相关视频")
-                    return
-                
-                update_status("搜索视频", 35, f"找到 {len(videos)} 个相关视频")
-                
-                # 创建链接文件
-                links_file = crawler.create_video_links_file(videos, book_name)
-                
-                # 下载视频（最多3个）
-                max_videos = min(3, len(videos))
-                for i, video in enumerate(videos[:max_videos]):
-                    progress = 35 + (i + 1) * 15 / max_videos
-                    video_title = video.get('title', '未知标题')[:30] + '...'
-                    video_url = f"https://www.bilibili.com/video/{video.get('bvid', '')}"
-                    update_status("下载视频", progress, 
-                                f"正在处理第 {i+1}/{max_videos} 个视频：{video_title}\n链接：{video_url}")
-                    
-                    # 下载单个视频
-                    try:
-                        # 首先尝试使用 lux
-                        video_dir = f"{book_name}/video"
-                        os.makedirs(video_dir, exist_ok=True)
-                        
-                        # 尝试使用 lux 下载
-                        lux_cmd = f"lux -o {video_dir} {video_url}"
-                        lux_result = subprocess.run(lux_cmd, shell=True, capture_output=True, text=True)
-                        
-                        if lux_result.returncode == 0:
-                            update_status("下载视频", progress, 
-                                        f"✅ 使用 lux 成功下载视频 {i+1}")
-                        else:
-                            # lux 失败，尝试使用 yt-dlp
-                            update_status("下载视频", progress, 
-                                        f"lux 下载失败，尝试使用 yt-dlp...")
-                            crawler.download_videos([video], book_name, 1)
-                        
-                        time.sleep(2)  # 避免请求过快
-                    except Exception as e:
-                        update_status("下载视频", progress, 
-                                    f"视频 {i+1} 下载失败，跳过：{str(e)[:50]}...")
-                        continue
-                
-                # 提取字幕
-                update_status("提取字幕", 48, "正在提取视频字幕...")
-                subtitle_text = crawler.extract_subtitles_text(book_name)
-                
-                update_status("视频处理完成", 50, f"✅ 视频处理完成，共处理 {max_videos} 个视频")
-            
-            run_with_progress(
-                video_process,
-                (),
-                "搜索视频书评",
-                30, 50
-            )
-            
-            # 5. 清理视频数据
-            def clean_video_data():
-                try:
-                    video_cleaning.clean_all_video_files(f"{book_name}/video")
-                except Exception as e:
-                    update_status("清理视频数据", 60, f"⚠️ 视频数据清理跳过: {str(e)}")
-                    # 不抛出异常，继续执行
-            
-            run_with_progress(
-                clean_video_data,
-                (),
-                "清理视频数据",
-                50, 60
-            )
-        else:
-            update_status("跳过视频处理", 60, "用户选择不包含视频书评")
-        
-        # 6. 解析书评
-        def parse_reviews_with_status():
-            try:
-                update_status("解析书评", 60, "正在读取收集到的书评...")
-                
-                # 统计文件数量
-                website_dir = f"{book_name}/website"
-                video_dir = f"{book_name}/video"
-                
-                website_files = []
-                video_files = []
-                
-                if os.path.exists(website_dir):
-                    website_files = [f for f in os.listdir(website_dir) if f.endswith('.txt')]
-                if os.path.exists(video_dir):
-                    video_files = [f for f in os.listdir(video_dir) if f.endswith('.txt')]
-                
-                total_files = len(website_files) + len(video_files)
-                update_status("解析书评", 65, f"找到 {len(website_files)} 个豆瓣书评，{len(video_files)} 个视频转录文本")
-                
-                # 执行解析
-                update_status("解析书评", 70, "正在分析书评内容，提取关键信息...")
-                parse_reviews(book_name)
-                
-                update_status("解析书评", 80, f"✅ 书评解析完成，共处理 {total_files} 个文件")
-            except Exception as e:
-                update_status("解析书评", 80, f"⚠️ 书评解析部分失败: {str(e)[:100]}...")
-                # 不抛出异常，继续执行
-        
-        run_with_progress(
-            parse_reviews_with_status,
-            (),
-            "解析书评内容",
-            60, 80
-        )
-        
-        # 7. 生成报告
-        def generate_report_with_status():
-            try:
-                update_status("生成报告", 80, "正在整合所有分析结果...")
-                
-                # 检查是否有解析的数据
-                parsed_data_path = f"{book_name}/parsed_data.json"
-                if not os.path.exists(parsed_data_path):
-                    # 如果没有解析数据，创建一个简单的报告
-                    update_status("生成报告", 85, "未找到解析数据，生成基础报告...")
-                    
-                    # 读取原始书评创建简单报告
-                    reviews = []
-                    website_dir = f"{book_name}/website"
-                    if os.path.exists(website_dir):
-                        for file in os.listdir(website_dir):
-                            if file.endswith('.txt') and not file.endswith('_cleaned.txt'):
-                                with open(os.path.join(website_dir, file), 'r', encoding='utf-8') as f:
-                                    reviews.append(f.read()[:500])  # 取前500字符
-                    
-                    # 创建简单报告
-                    simple_report = f"""# 《{book_name}》书评汇总
-
-## 收集到的书评摘要
+def apply_event(update):
+    """把后台任务的一条进度事件合并到页面状态"""
+    status = st.session_state.generation_status
+    if update["type"] == "update":
+        status["current_step"] = update["step"]
+        status["progress"] = update["progress"]
+        status["logs"].append(update["log"])
+    elif update["type"] == "need_confirmation":
+        status["waiting_confirmation"] = True
+        status["confirmation_type"] = update["confirmation_type"]
+        if update["confirmation_type"] == "book_selection":
+            status["books_info"] = update["books_info"]
+        elif update["confirmation_type"] == "add_to_chat":
+            status["prompt_content"] = update["prompt_content"]
+            status["book_name"] = update["book_name"]
+    elif update["type"] == "progress":
+        # 各阶段的实际进度、速度和预计剩余时间
+        status["tasks"] = update["tasks"]
+    elif update["type"] == "success":
+        status["is_running"] = False
+        status["success"] = True
+        status["book_name"] = update["book_name"]
+    elif update["type"] == "error":
+        status["is_running"] = False
+        status["error"] = update["error"]
+    st.session_state.last_event_id = update["event_id"]
 
-"""
-                    for i, review in enumerate(reviews[:5]):  # 最多显示5条
-                        simple_report += f"### 书评 {i+1}\n{review}...\n\n"
-                    
-                    # 保存报告
-                    report_path = f"{book_name}/report.md"
-                    with open(report_path, "w", encoding="utf-8") as f:
-                        f.write(simple_report)
-                else:
-                    # 执行正常的报告生成
-                    report.report_parser(book_name)
-                
-                update_status("生成报告", 90, "✅ 综合报告生成完成")
-            except Exception as e:
-                update_status("生成报告", 90, f"⚠️ 报告生成部分失败: {str(e)[:100]}...")
-                # 创建最基础的报告
-                basic_report = f"""# 《{book_name}》阅读指南
+def start_job(params):
+    """提交添加新书任务，由独立的后台进程执行，页面刷新或服务重启都不会中断"""
+    store = get_job_store()
+    job_id = store.submit("add_book", params)
+    ensure_worker(store)
+    st.session_state.job_id = job_id
+    st.session_state.last_event_id = 0
+    # 记录在 URL 中，刷新页面后可以重新连接到任务
+    st.query_params["job"] = job_id
 
-## 书籍信息
-书名：《{book_name}》
+def forget_job():
+    st.session_state.job_id = None
+    st.session_state.last_event_id = 0
+    st.query_params.pop("job", None)
 
-## 内容简介
-（根据收集的书评整理）
-
-本书的详细内容正在整理中...
-"""
-                report_path = f"{book_name}/report.md"
-                os.makedirs(book_name, exist_ok=True)
-                with open(report_path, "w", encoding="utf-8") as f:
-                    f.write(basic_report)
-        
-        run_with_progress(
-            generate_report_with_status,
-            (),
-            "生成综合报告",
-            80, 90
-        )
-        
-        # 8. 生成并保存prompt
-        update_status("生成Prompt", 90, "正在生成最终的书籍prompt...")
-        
-        # 清理视频文件以节省空间（保留字幕）
-        try:
-            video_dir = f"{book_name}/video"
-            if os.path.exists(video_dir):
-                for file in os.listdir(video_dir):
-                    file_path = os.path.join(video_dir, file)
-                    # 只删除视频文件，保留txt字幕文件
-                    if os.path.isfile(file_path) and not file.endswith('.txt'):
-                        os.remove(file_path)
-                        print(f"Removed video file: {file}")
-        except Exception as e:
-            print(f"Error cleaning video files: {e}")
-        
-        # 读取生成的报告
-        report_path = f"{book_name}/report.md"
-        if os.path.exists(report_path):
-            with open(report_path, "r", encoding="utf-8") as f:
-                report_content = f.read()
-            
-            # 生成prompt格式
-            prompt_content = f"""# 《{book_name}》深度阅读指南
-
-## 书籍概览
-{report_content}
-
-## 讨论要点
-- 探讨书中的核心主题和思想
-- 分析主要人物的成长和变化
-- 思考书中观点对现实生活的启发
-- 分享个人的阅读感受和思考
-
-## 推荐问题
-1. 这本书最打动你的地方是什么？
-2. 书中的哪个观点让你产生了新的思考？
-3. 如果你是书中的主人公，你会做出什么不同的选择？
-"""
-            
-            if auto_mode:
-                # 自动模式：直接保存
-                book_prompt_dir = os.path.join(os.path.dirname(__file__), "..", "book_prompt")
-                os.makedirs(book_prompt_dir, exist_ok=True)
-                
-                prompt_file = os.path.join(book_prompt_dir, f"{book_name}.md")
-                with open(prompt_file, "w", encoding="utf-8") as f:
-                    f.write(prompt_content)
-                
-                update_status("完成", 100, f"✅ 《{book_name}》的prompt已生成并保存")
-                status_queue.put({"type": "success", "book_name": book_name})
-            else:
-                # 暂时保存prompt内容，等待用户确认
-                status_queue.put({
-                    "type": "need_confirmation",
-                    "confirmation_type": "add_to_chat",
-                    "prompt_content": prompt_content,
-                    "book_name": book_name
-                })
-                
-                update_status("完成", 100, f"✅ 《{book_name}》的prompt已生成，等待确认")
-        else:
-            raise Exception("报告生成失败，未找到报告文件")
-            
-    except Exception as e:
-        # 失败时不删除已收集的数据
-        update_status("错误", 100, f"❌ 生成失败: {str(e)}")
-        update_status("提示", 100, "⚠️ 已收集的数据保留在相应目录中")
-        status_queue.put({"type": "error", "error": str(e)})
+# 刷新页面后根据 URL 中的任务 ID 重新连接，重放已记录的进度
+if st.session_state.job_id is None and st.query_params.get("job"):
+    job = get_job_store().get(st.query_params["job"])
+    if job is not None:
+        st.session_state.job_id = job["id"]
+        st.session_state.generation_status.update({
+            "current_step": "", "progress": 0, "logs": [], "is_running": True,
+            "success": False, "error": None, "waiting_confirmation": False, "confirmation_type": None, "tasks": []
+        })
+        for update in get_job_store().events(job["id"]):
+            apply_event(update)
 
 # ============================================================================
 # 主界面
@@ -479,30 +158,49 @@ with col1:
                 "selected_book_url": None,
                 "book_info": None
             }
-            st.session_state.status_queue = queue.Queue()
             
-            # 在新线程中运行生成过程
-            generation_thread = threading.Thread(
-                target=generate_book_prompt_sync,
-                args=(book_name, include_video, st.session_state.status_queue, None, auto_mode)
-            )
-            generation_thread.daemon = True
-            generation_thread.start()
+            # 在后台任务进程中运行生成过程
+            start_job({"book_name": book_name, "include_video": include_video, "auto_mode": auto_mode})
             st.rerun()
         else:
             st.error("请输入书籍名称")
 
-with col2:
+# 任务运行时只有进度和日志区域定时刷新，其余部分不重新运行
+polling = st.session_state.generation_status["is_running"] and not st.session_state.generation_status["waiting_confirmation"]
+
+@st.fragment(run_every=JOB_POLL_SECONDS if polling else None)
+def show_progress():
+    status = st.session_state.generation_status
+    if st.session_state.job_id and status["is_running"] and not status["waiting_confirmation"]:
+        store = get_job_store()
+        updates = store.events(st.session_state.job_id, after=st.session_state.last_event_id)
+        for update in updates:
+            apply_event(update)
+        if not updates:
+            job = store.get(st.session_state.job_id)
+            if job is not None and job["status"] in (QUEUED, RUNNING):
+                # 后台进程意外退出时重新启动，遗留的任务会被标记为失败
+                ensure_worker(store)
+        if not status["is_running"] or status["waiting_confirmation"]:
+            # 需要确认或已结束，刷新整个页面
+            st.rerun()
+
     st.markdown("### 📊 生成进度")
     
     # 当前步骤
-    if st.session_state.generation_status["current_step"]:
-        st.info(f"当前步骤: {st.session_state.generation_status['current_step']}")
+    if status["current_step"]:
+        st.info(f"当前步骤: {status['current_step']}")
     
     # 进度条
-    progress = st.session_state.generation_status["progress"]
+    progress = status["progress"]
     st.progress(progress / 100)
     st.caption(f"进度: {progress}%")
+    if status["is_running"]:
+        for task in status.get("tasks", []):
+            st.caption(task["description"])
+
+with col2:
+    show_progress()
 
 # ============================================================================
 # 确认界面
@@ -531,19 +229,13 @@ if st.session_state.generation_status["waiting_confirmation"]:
                     st.session_state.generation_status["book_info"] = book
                     st.session_state.generation_status["waiting_confirmation"] = False
                     
-                    # 重启线程继续处理
-                    generation_thread = threading.Thread(
-                        target=generate_book_prompt_sync,
-                        args=(
-                            book_name, 
-                            include_video, 
-                            st.session_state.status_queue,
-                            book['url'],
-                            False  # 用户手动确认后，不再使用自动模式
-                        )
-                    )
-                    generation_thread.daemon = True
-                    generation_thread.start()
+                    # 提交新的任务继续处理
+                    job_params = get_job_store().get(st.session_state.job_id)["params"]
+                    start_job(dict(
+                        job_params,
+                        selected_book_url=book['url'],
+                        auto_mode=False  # 用户手动确认后，不再使用自动模式
+                    ))
                     st.rerun()
         
         # 查看豆瓣链接
@@ -566,13 +258,11 @@ if st.session_state.generation_status["waiting_confirmation"]:
         with col1:
             if st.button("📖 确认添加到聊天室", type="primary"):
                 # 保存prompt文件
-                book_prompt_dir = os.path.join(os.path.dirname(__file__), "..", "book_prompt")
-                os.makedirs(book_prompt_dir, exist_ok=True)
-                
                 book_name = st.session_state.generation_status.get("book_name", "")
-                prompt_file = os.path.join(book_prompt_dir, f"{book_name}.md")
-                with open(prompt_file, "w", encoding="utf-8") as f:
-                    f.write(st.session_state.generation_status.get("prompt_content", ""))
+                prompt_file = get_catalog().save(book_name, st.session_state.generation_status.get("prompt_content", ""))
+                with st.spinner("正在建立检索索引..."):
+                    index_new_book(prompt_file, book_name)
+                forget_job()
                 
                 # 重置状态
                 st.session_state.generation_status = {
@@ -593,6 +283,7 @@ if st.session_state.generation_status["waiting_confirmation"]:
         
         with col2:
             if st.button("❌ 取消"):
+                forget_job()
                 # 重置状态
                 st.session_state.generation_status = {
                     "current_step": "",
@@ -609,50 +300,14 @@ if st.session_state.generation_status["waiting_confirmation"]:
                 }
                 st.rerun()
 
-# ============================================================================
-# 处理队列中的状态更新
-# ============================================================================
-if st.session_state.generation_status["is_running"]:
-    # 处理所有待处理的状态更新
-    while not st.session_state.status_queue.empty():
-        try:
-            update = st.session_state.status_queue.get_nowait()
-            
-            if update["type"] == "update":
-                st.session_state.generation_status["current_step"] = update["step"]
-                st.session_state.generation_status["progress"] = update["progress"]
-                st.session_state.generation_status["logs"].append(update["log"])
-            elif update["type"] == "need_confirmation":
-                st.session_state.generation_status["waiting_confirmation"] = True
-                st.session_state.generation_status["confirmation_type"] = update["confirmation_type"]
-                if update["confirmation_type"] == "book_selection":
-                    st.session_state.generation_status["books_info"] = update["books_info"]
-                elif update["confirmation_type"] == "add_to_chat":
-                    st.session_state.generation_status["prompt_content"] = update["prompt_content"]
-                    st.session_state.generation_status["book_name"] = update["book_name"]
-            elif update["type"] == "success":
-                st.session_state.generation_status["is_running"] = False
-                st.session_state.generation_status["success"] = True
-                st.session_state.generation_status["book_name"] = update["book_name"]
-            elif update["type"] == "error":
-                st.session_state.generation_status["is_running"] = False
-                st.session_state.generation_status["error"] = update["error"]
-        except queue.Empty:
-            break
-    
-    # 自动刷新
-    if not st.session_state.generation_status["waiting_confirmation"]:
-        time.sleep(0.5)
-        st.rerun()
-
 # ============================================================================
 # 日志显示
 # ============================================================================
 st.markdown("### 📝 处理日志")
 
 # 显示日志
-log_container = st.container()
-with log_container:
+@st.fragment(run_every=JOB_POLL_SECONDS if polling else None)
+def show_logs():
     logs = st.session_state.generation_status["logs"]
     if logs:
         # 创建一个可滚动的容器
@@ -670,6 +325,8 @@ with log_container:
     else:
         st.text("等待开始...")
 
+show_logs()
+
 # ============================================================================
 # 成功提示
 # ============================================================================
@@ -679,6 +336,7 @@ if st.session_state.generation_status["success"]:
     
     # 提供跳转按钮
     if st.button("📖 前往聊天页面"):
+        forget_job()
         # 设置 URL 参数
         st.query_params["book"] = book_name
         # 重置状态
@@ -739,11 +397,9 @@ with st.sidebar:
     
     # 显示已生成的书籍
     st.markdown("### 📚 已生成书籍")
-    book_prompt_dir = os.path.join(os.path.dirname(__file__), "..", "book_prompt")
-    if os.path.exists(book_prompt_dir):
-        books = [f[:-3] for f in os.listdir(book_prompt_dir) if f.endswith('.md')]
-        if books:
-            for book in sorted(books)[-10:]:  # 显示最近10本
-                st.text(f"📖 {book}")
-        else:
-            st.text("暂无已生成的书籍")
\ No newline at end of file
+    books = sorted(get_catalog().books(), key=lambda book: book.mtime)
+    if books:
+        for book in books[-10:]:  # 显示最近10本
+            st.text(f"📖 {book.title}")
+    else:
+        st.text("暂无已生成的书籍")
\ No newline at end of file
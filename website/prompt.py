@@ -1,6 +1,9 @@
 import random
 import os
-import openai
+
+# LLM 网关在 reader/llm.py
+import reader_path  # noqa: F401
+import llm
 
 # ============================================================================
 # Prompt Configuration
@@ -219,19 +222,12 @@ if card_model_name is None:
     card_model_name = "gpt-4.1"
 
 def get_client():
-    client = openai.OpenAI(
-        base_url=openai_base_url,
-        api_key=openai_api_key,
-    )
-    return client
+    """Pooled client shared with the rest of DeepReader, see reader/llm.py"""
+    return llm.get_client()
 
 def get_response(client, messages):
     """Get response from the LLM API"""
-    completion = client.chat.completions.create(
-        model=model_name,
-        messages=messages
-    )
-    return completion.choices[0].message.content
+    return llm.complete(messages, model_name)
 
 def three_person_generation(book_name, book_prompt):
     """
@@ -262,11 +258,8 @@ def three_person_generation(book_name, book_prompt):
 
 def get_card_response(client, messages):
     """Get response from the LLM API"""
-    completion = client.chat.completions.create(
-        model=card_model_name,
-        messages=messages
-    )
-    return completion.choices[0].message.content
+    # 重试生成书签时需要新的回复，不使用缓存
+    return llm.complete(messages, card_model_name)
 
 def get_card_system_prompt():
     card_system_prompt = f"""
@@ -421,11 +414,7 @@ def style_prompt(style_guide, preference_type, preference_name, text_original=""
 
 def get_embedding(client, embedding_model_name="text-embedding-3-small", text=""):
     """Get embedding from the LLM API"""
-    completion = client.embeddings.create(
-        model=embedding_model_name,
-        input=text
-    )
-    return completion.data[0].embedding
+    return llm.embed([text], embedding_model_name)[0]
 
 def message_rephrase(client, messages, name1, name2, name3):
     """Rephrase the message"""
@@ -442,11 +431,10 @@ def message_rephrase(client, messages, name1, name2, name3):
 {name2}：xxx
 {name3}：xxx
     """
-    completion = client.chat.completions.create(
-        model=model_name,
-        messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": messages}]
-    )
-    return completion.choices[0].message.content.split("\n")
+    return llm.complete(
+        [{"role": "system", "content": system_prompt}, {"role": "user", "content": messages}],
+        model_name
+    ).split("\n")
 
 
 def compress_text(client, text):
@@ -458,14 +446,14 @@ def compress_text(client, text):
     将主要内容分点列出，每点之间用一个空行隔开。
     尽量简洁到 10 条以内。
     """
-    completion = client.chat.completions.create(
-        model=card_model_name,
-        messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": text}]
+    return llm.complete(
+        [{"role": "system", "content": system_prompt}, {"role": "user", "content": text}],
+        card_model_name
     )
-    return completion.choices[0].message.content
 import random
 import os
-import openai
+
+import llm
 
 # ============================================================================
 # Prompt Configuration
@@ -679,19 +667,12 @@ if card_model_name is None:
     card_model_name = "gpt-4.1"
 
 def get_client():
-    client = openai.OpenAI(
-        base_url=openai_base_url,
-        api_key=openai_api_key,
-    )
-    return client
+    """Pooled client shared with the rest of DeepReader, see reader/llm.py"""
+    return llm.get_client()
 
 def get_response(client, messages):
     """Get response from the LLM API"""
-    completion = client.chat.completions.create(
-        model=model_name,
-        messages=messages
-    )
-    return completion.choices[0].message.content
+    return llm.complete(messages, model_name)
 
 def three_person_generation(book_name, book_prompt):
     """
@@ -722,11 +703,8 @@ def three_person_generation(book_name, book_prompt):
 
 def get_card_response(client, messages):
     """Get response from the LLM API"""
-    completion = client.chat.completions.create(
-        model=card_model_name,
-        messages=messages
-    )
-    return completion.choices[0].message.content
+    # 重试生成书签时需要新的回复，不使用缓存
+    return llm.complete(messages, card_model_name)
 
 def get_card_system_prompt(selected_book, book_prompt):
     card_system_prompt = f"""
@@ -881,11 +859,7 @@ def style_prompt(style_guide, preference_type, preference_name, text_original=""
 
 def get_embedding(client, embedding_model_name="text-embedding-3-small", text=""):
     """Get embedding from the LLM API"""
-    completion = client.embeddings.create(
-        model=embedding_model_name,
-        input=text
-    )
-    return completion.data[0].embedding
+    return llm.embed([text], embedding_model_name)[0]
 
 def message_rephrase(client, messages, name1, name2, name3):
     """Rephrase the message"""
@@ -902,8 +876,7 @@ def message_rephrase(client, messages, name1, name2, name3):
 {name2}：xxx
 {name3}：xxx
     """
-    completion = client.chat.completions.create(
-        model=model_name,
-        messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": messages}]
-    )
-    return completion.choices[0].message.content.split("\n")
+    return llm.complete(
+        [{"role": "system", "content": system_prompt}, {"role": "user", "content": messages}],
+        model_name
+    ).split("\n")
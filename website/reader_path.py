@@ -0,0 +1,13 @@
+"""
+Puts the reader directory on sys.path
+
+reader 模块（包括 LLM 网关 llm.py）之间按模块名互相导入，网站中用到 reader
+模块的文件都先 import reader_path，不依赖其它模块的导入顺序。
+"""
+
+import os
+import sys
+
+READER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "reader")
+if READER_DIR not in sys.path:
+    sys.path.append(READER_DIR)
@@ -0,0 +1,175 @@
+"""
+Retrieval of book context for the DeepReader chat pages
+
+When a book is added its report and the snippets of parsed_data.json are split
+into chunks and embedded once. The embeddings are stored next to the prompt file,
+each chat turn then only sends the chunks closest to the user message.
+"""
+
+import hashlib
+import json
+import os
+import sys
+from typing import Dict, List, Optional
+
+import streamlit as st
+
+from embeddings import EMBEDDING_MODEL_NAME, EmbeddingService
+from utils import count_tokens
+from vector_store import VectorStore
+
+# 每个片段的最大 token 数
+RAG_CHUNK_TOKENS = int(os.getenv("DEEPREADER_RAG_CHUNK_TOKENS", 300))
+# 每轮检索的片段数和总 token 上限
+RAG_TOP_K = int(os.getenv("DEEPREADER_RAG_TOP_K", 4))
+RAG_CONTEXT_TOKENS = int(os.getenv("DEEPREADER_RAG_CONTEXT_TOKENS", 800))
+
+INDEX_SUFFIX = ".index.json"
+
+SECTIONS = {"story": "剧情", "feeling": "感受", "evaluation": "评价", "thinking": "思考"}
+
+
+def index_base(prompt_path: str) -> str:
+    """Common prefix of the index files of a book"""
+    return prompt_path[:-3] if prompt_path.endswith(".md") else prompt_path
+
+
+def split_text(text: str, max_tokens: int = RAG_CHUNK_TOKENS) -> List[str]:
+    """Split text at blank lines into chunks of at most max_tokens, a chunk keeps its markdown heading"""
+    chunks, current, size, heading = [], [], 0, ""
+    for paragraph in (part.strip() for part in text.split("\n\n")):
+        if not paragraph:
+            continue
+        if paragraph.startswith("#"):
+            heading = paragraph.splitlines()[0]
+        tokens = count_tokens(paragraph)
+        if current and size + tokens > max_tokens:
+            chunks.append("\n\n".join(current))
+            current, size = ([heading] if heading and not paragraph.startswith("#") else []), 0
+        current.append(paragraph)
+        size += tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def build_chunks(book_prompt: str, parsed_data: Optional[List[list]] = None) -> List[Dict]:
+    """Chunks of the book report followed by one chunk per review section"""
+    chunks = [{"source": "report", "text": text} for text in split_text(book_prompt)]
+    for row in parsed_data or []:
+        source = row[0]
+        for label, text in zip(SECTIONS.values(), row[2:6]):
+            text = str(text or "").strip()
+            if not text or text.startswith("没有涉及"):
+                continue
+            for part in split_text(text):
+                chunks.append({"source": source, "text": f"{label}（来自{source}书评）：{part}"})
+    return chunks
+
+
+def content_hash(book_prompt: str, parsed_data: Optional[List[list]]) -> str:
+    payload = json.dumps([EMBEDDING_MODEL_NAME, book_prompt, parsed_data], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def index_book(client, prompt_path: str, parsed_data_path: Optional[str] = None) -> int:
+    """
+    Embed the chunks of a book and store them next to its prompt file
+
+    Returns the number of chunks. Nothing is recomputed when the prompt and the
+    parsed reviews did not change since the last call.
+    """
+    with open(prompt_path, "r", encoding="utf-8") as f:
+        book_prompt = f.read()
+    parsed_data = None
+    if parsed_data_path and os.path.exists(parsed_data_path):
+        with open(parsed_data_path, "r", encoding="utf-8") as f:
+            parsed_data = json.load(f)
+
+    base = index_base(prompt_path)
+    digest = content_hash(book_prompt, parsed_data)
+    store = VectorStore(base)
+    if os.path.exists(base + INDEX_SUFFIX):
+        with open(base + INDEX_SUFFIX, "r", encoding="utf-8") as f:
+            if json.load(f).get("hash") == digest and len(store):
+                return len(store)
+
+    chunks = build_chunks(book_prompt, parsed_data)
+    service = EmbeddingService(client)
+    embeddings = service.embed([chunk["text"] for chunk in chunks])
+    print(f"Embedded {len(chunks)} chunks with {service.requests} requests ({service.hits} cached)")
+
+    store.clear()
+    if chunks:
+        store.add(list(range(len(chunks))), embeddings, chunks)
+    with open(base + INDEX_SUFFIX, "w", encoding="utf-8") as f:
+        json.dump({"model": EMBEDDING_MODEL_NAME, "hash": digest}, f, ensure_ascii=False)
+    return len(chunks)
+
+
+def index_new_book(prompt_path: str, book_dir: str):
+    """Index a book right after its prompt was saved, a failure only disables retrieval for it"""
+    from prompt import get_client
+    try:
+        count = index_book(get_client(), prompt_path, os.path.join(book_dir, "parsed_data.json"))
+        print(f"Indexed {count} chunks for {prompt_path}")
+    except Exception as e:
+        print(f"Failed to index {prompt_path}, the full prompt will be used instead: {e}")
+
+
+class BookIndex:
+    """Embedded chunks of one book"""
+
+    def __init__(self, store: VectorStore, model: str = EMBEDDING_MODEL_NAME):
+        self.store = store
+        self.model = model
+
+    def search(self, query_embedding, k: int = RAG_TOP_K) -> List[Dict]:
+        """The k chunks most similar to the query, best first"""
+        return [dict(record, score=score) for record, score in self.store.search(query_embedding, k)[0]]
+
+    def retrieve(self, client, query: str, k: int = RAG_TOP_K, max_tokens: int = RAG_CONTEXT_TOKENS) -> str:
+        """Context text for one user message"""
+        selected, used = [], 0
+        for chunk in self.search(EmbeddingService(client, self.model).embed_one(query), k):
+            tokens = count_tokens(chunk["text"])
+            if selected and used + tokens > max_tokens:
+                break
+            selected.append(chunk["text"])
+            used += tokens
+        return "\n\n---\n\n".join(selected)
+
+
+@st.cache_resource
+def _open_store(base: str) -> VectorStore:
+    # one memory-mapped store per book for all sessions, it reopens itself when the files change
+    return VectorStore(base)
+
+
+def load_index(prompt_path: str) -> Optional[BookIndex]:
+    """Index of a book, None for books added before retrieval existed"""
+    base = index_base(prompt_path)
+    try:
+        with open(base + INDEX_SUFFIX, "r", encoding="utf-8") as f:
+            model = json.load(f).get("model", EMBEDDING_MODEL_NAME)
+    except (OSError, ValueError):
+        return None
+    store = _open_store(base)
+    if not len(store):
+        return None
+    return BookIndex(store, model)
+
+
+if __name__ == "__main__":
+    # 为已有书籍建立索引：python website/retrieval.py [书名 ...]
+    from catalog import get_catalog
+    from prompt import get_client
+
+    catalog = get_catalog()
+    for title in sys.argv[1:] or catalog.titles():
+        entry = catalog.get(title)
+        if entry is None:
+            print(f"未找到《{title}》")
+            continue
+        count = index_book(get_client(), entry.path, os.path.join(title, "parsed_data.json"))
+        print(f"《{title}》: {count} 个片段")
@@ -9,6 +9,9 @@ from datetime import datetime
 from typing import List, Dict, Optional
 import streamlit as st
 
+import reader_path  # noqa: F401
+import llm
+
 
 def ensure_directory(path: str) -> None:
     """Ensure directory exists, create if not"""
@@ -88,6 +91,11 @@ def calculate_reading_time(text: str, wpm: int = 250) -> int:
     return max(1, round(word_count / wpm))
 
 
+def count_tokens(text: str) -> int:
+    """Count tokens with the same encoding as the LLM gateway"""
+    return llm.count_tokens(text)
+
+
 def truncate_text(text: str, max_length: int = 100) -> str:
     """Truncate text with ellipsis"""
     if len(text) <= max_length:
@@ -0,0 +1,239 @@
+"""
+Memory-mapped embedding store for the DeepReader retrieval index
+"""
+
+import json
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+VECTOR_DTYPE = os.getenv("DEEPREADER_VECTOR_DTYPE", "float16")
+# 超过这个向量数后使用 IVF 粗分区，只在最接近的几个分区里精确计算
+IVF_THRESHOLD = int(os.getenv("DEEPREADER_IVF_THRESHOLD", 4096))
+IVF_NPROBE = int(os.getenv("DEEPREADER_IVF_NPROBE", 8))
+# 精确搜索时每批计算的向量数，限制临时内存
+SEARCH_BLOCK_ROWS = 65536
+
+VECTORS_SUFFIX = ".vectors.npy"
+IDS_SUFFIX = ".ids.jsonl"
+IVF_SUFFIX = ".ivf.npz"
+STORE_SUFFIXES = (VECTORS_SUFFIX, IDS_SUFFIX, IVF_SUFFIX)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def kmeans(vectors: np.ndarray, clusters: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means, returns normalized centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), clusters, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        for cluster in range(clusters):
+            members = vectors[assignments == cluster]
+            if len(members):
+                centroids[cluster] = members.mean(axis=0)
+        centroids = normalize(centroids)
+    return centroids
+
+
+class VectorStore:
+    """
+    Append-only matrix of normalized vectors in {base}.vectors.npy
+
+    The .npy file is allocated with spare rows and grows by doubling, rows are
+    appended in place through a memmap. {base}.ids.jsonl has one record per
+    valid row and is written after the vectors, so its length is the number of
+    rows a reader may use. Readers map the file read-only, any number of
+    sessions and processes share the same pages through the OS cache.
+    Only one process should add to a store at a time.
+    """
+
+    def __init__(self, base: str, dtype: str = VECTOR_DTYPE, ivf_threshold: int = IVF_THRESHOLD):
+        self.vectors_path = base + VECTORS_SUFFIX
+        self.ids_path = base + IDS_SUFFIX
+        self.ivf_path = base + IVF_SUFFIX
+        self.dtype = np.dtype(dtype)
+        self.ivf_threshold = ivf_threshold
+        self.lock = threading.Lock()
+        self._matrix = None
+        self._records: List[Dict] = []
+        self._ivf = None
+        self._version = None
+
+    # ------------------------------------------------------------------
+    # reading
+    # ------------------------------------------------------------------
+    def _file_version(self) -> Optional[Tuple]:
+        try:
+            return tuple((os.stat(path).st_ino, os.stat(path).st_mtime_ns)
+                         for path in (self.vectors_path, self.ids_path))
+        except OSError:
+            return None
+
+    def _load(self):
+        """(Re)open the files when another process changed them"""
+        version = self._file_version()
+        if version == self._version:
+            return
+        with self.lock:
+            self._version = version
+            if version is None:
+                self._matrix, self._records, self._ivf = None, [], None
+                return
+            self._matrix = np.load(self.vectors_path, mmap_mode="r")
+            records = []
+            with open(self.ids_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # the writer is still appending this line
+                        break
+            self._records = records[:len(self._matrix)]
+            self._ivf = None
+            if os.path.exists(self.ivf_path):
+                ivf = np.load(self.ivf_path)
+                self._ivf = (ivf["centroids"], ivf["assignments"], int(ivf["built_count"]))
+
+    def __len__(self) -> int:
+        self._load()
+        return len(self._records)
+
+    @property
+    def records(self) -> List[Dict]:
+        self._load()
+        return self._records
+
+    def vectors(self) -> np.ndarray:
+        """Valid rows, a read-only view of the memmap"""
+        self._load()
+        if self._matrix is None:
+            return np.zeros((0, 0), dtype=self.dtype)
+        return self._matrix[:len(self._records)]
+
+    # ------------------------------------------------------------------
+    # writing
+    # ------------------------------------------------------------------
+    def _allocate(self, rows: int, dim: int) -> np.memmap:
+        """Create or grow the vectors file to hold at least rows rows"""
+        existing = np.load(self.vectors_path, mmap_mode="r") if os.path.exists(self.vectors_path) else None
+        if existing is not None and existing.shape[0] >= rows:
+            if existing.shape[1] != dim:
+                raise ValueError(f"Vectors have {dim} dimensions, the store has {existing.shape[1]}")
+            return np.load(self.vectors_path, mmap_mode="r+")
+        capacity = max(rows, 2 * (existing.shape[0] if existing is not None else 0), 64)
+        tmp_path = self.vectors_path + ".tmp.npy"
+        grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=self.dtype, shape=(capacity, dim))
+        if existing is not None:
+            grown[:existing.shape[0]] = existing
+        grown.flush()
+        del grown
+        os.replace(tmp_path, self.vectors_path)
+        return np.load(self.vectors_path, mmap_mode="r+")
+
+    def add(self, ids: Sequence, vectors, payloads: Optional[Iterable[Dict]] = None):
+        """Append vectors with their ids and optional payloads"""
+        vectors = normalize(vectors)
+        if len(ids) != len(vectors):
+            raise ValueError("ids and vectors must have the same length")
+        payloads = list(payloads) if payloads is not None else [{} for _ in ids]
+        self._load()
+        with self.lock:
+            start = len(self._records)
+            matrix = self._allocate(start + len(vectors), vectors.shape[1])
+            matrix[start:start + len(vectors)] = vectors.astype(self.dtype)
+            matrix.flush()
+            del matrix
+            with open(self.ids_path, "a", encoding="utf-8") as f:
+                for item_id, payload in zip(ids, payloads):
+                    f.write(json.dumps({"id": item_id, **payload}, ensure_ascii=False) + "\n")
+        self._version = None
+        self._update_ivf()
+
+    def _update_ivf(self):
+        """Assign new rows to their partition, rebuild the partition when the store doubled"""
+        count = len(self)
+        if count < self.ivf_threshold:
+            return
+        vectors = self.vectors()
+        if self._ivf is not None and self._ivf[2] * 2 > count:
+            centroids, assignments, built_count = self._ivf
+            new = np.asarray(vectors[len(assignments):], dtype=np.float32)
+            assignments = np.concatenate([assignments, np.argmax(new @ centroids.T, axis=1)])
+        else:
+            # a sample is enough to place the centroids
+            sample_rows = np.random.default_rng(0).choice(count, min(count, 50000), replace=False)
+            sample = np.asarray(vectors[np.sort(sample_rows)], dtype=np.float32)
+            centroids = kmeans(sample, int(np.sqrt(count)))
+            built_count = count
+            assignments = np.concatenate([
+                np.argmax(np.asarray(vectors[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32) @ centroids.T, axis=1)
+                for start in range(0, count, SEARCH_BLOCK_ROWS)
+            ])
+        tmp_path = self.ivf_path + ".tmp.npz"
+        assignments = assignments.astype(np.int32)
+        np.savez(tmp_path, centroids=centroids, assignments=assignments, built_count=built_count)
+        os.replace(tmp_path, self.ivf_path)
+        self._ivf = (centroids, assignments, built_count)
+
+    def clear(self):
+        with self.lock:
+            for path in (self.vectors_path, self.ids_path, self.ivf_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        self._version = None
+
+    # ------------------------------------------------------------------
+    # search
+    # ------------------------------------------------------------------
+    def _candidates(self, queries: np.ndarray, count: int, nprobe: int) -> Optional[np.ndarray]:
+        """Rows of the nprobe partitions closest to any of the queries, None for an exact search"""
+        if self._ivf is None or count < self.ivf_threshold:
+            return None
+        centroids, assignments, _ = self._ivf
+        assignments = assignments[:count]
+        probes = np.argsort(-(queries @ centroids.T), axis=1)[:, :nprobe]
+        rows = np.flatnonzero(np.isin(assignments, np.unique(probes)))
+        # rows added by another process that are not assigned yet are always searched
+        return np.concatenate([rows, np.arange(len(assignments), count)])
+
+    def search(self, queries, k: int = 10, nprobe: int = IVF_NPROBE) -> List[List[Tuple[Dict, float]]]:
+        """The k best (record, score) pairs for every query, best first"""
+        queries = normalize(queries)
+        vectors = self.vectors()
+        records = self._records
+        count = len(records)
+        if not count:
+            return [[] for _ in queries]
+        rows = self._candidates(queries, count, nprobe)
+        if rows is not None and len(rows) < k:
+            rows = None
+        total = count if rows is None else len(rows)
+        k = min(k, total)
+
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        for start in range(0, total, SEARCH_BLOCK_ROWS):
+            stop = min(start + SEARCH_BLOCK_ROWS, total)
+            if rows is None:
+                block_rows = np.arange(start, stop)
+                block = np.asarray(vectors[start:stop], dtype=np.float32)
+            else:
+                block_rows = rows[start:stop]
+                block = np.asarray(vectors[block_rows], dtype=np.float32)
+            scores = np.concatenate([best_scores, queries @ block.T], axis=1)
+            candidates = np.concatenate([best_rows, np.broadcast_to(block_rows, (len(queries), len(block_rows)))], axis=1)
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(scores, top, axis=1)
+            best_rows = np.take_along_axis(candidates, top, axis=1)
+
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        return [[(records[row], float(score)) for row, score in zip(query_rows, query_scores)]
+                for query_rows, query_scores in zip(best_rows, best_scores)]